@@ -0,0 +1,129 @@
+#!/nmr/programs/python/bin/python2.5
+"""
+AddSpinLinksFromStructure.py reads in a CARA repository and a PDB or mmCIF
+structure, and generates spin links in the repository between every pair of
+protons that are close enough in the structure to give an NOE.
+
+A whole ensemble may be given; a spinlink is added if the protons are within
+the cutoff in at least as many models as asked for with -m. Protons are
+found from the residue numbers and atom names of the structure; the protons
+of a methyl group share the spin of the group, so HG21, HG22 and HG23 are
+all HG2. Atoms with no spin are listed in the log.
+
+With -l, the spinlinks that are added are hidden in the spectra given with
+-x (every spectrum by default) where either proton is not a 1H in that
+labeling scheme, for example the side chains of a deuterated sample.
+
+Use AddSpinLinksFromStructure.py -h or AddSpinLinksFromStructure.py --help to learn more about inputs.
+
+WARNING: Residues are matched to the structure by residue number, and to
+their spins by their assigned spin system.
+"""
+
+### Import some libraries #################################################
+
+from optparse import OptionParser # for parsing commandline input
+from sys import stdout, stderr # for output to screen instead of to file
+from os.path import exists # for making sure not to overwrite files
+from caraRepository import CaraRepository # for reading and indexing the repository
+from caraProfile import Profiler # for the --profile option
+from caraOperations import addSpinLinksFromStructure, hideLabeledSpinLinks, schemeIsotopes # for turning close protons into spinlinks
+from caraRules import splitList # for the list of spectra
+from caraUpl import defaultWorkers # for the number of parallel searches
+
+### Main body of the script ###############################################
+
+def main():
+    parser = OptionParser() # creates an instance of the parser
+    parser.usage = "%prog -i input.cara -s structure.pdb [-o output.cara] [-p project-name] [-c cutoff] [-m models] [-l scheme [-x spectra]] [-j workers]"
+    parser.description = "%prog  reads in a CARA repository and a PDB or mmCIF structure, and generates spin links in the repository between protons that are close in the structure."
+    parser.epilog = ""
+    parser.add_option("-i", "--input", dest="infile",type="string",default=None,
+                      help="name of original CARA repository, required.", metavar="FILE")
+    parser.add_option("-o", "--output", dest="outfile",type="string",default=None,
+                      help="name of new CARA repository, defaults to stdout.", metavar="FILE")
+    parser.add_option("-p", "--project", metavar="NAME", dest="project", default=None,type="string",
+                      help="name of project to alter, if there is more than one project in the repository, defaults to the first project.")
+    parser.add_option("-s", "--structure", dest="structure",type="string",default=None,
+                      help="name of PDB or mmCIF (.cif) file, with one model or an ensemble, required.", metavar="FILE")
+    parser.add_option("-c", "--cutoff", dest="cutoff",type="float",default=5.0,
+                      help="largest distance between two protons, in Angstrom, defaults to %default.")
+    parser.add_option("-m", "--models", dest="models",type="int",default=1,
+                      help="number of models in which two protons must be within the cutoff, defaults to %default.")
+    parser.add_option("--chain", dest="chain",type="string",default=None,
+                      help="chain of the structure to use, defaults to all chains.")
+    parser.add_option("--offset", dest="offset",type="int",default=0,
+                      help="number added to the residue numbers of the structure to give those of the repository, defaults to %default.")
+    parser.add_option("--intraresidue", dest="intraresidue", action="store_true", default=False,
+                      help="also add spinlinks between protons of the same residue.")
+    parser.add_option("-l", "--scheme", dest="scheme",type="string",default=None,
+                      help="ID of a labeling scheme; new spinlinks to protons that are not 1H in it are hidden.")
+    parser.add_option("-x", "--hide", dest="spectra",type="string",default='0',
+                      help="spectra in which to hide spinlinks with -l, separated by commas, defaults to %default (every spectrum).")
+    parser.add_option("-j", "--jobs", dest="workers",type="int",default=None,
+                      help="number of models to search at once, defaults to the number of CPUs.")
+    parser.add_option("--profile", dest="profile", action="store_true", default=False,
+                      help="report the time and peak memory of each phase of the run, and the number of elements visited and modified, on stderr.")
+
+    # Now parse the command-line options
+    (options, args) = parser.parse_args()
+
+    infile = options.infile
+    outfile = options.outfile
+    projectName = options.project
+    profiler = Profiler(options.profile)
+    workers = options.workers or defaultWorkers()
+
+    if infile == None:
+        parser.print_help()
+        parser.error("Please specify an input cara file.")
+
+    if options.structure == None:
+        parser.print_help()
+        parser.error("Please specify a structure file.")
+
+    if options.cutoff <= 0:
+        parser.error("The cutoff must be larger than 0.")
+
+    try:
+        spectrumIDs = [int(spectrumID) for spectrumID in splitList(options.spectra)]
+    except ValueError:
+        parser.error("Spectra should be spectrum IDs separated by commas, not \"%s\"."%options.spectra)
+
+    if outfile == None:
+        outfile = stdout
+        log = stderr
+    elif exists(outfile):
+        print '\nOutput file \'%s\' exists. Choose a new name to avoid overwriting.\n'%outfile
+        return
+    else:
+        log = stdout
+
+    # Now that we have an input file and we know where to send the output, we parse the xml,
+    # selecting a project according to command-line input, defaulting to the first project.
+
+    repository = CaraRepository(infile,projectName,profiler=profiler)
+    profiler.switch('transform')
+
+    if options.scheme != None:
+        try:
+            schemeIsotopes(repository,options.scheme)
+        except ValueError, e:
+            parser.error(str(e))
+
+    # Find close protons and add the spinlinks between them, reporting what
+    # was added, already there, or could not be matched to a spin
+
+    newpairs = addSpinLinksFromStructure(repository,options.structure,options.cutoff,options.models,
+                                         options.chain,options.offset,options.intraresidue,log,workers)
+
+    if options.scheme != None:
+        numHidden = hideLabeledSpinLinks(repository,newpairs,options.scheme,spectrumIDs)
+        print >>log, 'Hid %d of %d new spinlinks in spectra %s for labeling scheme %s.'%(
+            numHidden,len(newpairs),', '.join([str(spectrumID) for spectrumID in spectrumIDs]),options.scheme)
+
+    repository.write(outfile)
+    profiler.report()
+
+if __name__ == '__main__':
+    main()
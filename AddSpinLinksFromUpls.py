@@ -1,6 +1,9 @@
 #!/nmr/programs/python/bin/python2.5
 """
-AddSpinLinksFromUpls.py reads in a CARA repository and a UPL list, and generates spin links in the repository based on the UPL list.
+AddSpinLinksFromUpls.py reads in a CARA repository and one or more UPL lists, and generates spin links in the repository based on the UPL lists.
+
+Several UPL files, or directories of them, may be given; they are read in
+parallel and each restraint is added once.
 
 Use AddSpinLinksFromUpls.py -h or AddSpinLinksFromUpls.py --help to learn more about inputs.
 
@@ -12,28 +15,19 @@ NumberCaraSystemsByAssignment.py
 ### Import some libraries #################################################
 
 from optparse import OptionParser # for parsing commandline input
-from sys import stdout # for output to screen instead of to file
-import xml.etree.ElementTree as ET # for parsing XML
+from sys import stdout, stderr # for output to screen instead of to file
 from os.path import exists # for making sure not to overwrite files
-
-### Helper functions ######################################################
-
-def getProject(projectName,projects):
-    """This function, getProject, is only used if the user specifies a project
-    name from the command line, rather than simply allowing the script to
-    select the first (and likely only) project in a repository."""
-    for project in projects:
-        if project.get('name') == projectName:
-            return project
-    # if that doesn't work, raise an error: 
-    raise NameError,"There is no project named \"%s\"."%projectName
+from caraRepository import CaraRepository # for reading and indexing the repository
+from caraProfile import Profiler # for the --profile option
+from caraOperations import addSpinLinksFromUpl # for turning UPLs into spinlinks
+from caraUpl import defaultWorkers # for the number of parallel readers
 
 ### Main body of the script ###############################################
 
 def main():
     parser = OptionParser() # creates an instance of the parser
-    parser.usage = "%prog -i input.cara -u uplfile.upl [-o output.cara] [-p project-name]"
-    parser.description = "%prog  reads in a CARA repository and a UPL list, and generates spin links in the repository based on the UPL list."
+    parser.usage = "%prog -i input.cara -u uplfile.upl [-u uplfile.upl ...] [-o output.cara] [-p project-name] [-j workers]"
+    parser.description = "%prog  reads in a CARA repository and one or more UPL lists, and generates spin links in the repository based on the UPL lists."
     parser.epilog = ""
     parser.add_option("-i", "--input", dest="infile",type="string",default=None,
                       help="name of original CARA repository, required.", metavar="FILE")
@@ -41,8 +35,12 @@ def main():
                       help="name of new CARA repository, defaults to stdout.", metavar="FILE")
     parser.add_option("-p", "--project", metavar="NAME", dest="project", default=None,type="string",
                       help="name of project to alter, if there is more than one project in the repository, defaults to the first project.")
-    parser.add_option("-u", "--upl", dest="uplfile",type="string",default=None,
-                      help="name of upl file, required.", metavar="FILE")
+    parser.add_option("-u", "--upl", dest="uplfiles",type="string",action="append",default=[],
+                      help="name of upl file, or of a directory of .upl files, required; may be given more than once.", metavar="FILE")
+    parser.add_option("-j", "--jobs", dest="workers",type="int",default=None,
+                      help="number of upl files to read at once, defaults to the number of CPUs.")
+    parser.add_option("--profile", dest="profile", action="store_true", default=False,
+                      help="Report the time and peak memory of each phase of the run, and the number of elements visited and modified, on stderr.")
 
     # Now parse the command-line options
     (options, args) = parser.parse_args()
@@ -50,106 +48,39 @@ def main():
     infile = options.infile
     outfile = options.outfile
     projectName = options.project
-    uplfile = options.uplfile
+    profiler = Profiler(options.profile)
+    uplfiles = options.uplfiles
+    workers = options.workers or defaultWorkers()
 
     if infile == None:
         parser.print_help()
         parser.error("Please specify an input cara file.")
 
-    if uplfile == None:
+    if not uplfiles:
         parser.print_help()
         parser.error("Please specify an input upl file.")
     
     if outfile == None:
         outfile = stdout
+        log = stderr
     elif exists(outfile):
         print '\nOutput file \'%s\' exists. Choose a new name to avoid overwriting.\n'%outfile
         return
-    # Now that we have an input file and we know where to send the output, we parse the xml.
+    else:
+        log = stdout
+    # Now that we have an input file and we know where to send the output, we parse the xml,
+    # selecting a project according to command-line input, defaulting to the first project.
 
-    tree = ET.parse(infile)
-    root = tree.getroot() #retrieves the whole repository
-    projects = root.findall('project') #retrieves every project in the repository
+    repository = CaraRepository(infile,projectName,profiler=profiler)
+    profiler.switch('transform')
 
-# Select a project according to command-line input, defaulting to the first project
+    # Read UPLs and add the spinlinks they describe, reporting what was
+    # added, already there, or could not be matched to a spin
 
-    if projectName:
-        project = getProject(projectName,projects)
-        if not project:
-            print 'No project found with name \"%s\".'%projectName
-            return
-    else:
-        project = projects[0]
-        if not project:
-            print 'No project found.'
-            return
-
-    spinbase = project.find('spinbase')
-    spins = spinbase.findall('spin')
-    pairs = spinbase.findall('pair')
-    spindict = {}
-    getSpinID = {}
-    pairList = []
-
-    for spin in spins:
-        atom = spin.get('atom')
-        offset = spin.get('off')
-        if atom == 'H1':
-            spinid = spin.get('id')
-            try:
-                system = int(spin.get('sys'))
-                tag = spin.get('tag')
-                spindict[spinid] = {'tag': tag, 'sys': system}
-                getSpinID[(system,tag)]=spinid
-            except Exception, e:
-                print "Orphan spin: ",e
-
-    # Lists of pairs:
-
-    for pair in pairs:
-        lhs = pair.get('lhs')
-        rhs = pair.get('rhs')
-        if int(lhs) < int(rhs):
-            pairList.append((lhs,rhs))
-        else:
-            pairList.append((rhs,lhs))
-
-    # Read UPLs
-
-    openfile= open(uplfile,'r')
-    upllines = openfile.readlines()
-    openfile.close()
-
-    for line in upllines:
-        if line[0] != '#':
-            try:
-                columns = line.split()
-                leftsys = int(columns[0])
-                lefttag = columns[2]
-                rightsys = int(columns[3])
-                righttag = columns[5]
-                if leftsys != rightsys:
-                    lhs = getSpinID[(leftsys,lefttag)]
-                    rhs = getSpinID[(rightsys,righttag)]
-                    if int(lhs) < int(rhs) and (lhs,rhs) not in pairList:
-                        newpair = ET.Element("pair")
-                        newpair.attrib['lhs']=lhs
-                        newpair.attrib['rhs']=rhs
-                        pairList.append((lhs,rhs))
-                        spinbase.append(newpair)
-                        #spinbase.append(Element("pair",'lhs'=lhs,'rhs'=rhs)
-                    elif int(rhs) < int(lhs) and (rhs,lhs) not in pairList:
-                        newpair = ET.Element("pair")
-                        newpair.attrib['lhs']=rhs
-                        newpair.attrib['rhs']=lhs
-                        spinbase.append(newpair)
-                        #spinbase.append(Element("pair",'lhs'=rhs,'rhs'=lhs))
-                        pairList.append((rhs,lhs))
-            except Exception, e:
-                print "Bad upl line: ",line           
-
-
-    tree.write(outfile)
+    addSpinLinksFromUpl(repository,uplfiles,log,workers)
+
+    repository.write(outfile)
+    profiler.report()
 
 #    for string in printstrings:
 #        print string
@@ -7,12 +7,14 @@ A labeling scheme called 'unlabeled' is added for this purpose.
 
 import sys
 sys.path.append('/nmr/programs/python/')
-import xml.etree.ElementTree as ET
-from xml.etree.ElementTree import Element, SubElement
+from caraRepository import CaraRepository
+from caraOperations import addUnlabeledScheme
+from caraProfile import profilerFromArgv
 import string
 from os.path import exists, isfile
 
 def main():
+    profiler = profilerFromArgv(sys.argv)
     if len(sys.argv) not in [3,4]:
         print '==============================================================================='
         print 'AddUnlabeledSchemeToResidueType.py reads in a cara repository file and modifies'
@@ -23,6 +25,7 @@ def main():
         print 'Number of arguments given: %d'%(len(sys.argv)-1)
         print 'An optional third argument names which project to modify, if'
         print 'there is more than one project in a repository. '
+        print 'Add --profile to report the time and memory used by each phase of the run.'
         print '=============================================================================='
         return
 
@@ -34,55 +37,20 @@ def main():
         return
 
 
-    tree = ET.parse(infile)
-    root = tree.getroot()
-    projects = root.findall('project')
-
 # Select a project according to command-line input, defaulting to the first project
 
     if len(sys.argv) == 4:
         projectName = sys.argv[3]
-        project = getProject(projectName,projects)
-        if not project:
-            print 'No project found with name \"%s\".'%projectName
-            return
     else:
-        project = projects[0]
-        if not project:
-            print 'No project found.'
-            return
-
-# Find existing schemes & make a new one by incrementing the highest existing ID number
+        projectName = None
+    repository = CaraRepository(infile,projectName,profiler=profiler)
+    profiler.switch('transform')
 
-    library = root.find('library')
-    schemes = library.findall('scheme')
-    numSchemes = len(schemes)
-    if numSchemes > 0:
-        schemeIDs = [int(scheme.get('id')) for scheme in schemes]
-        schemeIDs.sort()
-        newIDnum = schemeIDs[numSchemes-1]+1
-        newID = '%d'%newIDnum
-    else:
-        newID = '1'
-    newscheme = SubElement(library,'scheme')
-    newscheme.attrib['id'] = newID
-    newscheme.attrib['name'] = 'unlabeled%s'%newID
+# Add a new scheme with an ID one higher than the highest existing one
 
-# Modify residue-type
+    addUnlabeledScheme(repository)
 
-    residueTypes = library.findall('residue-type')
-    for residueType in residueTypes:
-        atoms = residueType.findall('atom')
-        for atom in atoms:
-            if atom.get('name')[0]=='N':
-                newscheme = SubElement(atom,'scheme')
-                newscheme.attrib['id'] = newID
-                newscheme.attrib['type'] = 'N14'
-            elif atom.get('name')[0]=='C':
-                newscheme = SubElement(atom,'scheme')
-                newscheme.attrib['id'] = newID
-                newscheme.attrib['type'] = 'C12'
-                
-    tree.write(outfile)
+    repository.write(outfile)
+    profiler.report()
     
 main()
@@ -13,39 +13,17 @@ from optparse import OptionParser
 # so we need to import stdout from the sys module
 from sys import stdout
 
-# Import ElementTree for parsing XML
-import xml.etree.ElementTree as ET
-
 # This is just for checking to make sure you don't accidentally overwrite files.
 from os.path import exists
 
-### Helper functions ######################################################
-
-def makeSequenceDictionary(project):
-    """ This function, makeSequenceDictionary, reads the existing sequence to
-    create a lookup table (aka dictionary) to convert the old ID to the new
-    sequence number.
-    As long as we are going through residue list, we will also set the residue
-    IDs to the new values."""
-    sequence = project.find('sequence')
-    residues = sequence.findall('residue')
-    sequenceDictionary = {} # create the dictionary
-    for residue in residues: # populate the dictionary and fix residue IDs
-        realAssignment = residue.get('nr')
-        caraAssignment = residue.get('id')
-        sequenceDictionary[caraAssignment] = realAssignment # create dictionary entry
-        residue.set('id',realAssignment) # change the residue ID
-    return sequenceDictionary
-
-def getProject(projectName,projects):
-    """This function, getProject, is only used if the user specifies a project
-    name from the command line, rather than simply allowing the script to
-    select the first (and likely only) project in a repository."""
-    for project in projects:
-        if project.get('name') == projectName:
-            return project
-    # if that doesn't work, raise an error: 
-    raise NameError,"There is no project named \"%s\"."%projectName
+# CaraRepository reads the repository and indexes the selected project
+from caraRepository import CaraRepository
+
+# modifyResidueIDs does the actual renumbering
+from caraOperations import modifyResidueIDs
+
+# Profiler times the phases of the run for the --profile option
+from caraProfile import Profiler
 
 ### Main body of the script ###############################################
 
@@ -77,12 +55,15 @@ def main():
                       help="name of original CARA repository, required", metavar="FILE")
     parser.add_option("-p", "--project", metavar="NAME", dest="project", default=None,type="string",
                       help="name of project to alter, if there is more than one project in the repository, defaults to the first project")
+    parser.add_option("--profile", dest="profile", action="store_true", default=False,
+                      help="report the time and peak memory of each phase of the run, and the number of elements visited and modified, on stderr")
 
     # Now parse the command-line options
     (options, args) = parser.parse_args()
     infile = options.infile
     outfile = options.outfile
     projectName = options.project
+    profiler = Profiler(options.profile)
 
     if infile == None:
         parser.print_help()
@@ -94,44 +75,20 @@ def main():
         print '\nOutput file \'%s\' exists. Choose a new name to avoid overwriting.\n'%outfile
         return
 
-    # Now that we have an input file and we know where to send the output, we parse the xml.
-
-    tree = ET.parse(infile)
-    root = tree.getroot() #retrieves the whole repository
-    projects = root.findall('project') #retrieves every project in the repository
-
-# Select a project according to command-line input, defaulting to the first project
-
-    if projectName:
-        project = getProject(projectName,projects)
-        if not project:
-            print 'No project found with name \"%s\".'%projectName
-            return
-    else:
-        project = projects[0]
-        if not project:
-            print 'No project found.'
-            return
-
-# Fix residue ids in the sequence
-
-    sequenceDictionary = makeSequenceDictionary(project)
-
+    # Now that we have an input file and we know where to send the output, we parse the xml,
+    # selecting a project according to command-line input, defaulting to the first project.
 
+    repository = CaraRepository(infile,projectName,profiler=profiler)
+    profiler.switch('transform')
 
-# Convert system assignments
+# Fix residue ids in the sequence, and convert system assignments to match
 
-    spinbase = project.find('spinbase')
-    spinsystems = spinbase.findall('spinsys')
-    for spinsystem in spinsystems:
-        oldAssignment = spinsystem.get('ass')
-        if oldAssignment:
-            newAssignment = sequenceDictionary[oldAssignment]
-            spinsystem.set('ass',newAssignment)
+    modifyResidueIDs(repository)
 
 # Write out the modified xml tree
 
-    tree.write(outfile)
+    repository.write(outfile)
+    profiler.report()
 
 # Execute everything
 main()
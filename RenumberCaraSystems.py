@@ -5,60 +5,41 @@ RenumberCaraSystems.py takes a cara repository file and renumbers the spin syste
 run in order with no gaps. By default, the spin system numbers start with 1.
 Future plans may include an option to start at another number.
 
-Note that RenumberCaraSystems.py only alters the first project in a repository, and does not alter tags in peaklists.
+Note that RenumberCaraSystems.py only alters the first project in a repository.
+Peaklists are updated to match (see caraRemap.py for the format assumed).
 """
 import sys
 sys.path.append('/nmr/programs/python/')
-import xml.etree.ElementTree as ET
+from caraRemap import remapRepository, inOrder
+from caraProfile import profilerFromArgv
 
 def main():
+    profiler = profilerFromArgv(sys.argv)
     if len(sys.argv) != 3:
         print '=============================================================================='
         print 'RenumberCaraSystems.py renumbers the spin systems in a cara repository so that they begin at 1 and there are no gaps.'
-        print 'Note that RenumberCaraSystems.py only alters the first project in a repository, and does not alter tags in peaklists.'
+        print 'Note that RenumberCaraSystems.py only alters the first project in a repository. Peaklists are updated to match.'
         print ''
         print 'Usage: RenumberCaraSystems.py infile.cara outfile.cara'
         print 'Number of arguments given: %d'%(len(sys.argv)-1)
+        print 'Add --profile to report the time and memory used by each phase of the run.'
         print '=============================================================================='
         return
     infile = sys.argv[1]
     outfile = sys.argv[2]
 
-    syscounter = 0
-    sysdict = {}
+    # Number the systems in order, and change the spins, links and peaks
+    # that refer to them, in one copy of the file (see caraRemap.py)
 
-    tree = ET.parse(infile)
-    root = tree.getroot()
-
-    firstproject = root.find('project')
-    spinbase = firstproject.find('spinbase')
-    spinsystems = spinbase.findall('spinsys')
-
-    for spinsystem in spinsystems:
-        syscounter = syscounter + 1
-        oldid = spinsystem.get('id')
-        sysdict[oldid] = '%d'%syscounter
-        spinsystem.set('id',sysdict[oldid])
-    print '%d systems found.'%syscounter
-
-    links = spinbase.findall('link')
-    
-    for link in links:
-        oldpred = link.get('pred')
-        oldsucc = link.get('succ')
-        link.set('pred',sysdict[oldpred])
-        link.set('succ',sysdict[oldsucc])
-
-    spins = spinbase.findall('spin')
-
-    for spin in spins:
-        oldsys = spin.get('sys')
-        if oldsys:
-            spin.set('sys',sysdict[oldsys])
-        else:
-            print 'Warning: spin %s has no parent system. The parent system was probably deleted.'%spin.get('id')
-            print spin.items()
-            # note that the offending spin could be removed. 
-    tree.write(outfile)
+    profiler.switch('stream')
+    try:
+        catalog, counts = remapRepository(infile,outfile,{'system': inOrder(1)})
+    except (NameError, ValueError), e:
+        print '\n%s Try again.\n'%e
+        return
+    print '%d systems found.'%catalog.count('system')
+    print 'Changed %d peaklist elements.'%counts['peak']
+    profiler.count(catalog.count('system'),counts['system'])
+    profiler.report()
 
 main()
@@ -0,0 +1,110 @@
+#!/nmr/programs/python/bin/python2.5
+"""
+WriteRestraintsFromSpinLinks.py reads in a CARA repository and writes a
+distance restraint for every spinlink, as a CYANA UPL file or as XPLOR/CNS
+assign statements. It is the way back from AddSpinLinksFromUpls.py: the UPL
+it writes can be read in again with that script.
+
+With -s, only spinlinks that are visible in at least one of the given
+spectra are written. Each spinlink is written once, and spinlinks with a
+spin that is not an assigned proton are left out and counted.
+
+Use WriteRestraintsFromSpinLinks.py -h or WriteRestraintsFromSpinLinks.py --help to learn more about inputs.
+
+WARNING: Residues are written with their residue numbers and protons with
+their CARA tags, so methyl groups appear under the name of the group, such
+as HG2 for HG21, HG22 and HG23.
+"""
+
+### Import some libraries #################################################
+
+from optparse import OptionParser # for parsing commandline input
+from sys import stdout, stderr # for output to screen instead of to file
+from os.path import exists # for making sure not to overwrite files
+from caraRepository import CaraRepository # for reading and indexing the repository
+from caraProfile import Profiler # for the --profile option
+from caraOperations import writeRestraints # for turning spinlinks into restraints
+from caraRules import splitList # for the list of spectra
+from caraUpl import RESTRAINT_FORMATS # for the choice of formats
+
+### Data Definitions ######################################################
+
+# restraint is a line of the output for one spinlink
+#   Here is a spinlink:
+#   <pair lhs='37' rhs='1979'>
+#   <inst spec='174' rate='0.000000' code='0' visi='1'/>
+#   </pair>
+#   as a UPL line:
+#       3 HIS  HA       27 LEU  HD1      5.00
+#   and as an XPLOR/CNS assign statement:
+#   assign (resid    3 and name HA   ) (resid   27 and name HD1  )   1.80   0.00   3.20
+
+### Main body of the script ###############################################
+
+def main():
+    formats = RESTRAINT_FORMATS.keys()
+    formats.sort()
+    parser = OptionParser() # creates an instance of the parser
+    parser.usage = "%prog -i input.cara [-o restraints.upl] [-p project-name] [-f format] [-s spectra] [-u upper] [-l lower]"
+    parser.description = "%prog  reads in a CARA repository and writes a distance restraint for every spinlink, or for every spinlink visible in the given spectra."
+    parser.epilog = "Formats: %s."%', '.join(formats)
+    parser.add_option("-i", "--input", dest="infile",type="string",default=None,
+                      help="name of CARA repository, required.", metavar="FILE")
+    parser.add_option("-o", "--output", dest="outfile",type="string",default=None,
+                      help="name of restraint file, defaults to stdout.", metavar="FILE")
+    parser.add_option("-p", "--project", metavar="NAME", dest="project", default=None,type="string",
+                      help="name of project to read, if there is more than one project in the repository, defaults to the first project.")
+    parser.add_option("-f", "--format", dest="format",type="choice",choices=formats,default='upl',
+                      help="format of the restraints, defaults to %default.")
+    parser.add_option("-s", "--spectra", dest="spectra",type="string",default='',
+                      help="only write spinlinks visible in one of these spectra, separated by commas; defaults to every spinlink.")
+    parser.add_option("-u", "--upper", dest="upper",type="float",default=5.0,
+                      help="upper distance bound, in Angstrom, defaults to %default.")
+    parser.add_option("-l", "--lower", dest="lower",type="float",default=1.8,
+                      help="lower distance bound for xplor, in Angstrom, defaults to %default.")
+    parser.add_option("--profile", dest="profile", action="store_true", default=False,
+                      help="report the time and peak memory of each phase of the run, and the number of elements visited and modified, on stderr.")
+
+    # Now parse the command-line options
+    (options, args) = parser.parse_args()
+
+    infile = options.infile
+    outfile = options.outfile
+    projectName = options.project
+    profiler = Profiler(options.profile)
+
+    if infile == None:
+        parser.print_help()
+        parser.error("Please specify an input cara file.")
+
+    if options.lower > options.upper:
+        parser.error("The lower bound must not be larger than the upper bound.")
+
+    try:
+        spectrumIDs = [int(spectrumID) for spectrumID in splitList(options.spectra)]
+    except ValueError:
+        parser.error("Spectra should be spectrum IDs separated by commas, not \"%s\"."%options.spectra)
+
+    if outfile == None:
+        outfile = stdout
+        log = stderr
+    elif exists(outfile):
+        print '\nOutput file \'%s\' exists. Choose a new name to avoid overwriting.\n'%outfile
+        return
+    else:
+        log = stdout
+
+    # Now that we have an input file and we know where to send the output, we parse the xml,
+    # selecting a project according to command-line input, defaulting to the first project.
+
+    repository = CaraRepository(infile,projectName,profiler=profiler)
+    profiler.switch('transform')
+
+    counts = writeRestraints(repository,outfile,options.format,spectrumIDs,options.upper,options.lower)
+    print >>log, '%d spinlinks: %d restraints written, %d hidden, %d duplicate, %d unresolved.'%(
+        counts['pairs'],counts['written'],counts['hidden'],counts['duplicate'],counts['unresolved'])
+
+    profiler.report()
+
+if __name__ == '__main__':
+    main()
@@ -4,15 +4,18 @@ add10000toSpinIDsWithPairs.py takes a cara repository file and renumbers the
 spectrum IDs by adding 10000 to each ID.
 Spin IDs are also renumbered in pairs, aka NOEs.
 
-Note that add10000toSpinIDswithPairs.py only alters the first project in a repository, and does not alter tags in peaklists.
+Note that add10000toSpinIDswithPairs.py only alters the first project in a repository.
+Peaklists are updated to match (see caraRemap.py for the format assumed).
 """
 import sys
 sys.path.append('/nmr/programs/python/')
-import xml.etree.ElementTree as ET
+from caraRemap import remapRepository, offsetIDs
+from caraProfile import profilerFromArgv
 
 # Main
     
 def main():
+    profiler = profilerFromArgv(sys.argv)
     if len(sys.argv) not in [3,4]:
         print '=============================================================================='
         print 'add1000toSpinIDsWithPairs.py renumbers the spin IDs in a cara'
@@ -26,6 +29,7 @@ def main():
         print 'Number of arguments given: %d'%(len(sys.argv)-1)
         print 'An optional third argument (integer) indicates which project to modify, if'
         print 'there is more than one project in a repository. '
+        print 'Add --profile to report the time and memory used by each phase of the run.'
         print '=============================================================================='
         return
 
@@ -36,9 +40,6 @@ def main():
         print '\nPlease do not overwrite your original file. Try again.\n'
         return
 
-    tree = ET.parse(infile)
-    root = tree.getroot()
-
 # Select a project, the first one by default.
 
     if len(sys.argv) == 4:
@@ -49,44 +50,20 @@ def main():
     else:
         numProject = 0
 
-    projects = root.findall('project')
+# Add 10000 to spin IDs and to the spin IDs of pairs and peaks. Only these
+# attributes change, so they are spliced into a copy of the file by
+# caraRemap.py instead of parsing and rewriting the whole repository.
+
+    profiler.switch('stream')
     try:
-        project = projects[numProject]
-        print 'Modifying project #%d, %s.'%(numProject + 1,project.get('name'))
-    except:
-        print '\nYou requested project number %d, but there are only %d projects in this repository. Try again.\n'%(numProject + 1, len(projects))
+        catalog, counts = remapRepository(infile,outfile,{'spin': offsetIDs(10000)},projectNumber=numProject)
+    except (NameError, ValueError), e:
+        print '\n%s Try again.\n'%e
         return
-
-
-
-# Find all spins and fix IDs
-
-    spinbase = project.find('spinbase')
-    spins = spinbase.findall('spin')
-    print 'There are %d total spins.'%len(spins)
-    for spin in spins:
-        origID = int(spin.get('id'))
-        newID = origID + 10000
-        spin.set('id','%d'%newID)        
-
-# Find all pairs and fix spin IDs
-
-    pairs = spinbase.findall('pair')
-    print 'There are %d total pairs.'%len(pairs)
-    for pair in pairs:
-        lhs = pair.get('lhs')
-        newLHS = int(lhs) + 10000
-        pair.set('lhs','%d'%newLHS)
-        rhs = pair.get('rhs')
-        newRHS = int(rhs) + 10000
-        pair.set('rhs','%d'%newRHS)
-    
-    tree.write(outfile)    
+    profiler.count(catalog.count('spin'),counts['spin'])
+    print 'Modified project #%d, %s.'%(numProject + 1,catalog.project)
+    print 'There are %d total spins.'%catalog.count('spin')
+    print 'Changed %d spin IDs in spins, pairs and peak assignments.'%counts['spin']
+    profiler.report()
 
 main()
-
-# Testing:
-
-#print 'HEAT-2: %d'%locateStartOfUnassignedResidues(1219,1437,219)
-#print '4afl: %d'%locateStartOfUnassignedResidues(1,500,719)
-#print 'weird: %d'%locateStartOfUnassignedResidues(500,1050,719)
@@ -2,22 +2,25 @@
 """
 add1000toSpectrumIDsWithAliases.py takes a cara repository file and renumbers the 
 spectrum IDs by adding 1000 to each ID.
-Spectrum assignments for aliases are also renumbered. 
+Spectrum assignments for aliases and spinlink visibility are also renumbered.
 
-Note that add1000toSpectrumIDsWithAliases.py only alters the first project in a repository, and does not alter tags in peaklists.
+Note that add1000toSpectrumIDsWithAliases.py only alters the first project in a repository.
+Peaklists are updated to match (see caraRemap.py for the format assumed).
 """
 import sys
 sys.path.append('/nmr/programs/python/')
-import xml.etree.ElementTree as ET
+from caraRemap import remapRepository, offsetIDs
+from caraProfile import profilerFromArgv
 
 # Main
     
 def main():
+    profiler = profilerFromArgv(sys.argv)
     if len(sys.argv) not in [3,4]:
         print '=============================================================================='
         print 'add1000toSpectrumIDsWithAliases.py renumbers the spectrum IDs in a cara'
         print 'repository by adding 1000 to each ID.'
-        print 'Spectrum assignments for aliases are also renumbered.'
+        print 'Spectrum assignments for aliases and spinlinks are also renumbered.'
         print ''
         print 'Note that add1000toSpectrumIDsWithAliases.py only alters the first project in a'
         print 'repository by default.'
@@ -26,6 +29,7 @@ def main():
         print 'Number of arguments given: %d'%(len(sys.argv)-1)
         print 'An optional third argument (integer) indicates which project to modify, if'
         print 'there is more than one project in a repository. '
+        print 'Add --profile to report the time and memory used by each phase of the run.'
         print '=============================================================================='
         return
 
@@ -36,9 +40,6 @@ def main():
         print '\nPlease do not overwrite your original file. Try again.\n'
         return
 
-    tree = ET.parse(infile)
-    root = tree.getroot()
-
 # Select a project, the first one by default.
 
     if len(sys.argv) == 4:
@@ -49,44 +50,21 @@ def main():
     else:
         numProject = 0
 
-    projects = root.findall('project')
+# Add 1000 to spectrum IDs and to the spectra of aliases, of spinlink
+# visibility and of peaklists. Only these attributes change, so they are
+# spliced into a copy of the file by caraRemap.py instead of parsing and
+# rewriting the whole repository.
+
+    profiler.switch('stream')
     try:
-        project = projects[numProject]
-        print 'Modifying project #%d, %s.'%(numProject + 1,project.get('name'))
-    except:
-        print '\nYou requested project number %d, but there are only %d projects in this repository. Try again.\n'%(numProject + 1, len(projects))
+        catalog, counts = remapRepository(infile,outfile,{'spectrum': offsetIDs(1000)},projectNumber=numProject)
+    except (NameError, ValueError), e:
+        print '\n%s Try again.\n'%e
         return
-
-# Read & count spectra
-
-    spectra = project.findall('spectrum')
-    print 'There are %d total spectra.'%len(spectra)
-
-    for spectrum in spectra:
-        origID = int(spectrum.get('id'))
-        newID = origID + 1000
-        spectrum.set('id','%d'%newID)
-
-# Find all spins and fix aliases
-
-    spinbase = project.find('spinbase')
-    spins = spinbase.findall('spin')
-
-    for spin in spins:
-        positions = spin.findall('pos')
-        for position in positions:
-            spectrum = position.get('spec')
-            if spectrum != '0':
-                origID = int(spectrum)
-                newID = origID + 1000
-                position.set('spec','%d'%newID)
-    
-    tree.write(outfile)    
+    profiler.count(catalog.count('spectrum'),counts['spectrum'])
+    print 'Modified project #%d, %s.'%(numProject + 1,catalog.project)
+    print 'There are %d total spectra.'%catalog.count('spectrum')
+    print 'Changed %d spectrum IDs in spectra, aliases, spinlinks and peaklists.'%counts['spectrum']
+    profiler.report()
 
 main()
-
-# Testing:
-
-#print 'HEAT-2: %d'%locateStartOfUnassignedResidues(1219,1437,219)
-#print '4afl: %d'%locateStartOfUnassignedResidues(1,500,719)
-#print 'weird: %d'%locateStartOfUnassignedResidues(500,1050,719)
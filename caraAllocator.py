@@ -0,0 +1,147 @@
+"""
+caraAllocator.py finds free IDs, such as a block of spin system numbers
+for the unassigned systems that does not collide with any residue number.
+
+The occupied IDs are kept as a sorted list of disjoint intervals, and the
+gaps between them in a segment tree that holds, for each range of gaps,
+the largest block that fits in one of them, starting 1 above a multiple of
+the allocator's alignment. The lowest gap that can hold a block of a given
+size is found by one walk down the tree, and handing out the block
+shortens that gap and updates the tree along one path back up, so that
+allocate() is O(log n) for n intervals, however long the sequence and
+however the numbering is split between domains. Building the allocator,
+and occupy() for IDs taken some other way, cost O(n log n).
+
+A typical use, numbering 150 unassigned systems in a block that starts at 1
+or just above a multiple of 1000:
+
+allocator = IDAllocator(residueNumbers, align=1000)
+start = allocator.allocate(150)
+"""
+
+### Data Definitions ######################################################
+
+# An interval is a tuple (first, last) of occupied IDs, both included.
+# A gap is a tuple (first, last) of free IDs, both included; the last gap
+# runs to UNBOUNDED.
+
+UNBOUNDED = 2**62
+
+### Helper functions ######################################################
+
+def mergeIntervals(spans):
+    """
+    mergeIntervals: list of intervals -> list of intervals
+    returns the sorted, disjoint intervals covering the same IDs, joining
+    those that overlap or touch.
+    """
+    spans = list(spans)
+    spans.sort()
+    result = []
+    for first, last in spans:
+        if result and first <= result[-1][1] + 1:
+            if last > result[-1][1]:
+                result[-1] = (result[-1][0], last)
+        else:
+            result.append((first, last))
+    return result
+
+def intervals(ids):
+    """intervals: iterable of ints -> list of intervals, covering the IDs."""
+    return mergeIntervals([(id, id) for id in ids])
+
+def alignedStart(first, align):
+    """
+    alignedStart: int, int -> int
+    returns the lowest ID from first on that is 1 more than a multiple of
+    align, as 1, 1001, 2001 for align 1000.
+    """
+    if align <= 1:
+        return first
+    return ((first - 1 + align - 1)//align)*align + 1
+
+### Allocator #############################################################
+
+class IDAllocator(object):
+    """
+    IDAllocator holds the occupied IDs from minimum up as sorted intervals,
+    and hands out free blocks of IDs, lowest first, each starting 1 above a
+    multiple of align.
+    """
+
+    def __init__(self, occupied=(), minimum=1, align=1):
+        self.minimum = minimum
+        self.align = align
+        self.intervals = intervals([id for id in occupied if id >= minimum])
+        self.rebuild()
+
+    def capacity(self, gap):
+        """capacity: gap -> int, the length of the longest aligned block in the gap."""
+        first, last = gap
+        return max(last - alignedStart(first, self.align) + 1, 0)
+
+    def rebuild(self):
+        """Recompute the gaps between the intervals, and the tree over them."""
+        gaps = []
+        first = self.minimum
+        for start, end in self.intervals:
+            if start > first:
+                gaps.append((first, start - 1))
+            first = end + 1
+        gaps.append((first, UNBOUNDED))
+        self.gaps = gaps
+        size = 1
+        while size < len(gaps):
+            size = size*2
+        self.size = size
+        self.tree = [0]*(2*size) # tree[size+i] is the capacity of gap i, tree[j] the largest below j
+        for i in range(len(gaps)):
+            self.tree[size + i] = self.capacity(gaps[i])
+        for j in range(size - 1, 0, -1):
+            self.tree[j] = max(self.tree[2*j], self.tree[2*j + 1])
+
+    def lowestGap(self, length):
+        """
+        lowestGap: int -> int
+        returns the position of the lowest gap that holds an aligned block
+        of at least length IDs, walking down the tree once.
+        """
+        tree = self.tree
+        node = 1
+        while node < self.size:
+            if tree[2*node] >= length:
+                node = 2*node
+            else:
+                node = 2*node + 1
+        return node - self.size
+
+    def allocate(self, count):
+        """
+        allocate: int -> int
+        finds the lowest aligned block of count free IDs, marks it as
+        occupied and returns its first ID, in O(log n). The free IDs below
+        the block in its gap, if any, cannot start an aligned block and are
+        left out of the gap.
+        """
+        count = max(count, 1)
+        position = self.lowestGap(count)
+        first, last = self.gaps[position]
+        start = alignedStart(first, self.align)
+        self.intervals.append((start, start + count - 1)) # sorted again by occupy()
+        self.gaps[position] = (start + count, last)
+        node = self.size + position
+        self.tree[node] = self.capacity(self.gaps[position])
+        node = node//2
+        while node:
+            self.tree[node] = max(self.tree[2*node], self.tree[2*node + 1])
+            node = node//2
+        return start
+
+    def occupy(self, start, count):
+        """
+        occupy: int, int -> void
+        marks count IDs from start as occupied, and rebuilds the gaps and
+        the tree, in O(n log n).
+        """
+        self.intervals = mergeIntervals(self.intervals + [(start, start + count - 1)])
+        self.rebuild()
@@ -0,0 +1,277 @@
+#!/nmr/programs/python/bin/python2.5
+"""
+caraBatch.py applies the same steps to many CARA repositories, running
+several repositories at once in a pool of worker processes. The steps are
+those of caraPipeline.py, so each repository is parsed and written once
+whatever the number of steps.
+
+The repositories are given as glob patterns, as a manifest file listing one
+repository per line, or both. For each one, the result is written to the
+output directory under the same file name, along with a .log file holding
+what the steps printed. Repositories whose output already exists are
+skipped, so a batch that was interrupted can simply be run again. A summary
+of every repository is printed at the end, and can also be written to a
+report file.
+
+For example
+
+caraBatch.py -i 'runs/*.cara' -d shifted -j 4 shiftCarbons:shift=-2.5 \\
+    shiftAmideNitrogens:shift=0.8
+
+Without the multiprocessing module (python before 2.6), the repositories are
+processed one after another.
+
+Use caraBatch.py -h or caraBatch.py --help to learn more about inputs.
+"""
+
+### Import some libraries #################################################
+
+from optparse import OptionParser # for parsing commandline input
+from sys import stdout # for the summary
+import os # for files and directories
+import glob # for expanding input patterns
+import time # for timing each repository
+import traceback # for reporting failures from the workers
+from cStringIO import StringIO # for collecting what the steps print
+from caraRepository import CaraRepository # for reading and indexing the repository
+from caraPipeline import parseStep, runSteps, USAGE # for the steps
+try:
+    import multiprocessing # for running repositories in parallel
+except ImportError:
+    multiprocessing = None
+
+### Data Definitions ######################################################
+
+# A job is a tuple (infile, outfile, projectName, steps), where steps is a
+# list of parsed steps as returned by caraPipeline.parseStep().
+# A result is a dict with the keys infile, outfile, status ('done',
+# 'skipped' or 'failed'), seconds and error (None unless failed).
+
+### Helper functions ######################################################
+
+def readManifest(filename):
+    """
+    readManifest: filename -> list of filenames
+    reads a manifest of repositories, one per line. Blank lines and lines
+    starting with # are ignored, and relative names are taken relative to
+    the directory of the manifest.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    infiles = []
+    openfile = open(filename)
+    for line in openfile:
+        line = line.strip()
+        if not line or line[0] == '#':
+            continue
+        infiles.append(os.path.join(directory, line))
+    openfile.close()
+    return infiles
+
+def collectInputs(patterns, manifests):
+    """
+    collectInputs: list of strings, list of filenames -> list of filenames
+    expands the glob patterns and reads the manifests, returning every
+    repository once, in the order given.
+    """
+    infiles = []
+    for pattern in patterns:
+        matches = glob.glob(pattern)
+        matches.sort()
+        infiles.extend(matches)
+    for manifest in manifests:
+        infiles.extend(readManifest(manifest))
+    seen = {}
+    unique = []
+    for infile in infiles:
+        key = os.path.abspath(infile)
+        if key not in seen:
+            seen[key] = True
+            unique.append(infile)
+    return unique
+
+def processFile(job):
+    """
+    processFile: job -> result
+    reads one repository, runs the steps on it and writes the output, with
+    the steps' messages going to outfile.log. The repository is written to
+    outfile.partial and renamed once it is complete, so that an interrupted
+    run never leaves an outfile to be skipped next time.
+    Failures are caught and reported in the result, so that one bad
+    repository does not stop the batch. This runs in the worker processes.
+    """
+    infile, outfile, projectName, steps = job
+    result = {'infile': infile, 'outfile': outfile, 'status': 'done',
+              'seconds': 0.0, 'error': None}
+    if os.path.exists(outfile):
+        result['status'] = 'skipped'
+        return result
+    start = time.time()
+    log = StringIO()
+    partfile = outfile + '.partial'
+    try:
+        try:
+            repository = CaraRepository(infile, projectName)
+            runSteps(repository, steps, log)
+            repository.write(partfile)
+            os.rename(partfile, outfile)
+        except Exception, e:
+            result['status'] = 'failed'
+            result['error'] = '%s: %s'%(e.__class__.__name__, e)
+            print >>log, traceback.format_exc()
+    finally:
+        if os.path.exists(partfile):
+            os.remove(partfile) # do not leave a partial output behind, even when interrupted
+    result['seconds'] = time.time() - start
+    logfile = open(outfile + '.log', 'w')
+    logfile.write(log.getvalue())
+    logfile.close()
+    return result
+
+def runBatch(jobs, workers, log=stdout):
+    """
+    runBatch: list of jobs, int, file -> list of results
+    processes the jobs in a pool of workers, or one after another if
+    workers is 1 or multiprocessing is not available, printing a line to
+    log as each repository finishes.
+    """
+    if workers > 1 and multiprocessing is not None and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        outcomes = pool.imap_unordered(processFile, jobs)
+    else:
+        pool = None
+        outcomes = map(processFile, jobs)
+    results = []
+    for result in outcomes:
+        results.append(result)
+        print >>log, '%-7s %8.2f s  %s'%(result['status'], result['seconds'], result['infile'])
+        if result['error']:
+            print >>log, '        %s'%result['error']
+    if pool is not None:
+        pool.close()
+        pool.join()
+    return results
+
+def writeReport(results, openfile):
+    """
+    writeReport: list of results, file -> void
+    writes one tab-separated line per repository and the totals.
+    """
+    print >>openfile, 'status\tseconds\tinfile\toutfile\terror'
+    for result in results:
+        print >>openfile, '%s\t%.3f\t%s\t%s\t%s'%(result['status'], result['seconds'],
+                                                  result['infile'], result['outfile'],
+                                                  result['error'] or '')
+
+def summarize(results, seconds, log=stdout):
+    """
+    summarize: list of results, float, file -> void
+    prints how many repositories were done, skipped and failed.
+    """
+    counts = {'done': 0, 'skipped': 0, 'failed': 0}
+    busy = 0.0
+    for result in results:
+        counts[result['status']] = counts[result['status']] + 1
+        busy = busy + result['seconds']
+    print >>log, '%d repositories: %d done, %d skipped, %d failed.'%(
+        len(results), counts['done'], counts['skipped'], counts['failed'])
+    print >>log, '%.2f s elapsed, %.2f s of work.'%(seconds, busy)
+
+### Main body of the script ###############################################
+
+def main():
+    parser = OptionParser() # creates an instance of the parser
+    parser.usage = "%prog [-i 'pattern' ...] [-m manifest] -d output-directory [-j workers] step [step ...]"
+    parser.description = "%prog applies the same steps to many CARA repositories in a pool of worker processes, writing each result to the output directory."
+    parser.epilog = "Steps are written as for caraPipeline.py, name or name:key=value,key=value. Use --list to see the available operations."
+    parser.add_option("-i", "--input", dest="patterns",type="string",action="append",default=[],
+                      help="glob pattern of CARA repositories, quoted; may be given more than once.", metavar="PATTERN")
+    parser.add_option("-m", "--manifest", dest="manifests",type="string",action="append",default=[],
+                      help="file listing CARA repositories, one per line; may be given more than once.", metavar="FILE")
+    parser.add_option("-d", "--directory", dest="directory",type="string",default=None,
+                      help="directory for the new repositories and their logs, required.", metavar="DIR")
+    parser.add_option("-j", "--jobs", dest="workers",type="int",default=None,
+                      help="number of worker processes, defaults to the number of CPUs.")
+    parser.add_option("-p", "--project", metavar="NAME", dest="project", default=None,type="string",
+                      help="name of project to alter in every repository, defaults to the first project.")
+    parser.add_option("-r", "--report", dest="report",type="string",default=None,
+                      help="name of a tab-separated report file with one line per repository.", metavar="FILE")
+    parser.add_option("-l", "--list", dest="list", action="store_true", default=False,
+                      help="list the available operations and exit.")
+
+    # Now parse the command-line options
+    (options, args) = parser.parse_args()
+
+    if options.list:
+        names = USAGE.keys()
+        names.sort()
+        for name in names:
+            print USAGE[name]
+        return
+
+    if not options.patterns and not options.manifests:
+        parser.print_help()
+        parser.error("Please specify the input repositories with -i or -m.")
+
+    if options.directory == None:
+        parser.print_help()
+        parser.error("Please specify an output directory.")
+
+    if not args:
+        parser.print_help()
+        parser.error("Please specify at least one step.")
+
+    steps = []
+    for text in args:
+        try:
+            steps.append(parseStep(text))
+        except ValueError, e:
+            parser.error(str(e))
+
+    if options.report and os.path.exists(options.report):
+        print '\nReport file \'%s\' exists. Choose a new name to avoid overwriting.\n'%options.report
+        return
+
+    infiles = collectInputs(options.patterns, options.manifests)
+    if not infiles:
+        print '\nNo repositories match the input given.\n'
+        return
+
+    # Outputs are named after their inputs, so two inputs with the same
+    # file name from different directories would overwrite each other.
+
+    outfiles = {}
+    for infile in infiles:
+        name = os.path.basename(infile)
+        if name in outfiles:
+            print '\nBoth \'%s\' and \'%s\' would be written to \'%s\'.\n'%(outfiles[name], infile, name)
+            return
+        outfiles[name] = infile
+
+    directory = options.directory
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for infile in infiles:
+        if os.path.abspath(os.path.dirname(infile)) == os.path.abspath(directory):
+            print '\nPlease do not overwrite your original files. Choose another output directory.\n'
+            return
+
+    workers = options.workers
+    if workers == None:
+        if multiprocessing is not None:
+            workers = multiprocessing.cpu_count()
+        else:
+            workers = 1
+
+    jobs = [(infile, os.path.join(directory, os.path.basename(infile)), options.project, steps)
+            for infile in infiles]
+    start = time.time()
+    results = runBatch(jobs, workers)
+    summarize(results, time.time() - start)
+
+    if options.report:
+        openfile = open(options.report, 'w')
+        writeReport(results, openfile)
+        openfile.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+#!/nmr/programs/python/bin/python2.5
+"""
+caraBenchmark.py times the scripts on synthetic repositories of several
+sizes, written by makeSyntheticRepository.py. Every script is run as its own
+process, the way it is run by hand, and for each run the wall-clock time,
+the throughput in megabytes and in XML elements per second, and the peak
+resident memory of the process are recorded. The results are written as
+JSON, so that runs on different versions or machines can be compared.
+
+The size tiers are given in TIERS, and the scripts and their arguments in
+BENCHMARKS. Peak memory is only available on unix.
+
+Use caraBenchmark.py -h to learn more about inputs.
+"""
+
+### Import some libraries #################################################
+
+from optparse import OptionParser # for parsing commandline input
+import os # for files and for measuring the memory of the scripts
+import sys # for the python interpreter running the scripts
+import time # for timing the scripts
+import subprocess # for running the scripts
+import shutil # for removing the working directory
+import tempfile # for a working directory
+import platform # for describing the machine in the results
+from makeSyntheticRepository import writeRepository # for the test repositories
+from caraJSON import dumps # for writing the results
+
+### Data Definitions ######################################################
+
+# TIERS is a dict[tier name,dict of writeRepository() arguments].
+
+TIERS = {
+    'small': {'residues': 100, 'aliases': 1, 'spectra': 5, 'pairs': 1000, 'instsPerPair': 1,
+              'peaklists': 2, 'peaksPerList': 200},
+    'medium': {'residues': 1000, 'aliases': 3, 'spectra': 20, 'pairs': 20000, 'instsPerPair': 2,
+               'peaklists': 5, 'peaksPerList': 2000},
+    'large': {'residues': 5000, 'aliases': 10, 'spectra': 50, 'pairs': 200000, 'instsPerPair': 3,
+              'peaklists': 10, 'peaksPerList': 20000},
+    }
+
+TIER_ORDER = ['small', 'medium', 'large']
+
+# BENCHMARKS is a list of (name, script, arguments). In the arguments,
+# %(in)s is the repository, %(out)s the output file, %(upl)s the UPL file
+# and %(log)s a log file, all fresh for every run.
+
+BENCHMARKS = [
+    ('NumberCaraSystemsByAssignment', 'NumberCaraSystemsByAssignment.py', ['%(in)s', '%(out)s']),
+    ('RenumberCaraSystems', 'RenumberCaraSystems.py', ['%(in)s', '%(out)s']),
+    ('ModifyCARAresidueIDs', 'ModifyCARAresidueIDs.py', ['-i', '%(in)s', '-o', '%(out)s']),
+    ('add10000toSpinIDsWithPairs', 'add10000toSpinIDsWithPairs.py', ['%(in)s', '%(out)s']),
+    ('add1000toSpectrumIDsWithAliases', 'add1000toSpectrumIDsWithAliases.py', ['%(in)s', '%(out)s']),
+    ('shiftAllCarbons', 'shiftAllCarbons.py', ['-i', '%(in)s', '-o', '%(out)s', '-s', '1.0', '-a']),
+    ('shiftAllCarbons --stream', 'shiftAllCarbons.py', ['-i', '%(in)s', '-o', '%(out)s', '-s', '1.0', '-a', '--stream']),
+    ('shiftAllCarbons --splice', 'shiftAllCarbons.py', ['-i', '%(in)s', '-o', '%(out)s', '-s', '1.0', '-a', '--splice']),
+    ('shiftAllAmideNitrogens', 'shiftAllAmideNitrogens.py', ['-i', '%(in)s', '-o', '%(out)s', '-s', '1.0', '-a']),
+    ('shiftAllAmideProtons', 'shiftAllAmideProtons.py', ['-i', '%(in)s', '-o', '%(out)s', '-s', '0.1', '-a']),
+    ('shiftCarbonyls', 'shiftCarbonyls.py', ['-i', '%(in)s', '-o', '%(out)s', '-a']),
+    ('shiftSpectrumAliases', 'shiftSpectrumAliases.py', ['-i', '%(in)s', '-o', '%(out)s', '-d', '0.1', '-t', 'N', '-s', '1']),
+    ('makeAliasesSpins', 'makeAliasesSpins.py', ['-i', '%(in)s', '-o', '%(out)s', '-t', 'N', '-s', '1']),
+    ('AddSpinLinksFromUpls', 'AddSpinLinksFromUpls.py', ['-i', '%(in)s', '-o', '%(out)s', '-u', '%(upl)s']),
+    ('showAllSpinLinks', 'showAllSpinLinks.py', ['-i', '%(in)s', '-o', '%(out)s']),
+    ('showSpinLinks', 'showSpinLinks.py', ['-i', '%(in)s', '-o', '%(out)s', '-l', '%(log)s']),
+    ('hideSpinLinks', 'hideSpinLinks.py', ['-i', '%(in)s', '-o', '%(out)s', '-l', '%(log)s']),
+    ('hideSpinLinks --dry-run', 'hideSpinLinks.py', ['-i', '%(in)s', '-n', '-l', '%(log)s']),
+    ('AddDCNlabelingScheme', 'AddDCNlabelingScheme.py', ['%(in)s', '%(out)s']),
+    ('AddNoesyILV15NlabelingScheme', 'AddNoesyILV15NlabelingScheme.py', ['%(in)s', '%(out)s']),
+    ('AddUnlabeledSchemeToResidueType', 'AddUnlabeledSchemeToResidueType.py', ['%(in)s', '%(out)s']),
+    ('caraValidate', 'caraValidate.py', ['-i', '%(in)s', '-o', '%(out)s']),
+    ('caraPipeline', 'caraPipeline.py', ['-i', '%(in)s', '-o', '%(out)s', 'numberSystemsByAssignment',
+                                         'shiftCarbons:shift=1.0,aliases=yes', 'shiftAmideProtons:shift=0.1']),
+    ]
+
+SCRIPT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+### Helper functions ######################################################
+
+def runScript(script, arguments, logfile):
+    """
+    runScript: filename, list of strings, file -> (float, int, int)
+    runs a script in a new python process, sending its output to logfile,
+    and returns the wall-clock seconds, the exit status and the peak
+    resident memory in kilobytes (None where that is not available).
+    """
+    command = [sys.executable, os.path.join(SCRIPT_DIRECTORY, script)] + arguments
+    start = time.time()
+    process = subprocess.Popen(command, stdout=logfile, stderr=subprocess.STDOUT)
+    if hasattr(os, 'wait4'):
+        pid, status, usage = os.wait4(process.pid, 0)
+        status = os.WEXITSTATUS(status)
+        peakMemory = usage.ru_maxrss
+        if sys.platform == 'darwin':
+            peakMemory = peakMemory/1024 # darwin reports bytes
+    else:
+        status = process.wait()
+        peakMemory = None
+    seconds = time.time() - start
+    return (seconds, status, peakMemory)
+
+def removeIfPresent(filename):
+    """Remove a file if it exists."""
+    if os.path.exists(filename):
+        os.remove(filename)
+
+def benchmarkTier(tier, directory, names, repeats, log):
+    """
+    benchmarkTier: string, directory, list of strings, int, file -> list of dicts
+    writes the repository for a tier and runs the chosen benchmarks on it,
+    each repeats times. Returns one result per benchmark, with the fastest
+    of its runs.
+    """
+    paths = {
+        'in': os.path.join(directory, '%s.cara'%tier),
+        'upl': os.path.join(directory, '%s.upl'%tier),
+        'out': os.path.join(directory, 'output.cara'),
+        'log': os.path.join(directory, 'output.log'),
+        }
+    removeIfPresent(paths['in'])
+    removeIfPresent(paths['upl'])
+    settings = TIERS[tier]
+    print >>log, 'Writing the %s repository...'%tier
+    counts = writeRepository(paths['in'], uplfile=paths['upl'], **settings)
+    megabytes = os.path.getsize(paths['in'])/1048576.0
+    elements = sum([value for (key, value) in counts.items() if key != 'restraint'])
+
+    results = []
+    for name, script, arguments in BENCHMARKS:
+        if names and name not in names:
+            continue
+        runs = []
+        for repeat in range(repeats):
+            removeIfPresent(paths['out'])
+            removeIfPresent(paths['log'])
+            logfile = open(os.path.join(directory, 'script.log'), 'w')
+            runs.append(runScript(script, [argument%paths for argument in arguments], logfile))
+            logfile.close()
+        runs.sort()
+        seconds, status, peakMemory = runs[0]
+        result = {
+            'benchmark': name,
+            'tier': tier,
+            'seconds': seconds,
+            'allSeconds': [run[0] for run in runs],
+            'status': status,
+            'peakMemoryKB': max([run[2] for run in runs]),
+            'megabytes': megabytes,
+            'elements': elements,
+            'megabytesPerSecond': megabytes/max(seconds, 1e-9),
+            'elementsPerSecond': elements/max(seconds, 1e-9),
+            }
+        results.append(result)
+        if status == 0:
+            print >>log, '%-8s %-35s %8.2f s %8.1f MB/s %10s kB'%(
+                tier, name, seconds, result['megabytesPerSecond'], peakMemory)
+        else:
+            print >>log, '%-8s %-35s failed with exit status %d'%(tier, name, status)
+    return results
+
+### Main body of the script ###############################################
+
+def main():
+    parser = OptionParser() # creates an instance of the parser
+    parser.usage = "%prog [-t tier ...] [-b benchmark ...] [-r repeats] [-o results.json]"
+    parser.description = "%prog times the CARA scripts on synthetic repositories and reports time, throughput and peak memory as JSON."
+    parser.epilog = "Tiers: %s. Benchmarks: %s."%(', '.join(TIER_ORDER), ', '.join([name for (name, script, arguments) in BENCHMARKS]))
+    parser.add_option("-t", "--tier", dest="tiers",type="string",action="append",default=[],
+                      help="size tier to run; may be given more than once, defaults to small and medium.")
+    parser.add_option("-b", "--benchmark", dest="names",type="string",action="append",default=[],
+                      help="benchmark to run; may be given more than once, defaults to all.")
+    parser.add_option("-r", "--repeats", dest="repeats",type="int",default=3,
+                      help="number of runs of each benchmark, of which the fastest is reported, defaults to 3.")
+    parser.add_option("-o", "--output", dest="outfile",type="string",default=None,
+                      help="name of JSON results file, defaults to stdout.", metavar="FILE")
+    parser.add_option("-w", "--workdir", dest="workdir",type="string",default=None,
+                      help="directory for the repositories, defaults to a temporary directory which is removed afterwards.", metavar="DIR")
+
+    # Now parse the command-line options
+    (options, args) = parser.parse_args()
+
+    tiers = options.tiers or ['small', 'medium']
+    for tier in tiers:
+        if tier not in TIERS:
+            parser.error("Unknown tier \"%s\"."%tier)
+    if options.outfile and os.path.exists(options.outfile):
+        print '\nOutput file \'%s\' exists. Choose a new name to avoid overwriting.\n'%options.outfile
+        return
+
+    if options.workdir:
+        directory = options.workdir
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    else:
+        directory = tempfile.mkdtemp(prefix='caraBenchmark')
+
+    results = []
+    try:
+        for tier in tiers:
+            results.extend(benchmarkTier(tier, directory, options.names, options.repeats, sys.stderr))
+    finally:
+        if not options.workdir:
+            shutil.rmtree(directory)
+
+    report = {
+        'python': sys.version.split()[0],
+        'machine': platform.platform(),
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': results,
+        }
+    text = dumps(report)
+    if options.outfile:
+        openfile = open(options.outfile, 'w')
+        openfile.write(text + '\n')
+        openfile.close()
+    else:
+        print text
+
+if __name__ == '__main__':
+    main()
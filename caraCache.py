@@ -0,0 +1,288 @@
+#!/nmr/programs/python/bin/python2.5
+"""
+caraCache.py keeps the spin, pos, pair, spinsys and residue tables of CARA
+repositories in an on-disk cache, so that analysis-only commands can skip
+XML parsing entirely when a repository has not changed since it was last
+read. CachedRepository offers the same indexes as CaraRepository, but is
+read-only and holds only those tables.
+
+Entries live in the directory named by the environment variable
+CARA_CACHE_DIR, or ~/.cara-cache, one file per repository. An entry is only
+used if the size, modification time and SHA-1 hash of the repository all
+still match. Tables are stored with marshal and compressed with zlib.
+Each time an entry is written, entries unused for more than MAX_AGE_DAYS are
+removed, and then the least recently used ones until the cache is no larger
+than MAX_SIZE_MB.
+
+Run as a script, caraCache.py primes the cache for the given repositories
+and prunes it. Use caraCache.py -h to learn more about inputs.
+"""
+
+### Import some libraries #################################################
+
+from optparse import OptionParser # for parsing commandline input
+import os # for finding, timing and removing cache entries
+import sys # for the python version, which marshal depends on
+import marshal # for the compact binary format of the tables
+import zlib # for compressing the tables
+import time # for the age of cache entries
+from hashlib import sha1 # for recognizing unchanged repositories
+import caraXML as ET # for parsing XML, with lxml if it is installed
+from caraRepository import RepositoryIndexes, selectProject # for the shared indexes
+
+### Data Definitions ######################################################
+
+# The tables of a project are a dict[table name, list of rows], each row a
+# tuple of attribute values (strings, or None if missing) in the order given
+# by TABLES. pos rows start with the ID of the spin they belong to.
+# A cache entry holds a list of (project name, tables) in repository order.
+
+TABLES = {
+    'spin': ('id','atom','tag','sys','off'),
+    'pos': ('spin','spec','shift'),
+    'pair': ('lhs','rhs'),
+    'spinsys': ('id','ass'),
+    'residue': ('id','type','nr','chain'),
+    }
+
+# marshal output is specific to the python version, so it is part of the format.
+FORMAT = ('cara-tables', 1, tuple(sys.version_info[:2]))
+
+# Entries are named by suffix: .tables for repositories, and .peaks for the
+# peak lists read by caraProtection.py.
+ENTRY_SUFFIXES = ('.tables','.peaks')
+
+MAX_AGE_DAYS = 30
+MAX_SIZE_MB = 1024
+
+### Helper functions ######################################################
+
+def cacheDirectory():
+    """Return the cache directory, from CARA_CACHE_DIR or ~/.cara-cache."""
+    return os.environ.get('CARA_CACHE_DIR') or os.path.join(os.path.expanduser('~'),'.cara-cache')
+
+def entryName(infile,cacheDir,suffix='.tables'):
+    """Return the name of the cache entry for a file, by default that of a repository."""
+    key = sha1(os.path.realpath(infile)).hexdigest()
+    return os.path.join(cacheDir,key + suffix)
+
+def fileDigest(infile):
+    """Return the SHA-1 hash of a file, read in 1 MB blocks."""
+    digest = sha1()
+    openfile = open(infile,'rb')
+    block = openfile.read(1048576)
+    while block:
+        digest.update(block)
+        block = openfile.read(1048576)
+    openfile.close()
+    return digest.hexdigest()
+
+def extractTables(infile):
+    """
+    extractTables: filename -> list[(string, tables)]
+    reads the tables of every project from a repository in a single
+    streaming pass, dropping each element once its row has been taken.
+    """
+    projects = []
+    stack = []
+    tables = None
+    pending = None # (element, parent) to drop once the parser is past it
+    for event, elem in ET.iterparse(infile, events=('start','end')):
+        # The parser may still add the tail of the last element read, so it
+        # is only dropped at the next event, as in caraStream.py.
+        if pending is not None:
+            pending[1].remove(pending[0])
+            pending = None
+        if event == 'start':
+            if len(stack) == 1 and elem.tag == 'project':
+                tables = {}
+                for name in TABLES:
+                    tables[name] = []
+                projects.append((elem.get('name'),tables))
+            stack.append(elem)
+            continue
+        stack.pop()
+        if len(stack) != 3 or tables is None:
+            continue
+        # elem is a child of a project's spinbase or sequence
+        if elem.tag in ('spin','pair','spinsys','residue'):
+            tables[elem.tag].append(tuple([elem.get(key) for key in TABLES[elem.tag]]))
+        if elem.tag == 'spin':
+            for pos in elem.findall('pos'):
+                tables['pos'].append((elem.get('id'),pos.get('spec'),pos.get('shift')))
+        pending = (elem,stack[-1])
+    return projects
+
+### The cache #############################################################
+
+def loadTables(infile,cacheDir=None):
+    """
+    loadTables: filename, directory -> list[(string, tables)]
+    returns the tables of every project in a repository, from the cache if
+    the repository is unchanged, and otherwise by reading the XML and then
+    storing the tables in the cache.
+    """
+    if cacheDir is None:
+        cacheDir = cacheDirectory()
+    entry = entryName(infile,cacheDir)
+    status = os.stat(infile)
+    digest = None
+    if os.path.exists(entry):
+        try:
+            openfile = open(entry,'rb')
+            header = marshal.load(openfile)
+            format, size, mtime, storedDigest = header
+            if format == FORMAT and size == status.st_size and mtime == status.st_mtime:
+                digest = fileDigest(infile)
+                if digest == storedDigest:
+                    projects = marshal.loads(zlib.decompress(openfile.read()))
+                    openfile.close()
+                    os.utime(entry,None) # mark the entry as recently used
+                    return projects
+            openfile.close()
+        except (EOFError, ValueError, TypeError, zlib.error):
+            pass # a damaged entry is simply replaced
+    if digest is None:
+        digest = fileDigest(infile)
+    projects = extractTables(infile)
+    storeTables(entry,(FORMAT,status.st_size,status.st_mtime,digest),projects)
+    evict(cacheDir)
+    return projects
+
+def storeTables(entry,header,projects):
+    """
+    storeTables: filename, header, list[(string, tables)] -> void
+    writes a cache entry. The entry is written under a temporary name and
+    then renamed, so that other processes never see half an entry.
+    """
+    cacheDir = os.path.dirname(entry)
+    if not os.path.isdir(cacheDir):
+        os.makedirs(cacheDir)
+    temporary = '%s.%d.tmp'%(entry,os.getpid())
+    openfile = open(temporary,'wb')
+    marshal.dump(header,openfile)
+    openfile.write(zlib.compress(marshal.dumps(projects),1))
+    openfile.close()
+    os.rename(temporary,entry)
+
+def evict(cacheDir=None,maxAgeDays=MAX_AGE_DAYS,maxSizeMB=MAX_SIZE_MB):
+    """
+    evict: directory, float, float -> (int, int)
+    removes cache entries not used for more than maxAgeDays, then the least
+    recently used entries until the cache holds at most maxSizeMB. Returns
+    the number of entries and bytes left.
+    """
+    if cacheDir is None:
+        cacheDir = cacheDirectory()
+    if not os.path.isdir(cacheDir):
+        return (0,0)
+    now = time.time()
+    entries = []
+    for name in os.listdir(cacheDir):
+        if name.endswith(ENTRY_SUFFIXES):
+            path = os.path.join(cacheDir,name)
+            status = os.stat(path)
+            if maxAgeDays is not None and now - status.st_mtime > maxAgeDays*86400:
+                os.remove(path)
+            else:
+                entries.append((status.st_mtime,status.st_size,path))
+    entries.sort() # oldest first
+    totalSize = sum([size for (mtime,size,path) in entries])
+    while entries and maxSizeMB is not None and totalSize > maxSizeMB*1048576:
+        mtime, size, path = entries.pop(0)
+        os.remove(path)
+        totalSize = totalSize - size
+    return (len(entries),totalSize)
+
+### Read-only repository ##################################################
+
+class CachedElement(dict):
+    """
+    CachedElement stands in for an XML element in a CachedRepository. It
+    holds the cached attributes, so that get(), items() and findall() work
+    as they do on the element itself.
+    """
+
+    def __init__(self, tag, attrib):
+        dict.__init__(self, attrib)
+        self.tag = tag
+        self.children = []
+
+    def findall(self, tag):
+        return [child for child in self.children if child.tag == tag]
+
+def makeElements(tag,rows):
+    """Return a CachedElement for each row of a table."""
+    keys = TABLES[tag]
+    elements = []
+    for row in rows:
+        attrib = {}
+        for key, value in zip(keys,row):
+            if value is not None:
+                attrib[key] = value
+        elements.append(CachedElement(tag,attrib))
+    return elements
+
+class CachedRepository(RepositoryIndexes):
+    """
+    CachedRepository gives read-only access to the cached tables of one
+    project, with the same element lists and indexes as CaraRepository.
+    spins, pairs, systems and residues are available; links and spectra are
+    not cached and are always empty. There is no write(). Reading the cache
+    or the XML is counted as the parse phase of the profiler.
+    """
+
+    def __init__(self, infile, projectName=None, projectNumber=None, cacheDir=None, profiler=None):
+        if profiler is not None:
+            self.profiler = profiler
+        self.profiler.switch('parse')
+        projectTables = loadTables(infile,cacheDir)
+        self.profiler.switch('select')
+        self.projects = [CachedElement('project',{'name': name}) for (name,tables) in projectTables]
+        self.project = selectProject(self.projects,projectName,projectNumber)
+        tables = projectTables[self.projects.index(self.project)][1]
+        self.spins = makeElements('spin',tables['spin'])
+        self.pairs = makeElements('pair',tables['pair'])
+        self.systems = makeElements('spinsys',tables['spinsys'])
+        self.residues = makeElements('residue',tables['residue'])
+        self.links = []
+        self.spectra = []
+        self.resetIndexes()
+        for spinID, spec, shift in tables['pos']:
+            pos = CachedElement('pos',{'spec': spec, 'shift': shift})
+            self.spinIndex[int(spinID)].children.append(pos)
+
+### Main body of the script ###############################################
+
+def main():
+    parser = OptionParser() # creates an instance of the parser
+    parser.usage = "%prog [-i input.cara ...] [-a days] [-s megabytes] [--clear]"
+    parser.description = "%prog stores the tables of the given CARA repositories in the cache, then removes old entries so that none is older than the maximum age and the cache is no larger than the maximum size."
+    parser.epilog = "The cache directory is %s; set CARA_CACHE_DIR to use another one."%cacheDirectory()
+    parser.add_option("-i", "--input", dest="infiles",type="string",action="append",default=[],
+                      help="CARA repository to cache; may be given more than once.", metavar="FILE")
+    parser.add_option("-a", "--max-age", dest="maxAge",type="float",default=MAX_AGE_DAYS,
+                      help="remove entries unused for this many days, defaults to %d."%MAX_AGE_DAYS, metavar="DAYS")
+    parser.add_option("-s", "--max-size", dest="maxSize",type="float",default=MAX_SIZE_MB,
+                      help="keep the cache below this many megabytes, defaults to %d."%MAX_SIZE_MB, metavar="MB")
+    parser.add_option("--clear", dest="clear", action="store_true", default=False,
+                      help="remove every entry.")
+
+    # Now parse the command-line options
+    (options, args) = parser.parse_args()
+
+    for infile in options.infiles:
+        projects = loadTables(infile)
+        for name, tables in projects:
+            print '%s, project %s: %d spins, %d positions, %d pairs, %d systems, %d residues.'%(
+                infile,name,len(tables['spin']),len(tables['pos']),len(tables['pair']),
+                len(tables['spinsys']),len(tables['residue']))
+
+    if options.clear:
+        numEntries, totalSize = evict(None,0,0)
+    else:
+        numEntries, totalSize = evict(None,options.maxAge,options.maxSize)
+    print 'The cache holds %d entries, %.1f MB.'%(numEntries,totalSize/1048576.0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+caraColumns.py holds the chemical shift positions of a project as columns:
+for each <pos> element, the ID, atom type and tag of its spin, its spectrum
+and its shift. Shifts are changed on whole columns at once, by selecting
+positions with a mask and adding to them, and are then written back to the
+elements in bulk. Only positions whose shift actually changed are written,
+so everything else keeps its original text.
+
+NumPy is used if it is installed, so that the selections and additions are
+array operations; otherwise the same operations run on plain lists. The
+results are the same either way.
+
+A typical referencing correction:
+
+columns = PositionColumns(repository.spins)
+mask = columns.matching(atom='C13')
+columns.add(mask, 1.5)
+columns.writeBack()
+"""
+
+### Import some libraries #################################################
+
+try:
+    import numpy # for array arithmetic on the columns
+except ImportError:
+    numpy = None
+
+### Data Definitions ######################################################
+
+# A mask is a sequence of booleans, one per position, True for the
+# positions to change: a numpy array of bool, or a list without numpy.
+# spinIDs are integers, atoms, tags and specs are strings as they appear in
+# the repository (spec '0' is the unaliased position) and shifts are floats.
+
+### Columns ###############################################################
+
+class PositionColumns(object):
+    """
+    PositionColumns reads every <pos> of the given spins into columns:
+    spinIDs, atoms, tags, specs and shifts. positions holds the elements
+    themselves, in the same order, for writing the shifts back.
+    """
+
+    def __init__(self, spins):
+        self.spins = list(spins)
+        self.positions = []
+        spinNumbers = [] # the position of each pos's spin in self.spins
+        spinIDs = []
+        atoms = []
+        tags = []
+        specs = []
+        shifts = []
+        for number in range(len(self.spins)):
+            spin = self.spins[number]
+            spinID = int(spin.get('id'))
+            atom = spin.get('atom')
+            tag = spin.get('tag')
+            for pos in spin.findall('pos'):
+                self.positions.append(pos)
+                spinNumbers.append(number)
+                spinIDs.append(spinID)
+                atoms.append(atom)
+                tags.append(tag)
+                specs.append(pos.get('spec'))
+                shifts.append(float(pos.get('shift')))
+        if numpy is not None:
+            self.spinNumbers = numpy.array(spinNumbers, dtype=int)
+            self.spinIDs = numpy.array(spinIDs, dtype=int)
+            self.atoms = numpy.array(atoms, dtype=object)
+            self.tags = numpy.array(tags, dtype=object)
+            self.specs = numpy.array(specs, dtype=object)
+            self.shifts = numpy.array(shifts, dtype=float)
+            self.changed = numpy.zeros(len(shifts), dtype=bool)
+        else:
+            self.spinNumbers = spinNumbers
+            self.spinIDs = spinIDs
+            self.atoms = atoms
+            self.tags = tags
+            self.specs = specs
+            self.shifts = shifts
+            self.changed = [False]*len(shifts)
+
+    def __len__(self):
+        return len(self.positions)
+
+    ### Masks #############################################################
+
+    def equals(self, column, value):
+        """Return the mask of positions where column is value."""
+        if numpy is not None:
+            return column == value
+        return [item == value for item in column]
+
+    def both(self, mask, otherMask):
+        """Return the mask of positions selected by both masks."""
+        if numpy is not None:
+            return mask & otherMask
+        return [a and b for (a, b) in zip(mask, otherMask)]
+
+    def everything(self):
+        """Return the mask selecting every position."""
+        if numpy is not None:
+            return numpy.ones(len(self.positions), dtype=bool)
+        return [True]*len(self.positions)
+
+    def matching(self, atom=None, tag=None, spec=None):
+        """
+        matching: string, string, string -> mask
+        returns the mask of the positions of spins with the given atom type
+        and tag, in the given spectrum. Criteria left as None match anything.
+        """
+        mask = self.everything()
+        for column, value in ((self.atoms, atom), (self.tags, tag), (self.specs, spec)):
+            if value is not None:
+                mask = self.both(mask, self.equals(column, value))
+        return mask
+
+    def selectedSpins(self, selectSpin, alias=False):
+        """
+        selectedSpins: function, bool -> mask
+        returns the mask of the positions of every spin for which
+        selectSpin(spin) is true. selectSpin is called once per spin rather
+        than once per position. Aliases are only included if alias is True.
+        """
+        chosen = [bool(selectSpin(spin)) for spin in self.spins]
+        if numpy is not None:
+            mask = numpy.array(chosen, dtype=bool)[self.spinNumbers]
+        else:
+            mask = [chosen[number] for number in self.spinNumbers]
+        if not alias:
+            mask = self.both(mask, self.equals(self.specs, '0'))
+        return mask
+
+    ### Changing shifts ###################################################
+
+    def add(self, mask, change):
+        """
+        add: mask, float -> int
+        adds change to the selected shifts. Returns the number changed.
+        """
+        return self.apply(mask, lambda shift: shift + change)
+
+    def apply(self, mask, newShift):
+        """
+        apply: mask, function -> int
+        replaces each selected shift with newShift(shift). With numpy,
+        newShift is given the whole array of selected shifts at once, which
+        works for any arithmetic formula. Returns the number changed.
+        """
+        if numpy is not None:
+            self.shifts[mask] = newShift(self.shifts[mask])
+            self.changed |= mask
+            return int(mask.sum())
+        numChanged = 0
+        for index in range(len(self.shifts)):
+            if mask[index]:
+                self.shifts[index] = newShift(self.shifts[index])
+                self.changed[index] = True
+                numChanged = numChanged + 1
+        return numChanged
+
+    def writeBack(self):
+        """
+        writeBack: -> int
+        sets the shift attribute of every position changed since the last
+        writeBack(), formatted as str() formats a float. Returns the number
+        of elements written.
+        """
+        if numpy is not None:
+            indexes = numpy.flatnonzero(self.changed)
+            values = self.shifts[indexes].tolist()
+            indexes = indexes.tolist()
+            self.changed[:] = False
+        else:
+            indexes = [index for index in range(len(self.changed)) if self.changed[index]]
+            values = [self.shifts[index] for index in indexes]
+            self.changed = [False]*len(self.changed)
+        positions = self.positions
+        for index, value in zip(indexes, values):
+            positions[index].set('shift', str(value))
+        return len(indexes)
@@ -0,0 +1,93 @@
+"""
+caraJSON.py writes the reports of caraBenchmark.py and caraValidate.py as
+JSON. The json module is used when it can be imported (simplejson on python
+2.5); otherwise toJSON() writes the same values, escaped the way json does
+it, so that the report can be read back with any JSON parser.
+"""
+
+### Import some libraries #################################################
+
+import re # for finding the characters to escape
+try:
+    import json # for writing JSON
+except ImportError:
+    try:
+        import simplejson as json
+    except ImportError:
+        json = None
+
+### Data Definitions ######################################################
+
+# ESCAPES maps the characters that have a short escape in JSON to it. Every
+# other control character, and everything outside ASCII, is written as
+# \uXXXX.
+
+ESCAPES = {'"': '\\"', '\\': '\\\\', '\n': '\\n', '\r': '\\r', '\t': '\\t', '\b': '\\b', '\f': '\\f'}
+
+escapePattern = re.compile(u'[\\\\"]|[^\\ -~]')
+
+### Helper functions ######################################################
+
+def escapeCharacter(match):
+    """
+    escapeCharacter: match -> string
+    returns the JSON escape for the character matched by escapePattern,
+    as a surrogate pair for characters beyond the basic multilingual plane.
+    """
+    character = match.group(0)
+    if character in ESCAPES:
+        return ESCAPES[character]
+    code = ord(character)
+    if code > 0xFFFF:
+        code = code - 0x10000
+        return '\\u%04x\\u%04x'%(0xD800 | (code >> 10), 0xDC00 | (code & 0x3FF))
+    return '\\u%04x'%code
+
+def quoteString(text):
+    """
+    quoteString: string or unicode -> string
+    returns text as a quoted JSON string in plain ASCII. A byte string is
+    taken to be UTF-8, as json does.
+    """
+    if not isinstance(text, unicode):
+        text = str(text).decode('utf-8', 'replace')
+    return '"%s"'%str(escapePattern.sub(escapeCharacter, text))
+
+def toJSON(value, indent=0):
+    """
+    toJSON: dict, list, string or number -> string
+    encodes value as JSON, for pythons without the json module.
+    """
+    space = ' '*indent
+    if isinstance(value, dict):
+        if not value:
+            return '{}'
+        keys = value.keys()
+        keys.sort()
+        items = ['%s  %s: %s'%(space, quoteString(key), toJSON(value[key], indent+2)) for key in keys]
+        return '{\n%s\n%s}'%(',\n'.join(items), space)
+    if isinstance(value, (list, tuple)):
+        return '[%s]'%', '.join([toJSON(item, indent+2) for item in value])
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        if value in (float('inf'), float('-inf')):
+            return value > 0 and 'Infinity' or '-Infinity'
+        return repr(value)
+    if isinstance(value, (int, long)):
+        return str(value)
+    return quoteString(value)
+
+def dumps(value):
+    """
+    dumps: dict, list, string or number -> string
+    encodes value as indented JSON with sorted keys, with the json module
+    if there is one and with toJSON() otherwise.
+    """
+    if json is not None:
+        return json.dumps(value, indent=2, sort_keys=True)
+    return toJSON(value)
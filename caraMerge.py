@@ -0,0 +1,411 @@
+#!/nmr/programs/python/bin/python2.5
+"""
+caraMerge.py merges the project of a second CARA repository into the
+project of a first, replacing the add10000toSpinIDsWithPairs.py,
+add1000toSpectrumIDsWithAliases.py and CARA import routine that used to
+prepare and combine two repositories.
+
+The first repository is parsed once to index its IDs, its residues by
+number, and the byte offsets where elements can be added to its project.
+The spins, spin systems, spectra and peaklists of the second repository are
+then given an offset that puts them above every ID of the same kind in the
+first (see offsetFor), so the offsets are collision-free without reading the
+second repository beforehand. The second repository is parsed once, its IDs
+and every reference to them rewritten as in caraRemap.py, and its spectra,
+peaklists and spinbase contents are copied to temporary files. Last, the
+first repository is copied byte for byte to the output, with the copied
+elements spliced in after its own spectra, peaklists and spins, systems,
+links and spinlinks.
+
+The first repository's library, sequence and project name are kept. The
+residues of the second repository are matched to those of the first by
+residue number, and a residue that is missing or of another type in the
+first stops the merge before anything is written. Any other element of
+the second project, such as a sample, is left out and reported. Both
+repositories must have the same encoding.
+
+Use caraMerge.py -h or caraMerge.py --help to learn more about inputs.
+"""
+
+### Import some libraries #################################################
+
+from optparse import OptionParser # for parsing commandline input
+import mmap # for reading large repositories without loading them
+import xml.parsers.expat # for parsing with byte offsets
+from tempfile import TemporaryFile # for holding the copied elements until the output is written
+from os.path import exists # for making sure not to overwrite files
+from caraSplice import attributeSpans, quoteValue # for rewriting attributes in place
+from caraRemap import Catalog, ELEMENTS, KINDS, idRewriter # for indexing IDs and rewriting references
+from caraProfile import Profiler # for the --profile option
+
+### Data Definitions ######################################################
+
+# OFFSET_KINDS are the kinds of ID of the second repository that are given
+# an offset; residues are matched by number instead.
+OFFSET_KINDS = ('spin', 'system', 'spectrum', 'peaklist')
+
+# GROUPS are the children of the second project that are copied, each
+# after the last element with the same tag in the first project. The
+# children of the spinbase are copied into the first project's spinbase.
+GROUPS = ('spectrum', 'peaklist', 'spinbase')
+
+# Offsets are powers of ten, and at least MINIMUM_OFFSET, so that an ID
+# keeps its last digits, as with add1000toSpectrumIDsWithAliases.py.
+MINIMUM_OFFSET = 1000
+
+# An insertion is a tuple (start, end, before, group, after): the bytes of
+# the first repository from start to end are replaced by before, the
+# contents of the group, and after.
+
+### Helper functions ######################################################
+
+def offsetFor(ids):
+    """
+    offsetFor: list of ints -> int
+    returns the smallest power of ten, at least MINIMUM_OFFSET, that is
+    larger than every ID, so that adding it to any positive ID gives one
+    that is not in ids.
+    """
+    offset = MINIMUM_OFFSET
+    if ids:
+        largest = max(ids)
+        while offset <= largest:
+            offset = offset*10
+    return offset
+
+class OffsetRemap(object):
+    """
+    OffsetRemap is a remap for idRewriter() that adds offset to every ID
+    except 0, which stands for every spectrum in aliases and spinlinks and
+    for an unassigned dimension of a peak.
+    """
+
+    def __init__(self, offset):
+        self.offset = offset
+
+    def get(self, oldID):
+        if not oldID or oldID == '0' or not oldID.isdigit():
+            return None
+        return '%d'%(int(oldID) + self.offset)
+
+def scanProject(data, startElement, endElement, projectName=None, projectNumber=None):
+    """
+    scanProject: mmap, function, function, string, int -> (string, int)
+    parses a repository, calling startElement(tag, attrs, ancestors, index)
+    and endElement(tag, ancestors, index, closed) for the selected project
+    and every element inside it. ancestors is a list of (tag, attrs) from
+    the repository root down to the parent, index the byte offset of the
+    start tag, or of the end tag if closed, and closed is False for an
+    empty element such as <spinbase/>, whose index is then just after it.
+    Returns the name of the selected project, which is None if there was no
+    such project, and the number of projects. The project is selected as
+    in caraSplice.spliceRewrite().
+    """
+    state = {'projects': 0, 'inProject': False, 'selected': None}
+    stack = []
+    parser = xml.parsers.expat.ParserCreate()
+
+    def start(tag, attrs):
+        if len(stack) == 1 and tag == 'project':
+            if projectName:
+                state['inProject'] = attrs.get('name') == projectName
+            else:
+                state['inProject'] = state['projects'] == (projectNumber or 0)
+            if state['inProject']:
+                state['selected'] = attrs.get('name')
+            state['projects'] = state['projects'] + 1
+        if state['inProject']:
+            startElement(tag, attrs, stack, parser.CurrentByteIndex)
+        stack.append((tag, attrs))
+
+    def end(tag):
+        stack.pop()
+        if state['inProject']:
+            index = parser.CurrentByteIndex
+            endElement(tag, stack, index, data[index:index+2] == '</')
+        if len(stack) == 1 and tag == 'project':
+            state['inProject'] = False
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    blockSize = 1048576
+    for position in xrange(0, len(data), blockSize):
+        parser.Parse(data[position:position+blockSize], False)
+    parser.Parse('', True)
+    return (state['selected'], state['projects'])
+
+def openRepository(infile):
+    """openRepository: filename -> (file, mmap), to be closed by the caller."""
+    infileObject = open(infile, 'rb')
+    return (infileObject, mmap.mmap(infileObject.fileno(), 0, access=mmap.ACCESS_READ))
+
+def projectError(selected, numProjects, projectName, projectNumber, infile):
+    """
+    projectError: string, int, string, int, filename -> void
+    raises a NameError if no project was selected.
+    """
+    if selected is not None:
+        return
+    if projectName:
+        raise NameError, "There is no project named \"%s\" in %s."%(projectName, infile)
+    raise NameError, "You requested project number %d, but there are only %d projects in %s."%(
+        (projectNumber or 0) + 1, numProjects, infile)
+
+### Merging ###############################################################
+
+def readTarget(infile, projectName=None, projectNumber=None):
+    """
+    readTarget: filename, string, int -> (Catalog, dict[group,insertion])
+    reads the IDs of the first repository and the residue numbers, and
+    finds where each group of the second repository goes: after the last
+    element of its tag, inside the spinbase, or else at the end of the
+    project. Raises a NameError if there is no such project.
+    """
+    catalog = Catalog()
+    wanted = {}
+    for kind in KINDS:
+        catalog.records[kind] = []
+        wanted[ELEMENTS[kind]] = catalog.records[kind]
+    insertions = {}
+    state = {'last': None, 'spinbase': None}
+
+    def startElement(tag, attrs, ancestors, index):
+        if len(ancestors) < 2:
+            return
+        key = (tag, ancestors[-1][0])
+        if key in wanted and 'id' in attrs:
+            wanted[key].append((int(attrs['id']), attrs))
+        if key == ELEMENTS['residue'] and 'nr' in attrs:
+            catalog.residueNumbers[int(attrs['id'])] = int(attrs['nr'])
+        if len(ancestors) == 2:
+            if state['last'] in GROUPS and state['last'] != 'spinbase':
+                insertions[state['last']] = (index, index, '', state['last'], '')
+            state['last'] = tag
+            if tag == 'spinbase':
+                state['spinbase'] = index
+
+    def endElement(tag, ancestors, index, closed):
+        if len(ancestors) == 2 and tag == 'spinbase':
+            if closed:
+                insertions['spinbase'] = (index, index, '', 'spinbase', '')
+            else:
+                insertions['spinbase'] = (state['spinbase'], index, '<spinbase>\n', 'spinbase', '</spinbase>')
+        elif len(ancestors) == 1 and tag == 'project':
+            if state['last'] in GROUPS and state['last'] != 'spinbase':
+                insertions[state['last']] = (index, index, '', state['last'], '')
+            for group in GROUPS:
+                if group not in insertions:
+                    if group == 'spinbase':
+                        insertions[group] = (index, index, '<spinbase>\n', group, '</spinbase>\n')
+                    else:
+                        insertions[group] = (index, index, '', group, '')
+
+    infileObject, data = openRepository(infile)
+    selected, numProjects = scanProject(data, startElement, endElement, projectName, projectNumber)
+    data.close()
+    infileObject.close()
+    projectError(selected, numProjects, projectName, projectNumber, infile)
+    catalog.project = selected
+    return (catalog, insertions)
+
+def copySource(infile, catalog, offsets, groups, projectName=None, projectNumber=None):
+    """
+    copySource: filename, Catalog, dict[kind,int], dict[group,file], string, int -> (dict[kind,int], dict[kind,int], dict[string,int])
+    copies the spectra, peaklists and spinbase contents of the second
+    repository into the group files, adding the offsets to the IDs and
+    matching residues to those of the catalog of the first repository by
+    number. Returns the number of elements copied of each kind, the number
+    of attributes changed for each kind, and the number of other project
+    children left out, by tag. Raises a NameError if there is no such
+    project, and a ValueError if a residue is not in the first repository.
+    """
+    residuesByNumber = {}
+    residueTypes = {}
+    for residueID, attrs in catalog.records['residue']:
+        residuesByNumber[catalog.residueNumbers[residueID]] = residueID
+        residueTypes[residueID] = attrs.get('type')
+    remaps = {'residue': {}}
+    for kind in OFFSET_KINDS:
+        remaps[kind] = OffsetRemap(offsets[kind])
+    counts = {'peak': 0}
+    copied = {}
+    for kind in KINDS:
+        counts[kind] = 0
+        copied[kind] = 0
+    kinds = {}
+    for kind in KINDS:
+        kinds[ELEMENTS[kind]] = kind
+    skipped = {}
+    rewrite = idRewriter(remaps, counts)
+    state = {'copied': 0, 'target': None}
+
+    infileObject, data = openRepository(infile)
+
+    def switch(index, target):
+        if state['target'] is not None:
+            state['target'].write(data[state['copied']:index])
+        state['copied'] = index
+        state['target'] = target
+
+    def startElement(tag, attrs, ancestors, index):
+        if len(ancestors) < 2:
+            return
+        parent = ancestors[-1][0]
+        if len(ancestors) == 2:
+            if tag in groups and tag != 'spinbase':
+                switch(index, groups[tag])
+            else:
+                switch(index, None)
+                if tag not in GROUPS and tag != 'sequence':
+                    skipped[tag] = skipped.get(tag, 0) + 1
+        elif len(ancestors) == 3 and parent == 'spinbase' and state['target'] is None:
+            switch(index, groups['spinbase'])
+        key = (tag, parent)
+        if key == ELEMENTS['residue']:
+            number = int(attrs['nr'])
+            residueID = residuesByNumber.get(number)
+            if residueID is None or residueTypes[residueID] != attrs.get('type'):
+                raise ValueError, "Residue %d (%s) of %s is not in the sequence of the first repository."%(
+                    number, attrs.get('type'), infile)
+            remaps['residue'][attrs['id']] = '%d'%residueID
+        if key in kinds:
+            copied[kinds[key]] = copied[kinds[key]] + 1
+        if state['target'] is None:
+            return
+        changes = rewrite(tag, attrs, ancestors)
+        if changes:
+            spans = attributeSpans(data, index)
+            edits = []
+            for name, value in changes.items():
+                start, end, quote = spans[name]
+                edits.append((start, end, quoteValue(value, quote)))
+            edits.sort()
+            for start, end, value in edits:
+                state['target'].write(data[state['copied']:start])
+                state['target'].write(value)
+                state['copied'] = end
+
+    def endElement(tag, ancestors, index, closed):
+        if (len(ancestors) == 2 and tag == 'spinbase') or (len(ancestors) == 1 and tag == 'project'):
+            switch(index, None)
+
+    try:
+        selected, numProjects = scanProject(data, startElement, endElement, projectName, projectNumber)
+    finally:
+        data.close()
+        infileObject.close()
+    projectError(selected, numProjects, projectName, projectNumber, infile)
+    return (copied, counts, skipped)
+
+def writeMerged(infile, outfile, insertions, groups):
+    """
+    writeMerged: filename, filename or file, dict[group,insertion], dict[group,file] -> void
+    copies the first repository to outfile, splicing in the contents of
+    every group file that is not empty.
+    """
+    infileObject, data = openRepository(infile)
+    if hasattr(outfile, 'write'):
+        output = outfile
+    else:
+        output = open(outfile, 'wb')
+    blockSize = 1048576
+    edits = [insertions[group] for group in GROUPS if groups[group].tell() > 0]
+    edits.sort()
+    copied = 0
+    for start, end, before, group, after in edits:
+        output.write(data[copied:start])
+        output.write(before)
+        groups[group].seek(0)
+        block = groups[group].read(blockSize)
+        while block:
+            output.write(block)
+            block = groups[group].read(blockSize)
+        output.write(after)
+        copied = end
+    output.write(data[copied:])
+    if output is not outfile:
+        output.close()
+    data.close()
+    infileObject.close()
+
+def mergeRepositories(firstfile, secondfile, outfile, projectName=None, projectNumber=None,
+                      secondName=None, secondNumber=None):
+    """
+    mergeRepositories: filename, filename, filename or file, string, int, string, int -> (dict[kind,int], dict[kind,int], dict[kind,int], dict[string,int])
+    merges the selected project of secondfile into the selected project of
+    firstfile and writes the result to outfile, reading each repository
+    once. Returns the offset given to each kind of ID, the number of
+    elements merged of each kind, the number of attributes changed for each
+    kind, and the number of project children left out, by tag. Raises a
+    NameError if there is no such project and a ValueError if the
+    sequences do not match, in both cases before anything is written.
+    """
+    catalog, insertions = readTarget(firstfile, projectName, projectNumber)
+    offsets = {}
+    for kind in OFFSET_KINDS:
+        offsets[kind] = offsetFor([oldID for oldID, attrs in catalog.records[kind]])
+    groups = {}
+    for group in GROUPS:
+        groups[group] = TemporaryFile()
+    try:
+        copied, counts, skipped = copySource(secondfile, catalog, offsets, groups, secondName, secondNumber)
+        writeMerged(firstfile, outfile, insertions, groups)
+    finally:
+        for group in GROUPS:
+            groups[group].close()
+    return (offsets, copied, counts, skipped)
+
+### Main body of the script ###############################################
+
+def main():
+    parser = OptionParser() # creates an instance of the parser
+    parser.usage = "%prog -i first.cara -m second.cara -o merged.cara [-p project-name] [-q project-name]"
+    parser.description = "%prog merges the project of a second CARA repository into the project of a first, moving the IDs of its spins, spin systems, spectra and peaklists above those of the first."
+    parser.epilog = "Each repository is read once, and the first is copied byte for byte apart from the merged elements."
+    parser.add_option("-i", "--input", dest="infile",type="string",default=None,
+                      help="name of first CARA repository, whose library, sequence and IDs are kept, required.", metavar="FILE")
+    parser.add_option("-m", "--merge", dest="mergefile",type="string",default=None,
+                      help="name of second CARA repository, to be merged into the first, required.", metavar="FILE")
+    parser.add_option("-o", "--output", dest="outfile",type="string",default=None,
+                      help="name of merged CARA repository, required.", metavar="FILE")
+    parser.add_option("-p", "--project", metavar="NAME", dest="project", default=None,type="string",
+                      help="name of project of the first repository, if there is more than one, defaults to the first project.")
+    parser.add_option("-q", "--merge-project", metavar="NAME", dest="mergeProject", default=None,type="string",
+                      help="name of project of the second repository, if there is more than one, defaults to the first project.")
+    parser.add_option("--profile", dest="profile", action="store_true", default=False,
+                      help="report the time and peak memory of each phase of the run, and the number of elements visited and modified, on stderr.")
+
+    # Now parse the command-line options
+    (options, args) = parser.parse_args()
+
+    profiler = Profiler(options.profile)
+
+    if options.infile == None or options.mergefile == None or options.outfile == None:
+        parser.print_help()
+        parser.error("Please specify two input cara files and an output cara file.")
+
+    if exists(options.outfile):
+        print '\nOutput file \'%s\' exists. Choose a new name to avoid overwriting.\n'%options.outfile
+        return
+
+    profiler.switch('stream')
+    try:
+        offsets, copied, counts, skipped = mergeRepositories(options.infile, options.mergefile, options.outfile,
+                                                             options.project, None, options.mergeProject)
+    except (NameError, ValueError), e:
+        print '\n%s Try again.\n'%e
+        return
+    for kind in OFFSET_KINDS:
+        print 'Merged %d %s elements, adding %d to their IDs and changing %d references.'%(
+            copied[kind], kind, offsets[kind], counts[kind])
+    print 'Matched %d residues by number.'%copied['residue']
+    print 'Changed %d peaklist elements.'%counts['peak']
+    tags = skipped.keys()
+    tags.sort()
+    for tag in tags:
+        print 'Left out %d <%s> elements of the second project.'%(skipped[tag], tag)
+    profiler.count(sum(copied.values()), sum(counts.values()))
+    profiler.report()
+
+if __name__ == '__main__':
+    main()
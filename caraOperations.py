@@ -0,0 +1,727 @@
+"""
+caraOperations.py holds the transformations performed by the individual
+scripts as functions that act on an already loaded CaraRepository. The
+scripts call them on a repository they have just read, and caraPipeline.py
+calls several of them in a row on one repository, so that a chain of steps
+only parses and writes the XML once.
+
+Functions that print progress take a log argument, an open file which
+defaults to stdout.
+"""
+
+### Import some libraries #################################################
+
+from sys import stdout # for output to screen instead of to file
+from caraXML import SubElement # for adding labeling schemes
+from caraRepository import canonicalPair # for spinlink keys
+from caraUpl import uplFiles, parseUplFiles, restraintText, RESTRAINT_FORMATS # for reading and writing UPL files
+from caraStructure import readStructure, ensembleContacts # for finding close protons in structures
+from caraAllocator import IDAllocator # for finding free system IDs
+from caraVisibility import VisibilityMatrix, instIndex, instVisible, DEFAULT_RATE, DEFAULT_CODE # for compacting, merging and filtering spinlink visibility
+import caraXML as ET # for writing merged <inst> elements
+
+### Spin selections for shifting ##########################################
+
+def isCarbon(spin):
+    """isCarbon: spin -> bool, true for every carbon spin."""
+    return spin.get('atom') == 'C13'
+
+def isAmideNitrogen(spin):
+    """isAmideNitrogen: spin -> bool, true for backbone amide nitrogens."""
+    return spin.get('tag') == 'N'
+
+def isAmideProton(spin):
+    """isAmideProton: spin -> bool, true for backbone amide protons."""
+    return spin.get('tag') == 'H'
+
+def isCarbonyl(spin):
+    """isCarbonyl: spin -> bool, true for backbone carbonyls."""
+    return spin.get('tag') == 'C'
+
+### Operations ############################################################
+
+def shiftSpins(repository,selectSpin,newShift,alias=False):
+    """
+    shiftSpins: repository, function, function, bool -> int
+    replaces the shift of every spin for which selectSpin(spin) is true with
+    newShift(shift). Aliases are only changed if alias is True. Returns the
+    number of positions changed. The shifts are changed a column at a time
+    (see caraColumns.py), so newShift must be an arithmetic formula that
+    also works on an array of shifts.
+    """
+    columns = repository.positionColumns
+    numChanged = columns.apply(columns.selectedSpins(selectSpin,alias),newShift)
+    columns.writeBack()
+    repository.profiler.count(len(columns),numChanged)
+    return numChanged
+
+def modifyResidueIDs(repository):
+    """
+    modifyResidueIDs: repository -> dict[string,string]
+    replaces the residue IDs in the sequence with the residue numbers, and
+    converts the system assignments to match. Returns the old ID -> new ID
+    lookup table.
+    """
+    sequenceDictionary = {} # create the dictionary
+    for residue in repository.residues: # populate the dictionary and fix residue IDs
+        realAssignment = residue.get('nr')
+        caraAssignment = residue.get('id')
+        sequenceDictionary[caraAssignment] = realAssignment # create dictionary entry
+        residue.set('id',realAssignment) # change the residue ID
+    numAssigned = 0
+    for spinsystem in repository.systems:
+        oldAssignment = spinsystem.get('ass')
+        if oldAssignment:
+            newAssignment = sequenceDictionary[oldAssignment]
+            spinsystem.set('ass',newAssignment)
+            numAssigned = numAssigned + 1
+    numResidues = len(repository.residues)
+    repository.profiler.count(numResidues + len(repository.systems),numResidues + numAssigned)
+    repository.resetIndexes()
+    return sequenceDictionary
+
+# Function for determining where to start numbering unassigned systems.
+
+def locateUnassignedSystems(residueNumbers,numUnassigned):
+    """
+    locateUnassignedSystems: list of ints, int -> int
+    returns the first ID of the lowest block of numUnassigned IDs that
+    starts at 1 or just above a multiple of 1000 and holds no residue
+    number, so that unassigned systems never take the number of a residue.
+    If every residue number is below 1000, the block starts at 1001, as it
+    always has.
+    """
+    minimum = 1
+    if residueNumbers and max(residueNumbers) < 1000:
+        minimum = 1001
+    return IDAllocator(residueNumbers,minimum=minimum,align=1000).allocate(numUnassigned)
+
+def numberSystemsByAssignment(repository,log=stdout):
+    """
+    numberSystemsByAssignment: repository, file -> dict[string,string]
+    renumbers the spin systems so they match the residue number they are
+    assigned to. Unassigned systems are numbered in order above the assigned
+    ones. Links and spins are updated to the new system IDs. Returns the old
+    ID -> new ID lookup table.
+    """
+
+# Read the sequence and determine the assignments
+# Assignments within CARA are considered to start at 1,
+# so the sequence information provides a conversion from
+# the cara assignment to the real protein sequence.
+# The repository's residue index performs this conversion.
+
+    residueIndex = repository.residueIndex
+
+    realAssignments = repository.residueNumberIndex.keys()
+    realAssignments.sort()
+
+    print >>log, 'Real assignments run from %d to %d.'%(realAssignments[0],realAssignments[len(realAssignments)-1])
+
+# Read & count spin systems
+
+    spinsystems = repository.systems
+    numSystems = len(spinsystems)
+
+    print >>log, 'There are %d total systems.'%len(spinsystems)
+
+# Determine whether to start numbering unassigned systems at 1, 1001,
+# or some other number, avoiding every residue number.
+
+    numUnassigned = len([spinsystem for spinsystem in spinsystems if not spinsystem.get('ass')])
+    startUnassignedResidues = locateUnassignedSystems(realAssignments,numUnassigned) - 1
+    unassignedCounter = startUnassignedResidues
+    assignedCounter = 0
+
+    SysIDconverter = {}
+
+    for spinsystem in spinsystems:
+        caraAssignment = spinsystem.get('ass')
+        oldSysID = spinsystem.get('id')
+        if caraAssignment:
+            assignedCounter = assignedCounter + 1
+            realAssignment = residueIndex[int(caraAssignment)].get('nr')
+            SysIDconverter[oldSysID] = realAssignment
+            spinsystem.set('id',SysIDconverter[oldSysID])
+        else:
+            unassignedCounter = unassignedCounter + 1
+            print >>log, 'Unassigned: %d, %s'%(unassignedCounter, spinsystem.items())
+            SysIDconverter[oldSysID] = '%d'%unassignedCounter
+            spinsystem.set('id',SysIDconverter[oldSysID])
+
+    print >>log, 'Found %d assigned systems and %d unassigned systems.'%(assignedCounter, unassignedCounter-startUnassignedResidues)
+
+    links = repository.links
+
+    numlinks = 0
+
+    for link in links:
+        numlinks = numlinks + 1
+        oldpred = link.get('pred')
+        oldsucc = link.get('succ')
+        link.set('pred',SysIDconverter[oldpred])
+        link.set('succ',SysIDconverter[oldsucc])
+
+    print >>log, 'Converted %d system links.'%numlinks
+
+    spins = repository.spins
+
+    numspins = 0
+    numconverted = 0
+
+    for spin in spins:
+        numspins = numspins + 1
+        oldsys = spin.get('sys')
+        if oldsys:
+            spin.set('sys',SysIDconverter[oldsys])
+            numconverted = numconverted + 1
+        else:
+            print >>log, 'Warning: spin %s has no parent system. The parent system was probably deleted.'%spin.get('id')
+            print >>log, spin.items()
+            # note that the offending spin could be removed.
+
+    print >>log, 'Converted %d spins to have the correct parent system.'%numspins
+    repository.profiler.count(numSystems + numlinks + numspins,numSystems + numlinks + numconverted)
+    repository.resetIndexes()
+    return SysIDconverter
+
+def getSpinID(repository,system,tag):
+    """
+    getSpinID: repository, systemID, tag -> spinID
+    returns the ID of the proton spin with the given tag in a system, or
+    raises a KeyError if the system has no such proton.
+    """
+    return int(repository.spinTagIndex[(system,'H1',tag)].get('id'))
+
+def readUplPairs(repository,uplfiles,log=stdout,workers=1):
+    """
+    readUplPairs: repository, list of filenames, file, int -> (list of (spinID, spinID), dict[string,int])
+    reads CYANA UPL files, or the .upl files in directories, parsing them in
+    workers processes, and returns the spinlinks of their inter-residue
+    restraints that are not already in the repository, each once and in the
+    order of the files, as canonical pairs of spin IDs. The counts say how
+    many restraint lines were new, duplicates of a spinlink already in the
+    repository or earlier in the files, intraresidue, unresolved (naming a
+    proton that is not in the repository) or malformed. System numbers must
+    match residue numbers.
+    """
+    if isinstance(uplfiles,basestring):
+        uplfiles = [uplfiles]
+    counts = {'files': 0, 'lines': 0, 'added': 0, 'duplicate': 0, 'intraresidue': 0,
+              'unresolved': 0, 'malformed': 0}
+    existing = repository.pairIndex
+    seen = {}
+    keys = []
+    for uplfile, restraints, fileCounts, badLines in parseUplFiles(uplFiles(uplfiles),workers):
+        counts['files'] = counts['files'] + 1
+        for key in ('lines','duplicate','intraresidue','malformed'):
+            counts[key] = counts[key] + fileCounts[key]
+        for line in badLines:
+            print >>log, "Bad upl line in %s: "%uplfile,line
+        for restraint in restraints:
+            try:
+                (leftsys, lefttag), (rightsys, righttag) = restraint
+                key = canonicalPair(getSpinID(repository,leftsys,lefttag),
+                                    getSpinID(repository,rightsys,righttag))
+            except KeyError:
+                counts['unresolved'] = counts['unresolved'] + 1
+                print >>log, "Unresolved upl restraint in %s: %s"%(uplfile,restraintText(restraint))
+                continue
+            if key in existing or key in seen:
+                counts['duplicate'] = counts['duplicate'] + 1
+            else:
+                seen[key] = True
+                keys.append(key)
+                counts['added'] = counts['added'] + 1
+    return (keys, counts)
+
+def addSpinLinksFromUpl(repository,uplfiles,log=stdout,workers=1):
+    """
+    addSpinLinksFromUpl: repository, list of filenames, file, int -> int
+    adds a spinlink for every inter-residue restraint in CYANA UPL files, or
+    the .upl files in directories, that is not already in the repository,
+    all in one append, and prints how many lines were added, duplicate,
+    intraresidue, unresolved and malformed. A single filename may be given
+    instead of a list. Up to workers files are parsed at once. System
+    numbers must match residue numbers. Returns the number of spinlinks
+    added.
+    """
+    keys, counts = readUplPairs(repository,uplfiles,log,workers)
+    repository.addPairs(keys)
+    print >>log, ('%d UPL files: %d restraints, %d spinlinks added, %d duplicate, '
+                  '%d intraresidue, %d unresolved, %d malformed.'%(
+        counts['files'], counts['lines'], counts['added'], counts['duplicate'],
+        counts['intraresidue'], counts['unresolved'], counts['malformed']))
+    repository.profiler.count(counts['lines'],counts['added'])
+    return counts['added']
+
+def spinlinkRestraints(repository,spectrumIDs=None,counts=None):
+    """
+    spinlinkRestraints: repository, list of spectrumIDs, dict[string,int] -> iterator of (end, end)
+    walks the spinlinks in the order of the repository and yields the two
+    protons of each, smallest spin ID first, as (residue number, residue
+    type, tag), resolved through the spin, system and residue indexes. If
+    spectrumIDs are given, only spinlinks visible in at least one of those
+    spectra are yielded. Each spinlink is yielded once. If a counts dict is
+    given, the number of spinlinks, and of those written, hidden, duplicate
+    and unresolved (with a spin that is not an assigned proton) are kept in
+    it as the walk goes.
+    """
+    if counts is None:
+        counts = {}
+    for key in ('pairs','written','hidden','duplicate','unresolved'):
+        counts[key] = 0
+    ends = {} # spinID -> end, or None for a spin that cannot be resolved
+    seen = {}
+    for pair in repository.pairs:
+        counts['pairs'] = counts['pairs'] + 1
+        key = canonicalPair(int(pair.get('lhs')),int(pair.get('rhs')))
+        if key in seen:
+            counts['duplicate'] = counts['duplicate'] + 1
+            continue
+        seen[key] = True
+        if spectrumIDs:
+            index = instIndex(pair.findall('inst'))
+            for spectrumID in spectrumIDs:
+                if instVisible(index,spectrumID):
+                    break
+            else:
+                counts['hidden'] = counts['hidden'] + 1
+                continue
+        for spinID in key:
+            if spinID not in ends:
+                spin = repository.spinIndex.get(spinID)
+                residue = None
+                if spin is not None and spin.get('atom') == 'H1':
+                    residue = repository.spinResidue(spin)
+                if residue is None:
+                    ends[spinID] = None
+                else:
+                    ends[spinID] = (int(residue.get('nr')),residue.get('type'),spin.get('tag'))
+        left = ends[key[0]]
+        right = ends[key[1]]
+        if left is None or right is None:
+            counts['unresolved'] = counts['unresolved'] + 1
+            continue
+        counts['written'] = counts['written'] + 1
+        yield (left,right)
+
+def writeRestraints(repository,outfile,restraintFormat='upl',spectrumIDs=None,upper=5.0,lower=1.8):
+    """
+    writeRestraints: repository, file or filename, string, list of spectrumIDs, float, float -> dict[string,int]
+    writes a restraint between the protons of every spinlink, or of every
+    spinlink visible in one of the given spectra, to outfile in a format of
+    RESTRAINT_FORMATS ('upl' or 'xplor'), one line at a time as the
+    spinlinks are walked. Returns the counts of spinlinkRestraints().
+    """
+    formatLine = RESTRAINT_FORMATS[restraintFormat]
+    if hasattr(outfile,'write'):
+        output = outfile
+    else:
+        output = open(outfile,'w')
+    counts = {}
+    for left, right in spinlinkRestraints(repository,spectrumIDs,counts):
+        output.write(formatLine(left,right,upper,lower))
+    if output is not outfile:
+        output.close()
+    repository.profiler.count(counts['pairs'],counts['written'])
+    return counts
+
+def compactSpinLinks(repository):
+    """
+    compactSpinLinks: repository -> (int, int, int)
+    collapses the <inst> children of every spinlink to one per spectrum at
+    most, dropping those that repeat the default, without changing the
+    visibility of any spinlink in any spectrum. Returns the number of
+    spinlinks changed and the number of <inst> elements before and after.
+    """
+    pairs = repository.pairs
+    before = sum([len(pair.findall('inst')) for pair in pairs])
+    numChanged = VisibilityMatrix(pairs).writeBack(True)
+    after = sum([len(pair.findall('inst')) for pair in pairs])
+    repository.profiler.count(len(pairs)+before,numChanged)
+    return (numChanged,before,after)
+
+### Spinlinks from structures #############################################
+
+def structureTags(name):
+    """
+    structureTags: atom name -> list of tags
+    returns the tags a proton of a structure may have in the repository, in
+    the order to try them: its own name, H for HN, and the name without its
+    last digit for methyl protons, whose three atoms share one spin.
+    """
+    tags = [name]
+    if name == 'HN':
+        tags.append('H')
+    if name[-1:].isdigit():
+        tags.append(name[:-1])
+    return tags
+
+def readStructurePairs(repository,structurefile,cutoff=5.0,minModels=1,chain=None,offset=0,
+                       intraresidue=False,log=stdout,workers=1):
+    """
+    readStructurePairs: repository, filename, float, int, string, int, bool, file, int -> (list of (spinID, spinID), dict[string,int])
+    reads a PDB or mmCIF structure, maps its protons to spins through the
+    residue numbers and tags of the repository, and returns the spinlinks
+    between protons no further apart than cutoff in at least minModels
+    models that are not already in the repository, as canonical pairs of
+    spin IDs in order. Only atoms of chain are used if it is given, and
+    offset is added to the residue numbers of the structure. Models are
+    searched in workers processes. The counts say how many models, protons,
+    unresolved atoms (without a spin), contacts, and contacts that were too
+    rare, intraresidue, duplicate or added there were.
+    """
+    counts = {'models': 0, 'protons': 0, 'unresolved': 0, 'contacts': 0, 'rare': 0,
+              'intraresidue': 0, 'duplicate': 0, 'added': 0}
+    spinIDs = {} # (residue number, atom name) -> spinID or None
+    residueNumbers = {} # spinID -> residue number
+    models = []
+    for atoms in readStructure(structurefile):
+        points = []
+        for atomChain, number, name, x, y, z in atoms:
+            if chain is not None and atomChain != chain:
+                continue
+            number = number + offset
+            try:
+                spinID = spinIDs[(number,name)]
+            except KeyError:
+                spinID = None
+                residue = repository.residueNumberIndex.get(number)
+                if residue is not None:
+                    system = repository.assignmentIndex.get(int(residue.get('id')))
+                    if system is not None:
+                        for tag in structureTags(name):
+                            try:
+                                spinID = getSpinID(repository,int(system.get('id')),tag)
+                                break
+                            except KeyError:
+                                pass
+                if spinID is None:
+                    counts['unresolved'] = counts['unresolved'] + 1
+                    print >>log, "Unresolved atom in %s: residue %d %s"%(structurefile,number,name)
+                else:
+                    residueNumbers[spinID] = number
+                spinIDs[(number,name)] = spinID
+            counts['protons'] = counts['protons'] + 1
+            if spinID is not None:
+                points.append((spinID,x,y,z))
+        models.append(points)
+    counts['models'] = len(models)
+    contacts = ensembleContacts(models,cutoff,workers)
+    existing = repository.pairIndex
+    keys = []
+    found = contacts.keys()
+    found.sort()
+    for key in found:
+        counts['contacts'] = counts['contacts'] + 1
+        if contacts[key] < minModels:
+            counts['rare'] = counts['rare'] + 1
+        elif not intraresidue and residueNumbers[key[0]] == residueNumbers[key[1]]:
+            counts['intraresidue'] = counts['intraresidue'] + 1
+        elif key in existing:
+            counts['duplicate'] = counts['duplicate'] + 1
+        else:
+            keys.append(key)
+            counts['added'] = counts['added'] + 1
+    return (keys, counts)
+
+def addSpinLinksFromStructure(repository,structurefile,cutoff=5.0,minModels=1,chain=None,offset=0,
+                              intraresidue=False,log=stdout,workers=1):
+    """
+    addSpinLinksFromStructure: repository, filename, float, int, string, int, bool, file, int -> list of pair elements
+    adds a spinlink for every pair of protons of a structure found by
+    readStructurePairs(), all in one append, prints how many were added,
+    and returns the new pairs.
+    """
+    keys, counts = readStructurePairs(repository,structurefile,cutoff,minModels,chain,offset,
+                                      intraresidue,log,workers)
+    newpairs = repository.addPairs(keys)
+    print >>log, ('%d models, %d protons (%d unresolved atoms): %d contacts within %s A, '
+                  '%d spinlinks added, %d duplicate, %d intraresidue, %d in fewer than %d models.'%(
+        counts['models'], counts['protons'], counts['unresolved'], counts['contacts'], cutoff,
+        counts['added'], counts['duplicate'], counts['intraresidue'], counts['rare'], minModels))
+    repository.profiler.count(counts['protons'],counts['added'])
+    return newpairs
+
+### Merging duplicate spinlinks ##########################################
+
+# A record is the (visi, rate, code) that counts for one spectrum in one
+# <pair>: that of its <inst> for the spectrum, or else of its <inst> for
+# spectrum 0, or else DEFAULT_RECORD, as a spinlink without any <inst> is
+# visible everywhere. A merge policy chooses one record from those of all
+# the duplicates of a spinlink, given in the order of the repository.
+
+DEFAULT_RECORD = ('1', DEFAULT_RATE, DEFAULT_CODE)
+
+def effectiveRecord(index, spectrumID):
+    """
+    effectiveRecord: dict from instIndex(), spectrumID -> record
+    returns the record that counts for a spectrum, following spectrum 0 and
+    the default as instVisible() does.
+    """
+    inst = index.get(spectrumID)
+    if inst is None:
+        inst = index.get(0)
+    if inst is None:
+        return DEFAULT_RECORD
+    return (inst.get('visi','0'),inst.get('rate',DEFAULT_RATE),inst.get('code',DEFAULT_CODE))
+
+def lastRecord(records):
+    """lastRecord: list of records -> record, the one read last."""
+    return records[-1]
+
+def firstRecord(records):
+    """firstRecord: list of records -> record, the one read first."""
+    return records[0]
+
+def visibleRecord(records):
+    """visibleRecord: list of records -> record, the last visible one, else the last."""
+    visible = [record for record in records if record[0] == '1']
+    return (visible or records)[-1]
+
+def hiddenRecord(records):
+    """hiddenRecord: list of records -> record, the last hidden one, else the last."""
+    hidden = [record for record in records if record[0] != '1']
+    return (hidden or records)[-1]
+
+MERGE_POLICIES = {
+    'last': lastRecord,
+    'first': firstRecord,
+    'visible': visibleRecord,
+    'hidden': hiddenRecord,
+    }
+
+def mergeDuplicatePairs(repository,policy='last',log=None):
+    """
+    mergeDuplicatePairs: repository, string, file -> dict[string,int]
+    writes every spinlink smallest spin ID first and merges the spinlinks
+    that join the same two spins into the first of them. The merged
+    spinlink gets one <inst> per spectrum that any of the duplicates had,
+    and one for spectrum 0 unless the merged default is visible everywhere.
+    Each duplicate is compared on the record that counts for it in each
+    spectrum, inherited from spectrum 0 or the default where it has no
+    <inst> of its own, and where they disagree on visi, rate or code the
+    record is chosen by the named policy in MERGE_POLICIES. Each conflict is written to log, if
+    given. Returns the counts pairs, reversed, duplicates (pairs removed),
+    merged (spinlinks that had duplicates) and conflicts.
+    """
+    choose = MERGE_POLICIES[policy]
+    pairs = repository.pairs
+    counts = {'pairs': len(pairs), 'reversed': 0, 'duplicates': 0, 'merged': 0, 'conflicts': 0}
+    groups = {}
+    order = []
+    for pair in pairs:
+        lhs = pair.get('lhs')
+        rhs = pair.get('rhs')
+        key = canonicalPair(lhs,rhs)
+        if key != (int(lhs),int(rhs)):
+            pair.set('lhs','%d'%key[0])
+            pair.set('rhs','%d'%key[1])
+            counts['reversed'] = counts['reversed'] + 1
+        if key in groups:
+            groups[key].append(pair)
+        else:
+            groups[key] = [pair]
+            order.append(key)
+
+    removed = {}
+    for key in order:
+        group = groups[key]
+        if len(group) == 1:
+            continue
+        counts['merged'] = counts['merged'] + 1
+        counts['duplicates'] = counts['duplicates'] + len(group) - 1
+        indexes = [instIndex(pair.findall('inst')) for pair in group]
+        explicit = {} # spectrumID -> True, for the spectra any duplicate has an <inst> for
+        for index in indexes:
+            explicit.update(dict.fromkeys(index.keys(),True))
+        records = {} # spectrumID -> list of records
+        for spectrumID in explicit.keys() + [0]:
+            records[spectrumID] = [effectiveRecord(index,spectrumID) for index in indexes]
+        kept = group[0]
+        tail = None
+        for inst in kept.findall('inst'):
+            tail = tail or inst.tail
+            kept.remove(inst)
+        spectrumIDs = records.keys()
+        spectrumIDs.sort()
+        for spectrumID in spectrumIDs:
+            choices = records[spectrumID]
+            visi, rate, code = choose(choices)
+            if spectrumID == 0 and 0 not in explicit and (visi, rate, code) == DEFAULT_RECORD:
+                continue
+            distinct = {}
+            for record in choices:
+                distinct[record] = True
+            if len(distinct) > 1:
+                counts['conflicts'] = counts['conflicts'] + 1
+                if log is not None:
+                    print >>log, 'Conflict in spinlink %d-%d, spectrum %d: %s; kept visi=%s rate=%s code=%s.'%(
+                        key[0],key[1],spectrumID,
+                        ', '.join(['visi=%s rate=%s code=%s'%record for record in choices]),
+                        visi,rate,code)
+            child = ET.Element("inst")
+            child.attrib["spec"] = str(spectrumID)
+            child.attrib["rate"] = rate
+            child.attrib["code"] = code
+            child.attrib["visi"] = visi
+            child.tail = tail
+            kept.append(child)
+        for pair in group[1:]:
+            removed[id(pair)] = True
+
+    # Remove the duplicates in one pass over the spinbase, rather than one
+    # search of the spinbase per duplicate.
+
+    if removed:
+        spinbase = repository.spinbase
+        spinbase[:] = [child for child in spinbase if id(child) not in removed]
+        repository.resetIndexes()
+    repository.profiler.count(counts['pairs'],counts['reversed']+counts['duplicates']+counts['merged'])
+    return counts
+
+### Labeling schemes ######################################################
+
+def addScheme(repository,name):
+    """
+    addScheme: repository, string -> string
+    adds a labeling scheme to the library, with an ID one higher than the
+    highest existing scheme ID, and returns the new ID. A %s in name is
+    replaced by the ID.
+    """
+    library = repository.library
+    schemes = library.findall('scheme')
+    numSchemes = len(schemes)
+    if numSchemes > 0:
+        schemeIDs = [int(scheme.get('id')) for scheme in schemes]
+        schemeIDs.sort()
+        newIDnum = schemeIDs[numSchemes-1]+1
+        newID = '%d'%newIDnum
+    else:
+        newID = '1'
+    if '%s' in name:
+        name = name%newID
+    newscheme = SubElement(library,'scheme')
+    newscheme.attrib['id'] = newID
+    newscheme.attrib['name'] = name
+    return newID
+
+def labelAtoms(repository,schemeID,chooseIsotope):
+    """
+    labelAtoms: repository, string, function -> int
+    gives every atom of every residue type an isotope in a scheme.
+    chooseIsotope(residueType, atomName) returns the isotope, such as 'C12',
+    or None to leave the atom as it is. Returns the number of atoms changed.
+    """
+    numLabeled = 0
+    numAtoms = 0
+    for residueType in repository.library.findall('residue-type'):
+        atoms = residueType.findall('atom')
+        numAtoms = numAtoms + len(atoms)
+        for atom in atoms:
+            isotope = chooseIsotope(residueType,atom.get('name'))
+            if isotope:
+                newscheme = SubElement(atom,'scheme')
+                newscheme.attrib['id'] = schemeID
+                newscheme.attrib['type'] = isotope
+                numLabeled = numLabeled + 1
+    repository.profiler.count(numAtoms,numLabeled)
+    return numLabeled
+
+def schemeIsotopes(repository,schemeID):
+    """
+    schemeIsotopes: repository, string -> dict[(residueType, tag),isotope]
+    returns the isotope each atom of each residue type has in a labeling
+    scheme, such as 'H2' for a deuterated proton. The atoms of a methyl
+    group, such as HG21, are also given under the name of the group, HG2.
+    Raises a ValueError if the library has no such scheme.
+    """
+    if schemeID not in [scheme.get('id') for scheme in repository.library.findall('scheme')]:
+        raise ValueError,"There is no labeling scheme %s in the library."%schemeID
+    isotopes = {}
+    for residueType in repository.library.findall('residue-type'):
+        typeID = residueType.get('id')
+        for atom in residueType.findall('atom'):
+            for scheme in atom.findall('scheme'):
+                if scheme.get('id') == schemeID:
+                    name = atom.get('name')
+                    isotopes[(typeID,name)] = scheme.get('type')
+                    if name[-1:].isdigit():
+                        isotopes.setdefault((typeID,name[:-1]),scheme.get('type'))
+    return isotopes
+
+def hideLabeledSpinLinks(repository,pairs,schemeID,spectrumIDs):
+    """
+    hideLabeledSpinLinks: repository, list of pair elements, string, list of spectrumIDs -> int
+    hides the given spinlinks in the given spectra where either proton is
+    not a 1H in a labeling scheme, such as the deuterated side chains of a
+    DCN sample. Returns the number of spinlinks hidden.
+    """
+    isotopes = schemeIsotopes(repository,schemeID)
+    labeled = {}
+    for spin in repository.spins:
+        if spin.get('atom') == 'H1':
+            residue = repository.spinResidue(spin)
+            if residue is not None:
+                isotope = isotopes.get((residue.get('type'),spin.get('tag')),'H1')
+                labeled[int(spin.get('id'))] = isotope != 'H1'
+    matrix = VisibilityMatrix(pairs)
+    numbers = [number for number in range(len(pairs))
+               if labeled.get(int(pairs[number].get('lhs'))) or labeled.get(int(pairs[number].get('rhs')))]
+    matrix.hide(numbers,matrix.mask(spectrumIDs))
+    matrix.writeBack()
+    repository.profiler.count(len(pairs),len(numbers))
+    return len(numbers)
+
+def unlabeledIsotope(residueType,name):
+    """unlabeledIsotope: residue-type, atom name -> isotope, for 14N and 12C."""
+    if name[0] == 'N':
+        return 'N14'
+    elif name[0] == 'C':
+        return 'C12'
+    return None
+
+def deuteratedIsotope(residueType,name):
+    """deuteratedIsotope: residue-type, atom name -> isotope, for 2H on
+    everything but the amide proton."""
+    if name[0] == 'H' and name != 'H':
+        return 'H2'
+    return None
+
+def noesyILVIsotope(residueType,name):
+    """
+    noesyILVIsotope: residue-type, atom name -> isotope
+    for 12C and 2H everywhere except the amide proton and the methyl groups
+    of Ile and Leu (CD, HD) and Val (CG, HG).
+    """
+    methyl = {'I': 'D', 'L': 'D', 'V': 'G'}.get(residueType.get('letter'))
+    if methyl and name[1:2] == methyl:
+        return None
+    if name[0] == 'C':
+        return 'C12'
+    elif name[0] == 'H' and name != 'H':
+        return 'H2'
+    return None
+
+def addUnlabeledScheme(repository):
+    """addUnlabeledScheme: repository -> string, adds the 'unlabeled' scheme
+    with 14N and 12C, returning its ID."""
+    schemeID = addScheme(repository,'unlabeled%s')
+    labelAtoms(repository,schemeID,unlabeledIsotope)
+    return schemeID
+
+def addDCNScheme(repository):
+    """addDCNScheme: repository -> string, adds the 'DCN' scheme with 2H on
+    all non-amide protons, returning its ID."""
+    schemeID = addScheme(repository,'DCN')
+    labelAtoms(repository,schemeID,deuteratedIsotope)
+    return schemeID
+
+def addNoesyILV15NScheme(repository):
+    """addNoesyILV15NScheme: repository -> string, adds the 'ILVnoesy15N'
+    scheme with protonated Ile, Leu and Val methyls on a 12C, 2H
+    background, returning its ID."""
+    schemeID = addScheme(repository,'ILVnoesy15N-%s')
+    labelAtoms(repository,schemeID,noesyILVIsotope)
+    return schemeID
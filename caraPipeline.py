@@ -0,0 +1,275 @@
+#!/nmr/programs/python/bin/python2.5
+"""
+caraPipeline.py reads a CARA repository once, applies an ordered list of
+operations to it in memory, and writes the result once. This replaces
+running several scripts back to back, each of which would parse the XML and
+write an intermediate repository file.
+
+Each step is given as name or name:key=value,key=value, for example
+
+caraPipeline.py -i in.cara -o out.cara numberSystemsByAssignment \\
+    modifyResidueIDs shiftCarbons:shift=-2.5 shiftAmideNitrogens:shift=0.8 \\
+    addSpinLinksFromUpls:upl=cycle7.upl
+
+Use caraPipeline.py -h or caraPipeline.py --help to learn more about inputs,
+and caraPipeline.py --list to see the available operations.
+"""
+
+### Import some libraries #################################################
+
+from optparse import OptionParser # for parsing commandline input
+from sys import stdout, stderr, exit # for output to screen instead of to file, and the exit status
+from os.path import exists # for making sure not to overwrite files
+from caraRepository import CaraRepository # for reading and indexing the repository
+from caraProfile import Profiler # for the --profile option
+from caraValidate import validateRepository, reportSummary # for the --validate option
+import caraOperations # the operations themselves
+
+### Operations ############################################################
+
+# Each entry of OPERATIONS is a function taking the repository, a dict of
+# the step's arguments (all strings), and a log file.
+
+def isTrue(value):
+    """isTrue: string -> bool, for yes/no step arguments."""
+    return str(value).lower() in ('1','y','yes','true')
+
+def shiftStep(selectSpin):
+    """
+    shiftStep: function -> operation
+    returns an operation shifting the spins chosen by selectSpin by
+    shift=ppm, including aliases if aliases=yes.
+    """
+    def step(repository,arguments,log):
+        shiftChange = float(arguments['shift'])
+        alias = isTrue(arguments.get('aliases',False))
+        numChanged = caraOperations.shiftSpins(repository,selectSpin,
+                                               lambda shift: shift+shiftChange,alias)
+        print >>log, 'Shifted %d positions by %s ppm.'%(numChanged,shiftChange)
+    return step
+
+def numberSystemsStep(repository,arguments,log):
+    caraOperations.numberSystemsByAssignment(repository,log)
+
+def modifyResidueIDsStep(repository,arguments,log):
+    caraOperations.modifyResidueIDs(repository)
+    print >>log, 'Replaced residue IDs with residue numbers.'
+
+def addSpinLinksStep(repository,arguments,log):
+    caraOperations.addSpinLinksFromUpl(repository,arguments['upl'],log)
+
+def addStructureStep(repository,arguments,log):
+    newpairs = caraOperations.addSpinLinksFromStructure(repository,arguments['structure'],
+        float(arguments.get('cutoff',5.0)),int(arguments.get('models',1)),arguments.get('chain'),
+        int(arguments.get('offset',0)),isTrue(arguments.get('intraresidue',False)),log)
+    if 'scheme' in arguments:
+        spectrumIDs = [int(spectrumID) for spectrumID in arguments.get('hide','0').split('+')]
+        numHidden = caraOperations.hideLabeledSpinLinks(repository,newpairs,arguments['scheme'],spectrumIDs)
+        print >>log, 'Hid %d of %d new spinlinks for labeling scheme %s.'%(numHidden,len(newpairs),arguments['scheme'])
+
+def writeRestraintsStep(repository,arguments,log):
+    restraintFormat = arguments.get('format','upl')
+    if restraintFormat not in caraOperations.RESTRAINT_FORMATS:
+        raise ValueError,"Unknown restraint format \"%s\"."%restraintFormat
+    spectrumIDs = [int(spectrumID) for spectrumID in arguments.get('spectra','').split('+') if spectrumID]
+    counts = caraOperations.writeRestraints(repository,arguments['file'],restraintFormat,spectrumIDs,
+                                            float(arguments.get('upper',5.0)),float(arguments.get('lower',1.8)))
+    print >>log, 'Wrote %d restraints to %s, leaving out %d hidden, %d duplicate and %d unresolved spinlinks.'%(
+        counts['written'],arguments['file'],counts['hidden'],counts['duplicate'],counts['unresolved'])
+
+def compactSpinLinksStep(repository,arguments,log):
+    numChanged, before, after = caraOperations.compactSpinLinks(repository)
+    print >>log, 'Compacted %d spinlinks from %d to %d inst elements.'%(numChanged,before,after)
+
+def mergeSpinLinksStep(repository,arguments,log):
+    policy = arguments.get('policy','last')
+    if policy not in caraOperations.MERGE_POLICIES:
+        raise ValueError,"Unknown merge policy \"%s\"."%policy
+    counts = caraOperations.mergeDuplicatePairs(repository,policy,log)
+    print >>log, 'Merged %d duplicate spinlinks into %d, reversed %d, resolved %d conflicts by %s.'%(
+        counts['duplicates'],counts['merged'],counts['reversed'],counts['conflicts'],policy)
+
+def schemeStep(addScheme):
+    """
+    schemeStep: function -> operation
+    returns an operation adding a labeling scheme to the library with addScheme.
+    """
+    def step(repository,arguments,log):
+        schemeID = addScheme(repository)
+        print >>log, 'Added labeling scheme %s.'%schemeID
+    return step
+
+OPERATIONS = {
+    'numberSystemsByAssignment': numberSystemsStep,
+    'modifyResidueIDs': modifyResidueIDsStep,
+    'shiftCarbons': shiftStep(caraOperations.isCarbon),
+    'shiftAmideNitrogens': shiftStep(caraOperations.isAmideNitrogen),
+    'shiftAmideProtons': shiftStep(caraOperations.isAmideProton),
+    'addSpinLinksFromUpls': addSpinLinksStep,
+    'addSpinLinksFromStructure': addStructureStep,
+    'writeRestraints': writeRestraintsStep,
+    'compactSpinLinks': compactSpinLinksStep,
+    'mergeSpinLinks': mergeSpinLinksStep,
+    'addUnlabeledScheme': schemeStep(caraOperations.addUnlabeledScheme),
+    'addDCNScheme': schemeStep(caraOperations.addDCNScheme),
+    'addNoesyILV15NScheme': schemeStep(caraOperations.addNoesyILV15NScheme),
+    }
+
+USAGE = {
+    'numberSystemsByAssignment': 'numberSystemsByAssignment',
+    'modifyResidueIDs': 'modifyResidueIDs',
+    'shiftCarbons': 'shiftCarbons:shift=PPM[,aliases=yes]',
+    'shiftAmideNitrogens': 'shiftAmideNitrogens:shift=PPM[,aliases=yes]',
+    'shiftAmideProtons': 'shiftAmideProtons:shift=PPM[,aliases=yes]',
+    'addSpinLinksFromUpls': 'addSpinLinksFromUpls:upl=FILE-OR-DIRECTORY',
+    'addSpinLinksFromStructure': 'addSpinLinksFromStructure:structure=FILE[,cutoff=5.0,models=1,chain=A,offset=0,intraresidue=yes,scheme=ID,hide=ID+ID]',
+    'writeRestraints': 'writeRestraints:file=FILE[,format=upl|xplor,spectra=ID+ID,upper=5.0,lower=1.8]',
+    'compactSpinLinks': 'compactSpinLinks',
+    'mergeSpinLinks': 'mergeSpinLinks[:policy=last|first|visible|hidden]',
+    'addUnlabeledScheme': 'addUnlabeledScheme',
+    'addDCNScheme': 'addDCNScheme',
+    'addNoesyILV15NScheme': 'addNoesyILV15NScheme',
+    }
+
+# ARGUMENTS gives the required and the optional argument keys of each
+# operation, as shown in USAGE.
+
+ARGUMENTS = {
+    'numberSystemsByAssignment': ((), ()),
+    'modifyResidueIDs': ((), ()),
+    'shiftCarbons': (('shift',), ('aliases',)),
+    'shiftAmideNitrogens': (('shift',), ('aliases',)),
+    'shiftAmideProtons': (('shift',), ('aliases',)),
+    'addSpinLinksFromUpls': (('upl',), ()),
+    'addSpinLinksFromStructure': (('structure',), ('cutoff','models','chain','offset','intraresidue','scheme','hide')),
+    'writeRestraints': (('file',), ('format','spectra','upper','lower')),
+    'compactSpinLinks': ((), ()),
+    'mergeSpinLinks': ((), ('policy',)),
+    'addUnlabeledScheme': ((), ()),
+    'addDCNScheme': ((), ()),
+    'addNoesyILV15NScheme': ((), ()),
+    }
+
+### Helper functions ######################################################
+
+def parseStep(text):
+    """
+    parseStep: string -> (string, dict[string,string])
+    splits a step such as 'shiftCarbons:shift=1.2,aliases=yes' into the
+    operation name and its arguments. Raises a ValueError for an unknown
+    operation, a badly formed or unknown argument, or a missing required
+    argument.
+    """
+    if ':' in text:
+        name, argumentText = text.split(':',1)
+    else:
+        name, argumentText = text, ''
+    if name not in OPERATIONS:
+        raise ValueError,"Unknown operation \"%s\"."%name
+    arguments = {}
+    for item in argumentText.split(','):
+        if item:
+            if '=' not in item:
+                raise ValueError,"Argument \"%s\" of %s should look like key=value."%(item,name)
+            key, value = item.split('=',1)
+            arguments[key] = value
+    required, optional = ARGUMENTS[name]
+    for key in arguments.keys():
+        if key not in required and key not in optional:
+            raise ValueError,"Unknown argument \"%s\" of %s. Use it as %s."%(key,name,USAGE[name])
+    for key in required:
+        if key not in arguments:
+            raise ValueError,"%s needs the %s argument. Use it as %s."%(name,key,USAGE[name])
+    return (name, arguments)
+
+def runSteps(repository,steps,log=stdout):
+    """
+    runSteps: repository, list[(string, dict)], file -> void
+    applies each parsed step to the repository, in order.
+    """
+    for name, arguments in steps:
+        print >>log, '== %s'%name
+        OPERATIONS[name](repository,arguments,log)
+
+### Main body of the script ###############################################
+
+def main():
+    parser = OptionParser() # creates an instance of the parser
+    parser.usage = "%prog -i input.cara [-o output.cara] [-p project-name] step [step ...]"
+    parser.description = "%prog reads in a CARA repository, applies each step in order, and writes the repository once at the end."
+    parser.epilog = "Steps are written as name or name:key=value,key=value. Use --list to see the available operations."
+    parser.add_option("-i", "--input", dest="infile",type="string",default=None,
+                      help="name of original CARA repository, required.", metavar="FILE")
+    parser.add_option("-o", "--output", dest="outfile",type="string",default=None,
+                      help="name of new CARA repository, defaults to stdout.", metavar="FILE")
+    parser.add_option("-p", "--project", metavar="NAME", dest="project", default=None,type="string",
+                      help="name of project to alter, if there is more than one project in the repository, defaults to the first project.")
+    parser.add_option("-l", "--list", dest="list", action="store_true", default=False,
+                      help="list the available operations and exit.")
+    parser.add_option("--validate", dest="validate", action="store_true", default=False,
+                      help="check every reference in the repository first, as caraValidate.py does, and stop with exit status 1 if any is broken.")
+    parser.add_option("--profile", dest="profile", action="store_true", default=False,
+                      help="report the time and peak memory of each phase of the run, and the number of elements visited and modified, on stderr.")
+
+    # Now parse the command-line options
+    (options, args) = parser.parse_args()
+
+    infile = options.infile
+    outfile = options.outfile
+    projectName = options.project
+    profiler = Profiler(options.profile)
+
+    if options.list:
+        names = USAGE.keys()
+        names.sort()
+        for name in names:
+            print USAGE[name]
+        return
+
+    if infile == None:
+        parser.print_help()
+        parser.error("Please specify an input cara file.")
+
+    if not args:
+        parser.print_help()
+        parser.error("Please specify at least one step.")
+
+    # Check every step before doing any work, so that a typo in the last
+    # step does not waste a parse of the repository.
+
+    steps = []
+    for text in args:
+        try:
+            steps.append(parseStep(text))
+        except ValueError, e:
+            parser.error(str(e))
+
+    if outfile == None:
+        outfile = stdout
+        log = stderr
+    elif exists(outfile):
+        print '\nOutput file \'%s\' exists. Choose a new name to avoid overwriting.\n'%outfile
+        return
+    else:
+        log = stdout
+
+    if options.validate:
+        profiler.switch('validate')
+        try:
+            report = validateRepository(infile,projectName)
+        except NameError, e:
+            print >>log, '\n%s Try again.\n'%e
+            return
+        print >>log, reportSummary(report)
+        if not report['valid']:
+            print >>log, '\nThe repository has broken references, so no steps were run. Use caraValidate.py for the full report.\n'
+            exit(1)
+
+    repository = CaraRepository(infile,projectName,profiler=profiler)
+    profiler.switch('transform')
+    runSteps(repository,steps,log)
+    repository.write(outfile)
+    profiler.report()
+
+if __name__ == '__main__':
+    main()
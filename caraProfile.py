@@ -0,0 +1,138 @@
+"""
+caraProfile.py measures where a script spends its time. A Profiler keeps
+the wall-clock time spent in each phase of a run (parse, select, index,
+transform and serialize, or stream for scripts that rewrite while reading),
+the peak memory of the process at the end of each phase, and the number of
+elements visited and modified.
+
+Phases follow each other with switch(). A phase can also be entered from
+inside another one and left again, as CaraRepository does when an index is
+built in the middle of a transformation; the time spent inside is then only
+counted for the inner phase.
+
+Scripts create a Profiler from their --profile option, pass it to
+CaraRepository, and call report() at the end. A Profiler that is not enabled
+does nothing, so the calls can stay in place when profiling is off.
+"""
+
+### Import some libraries #################################################
+
+import sys # for the platform
+from sys import stderr # for the report, which must not mix with output on stdout
+import time # for timing phases
+try:
+    import resource # for peak memory, on unix
+except ImportError:
+    resource = None
+
+### Helper functions ######################################################
+
+def peakMemoryMB():
+    """Return the peak resident memory of this process so far in MB, or None."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak/1048576.0 # darwin reports bytes
+    return peak/1024.0
+
+def profilerFromArgv(argv):
+    """
+    profilerFromArgv: list of strings -> Profiler
+    returns a Profiler for scripts that read sys.argv directly. It is
+    enabled if --profile is among the arguments, which is then removed.
+    """
+    enabled = '--profile' in argv
+    while '--profile' in argv:
+        argv.remove('--profile')
+    return Profiler(enabled)
+
+### Profiler ##############################################################
+
+class Profiler(object):
+    """
+    Profiler collects the time and peak memory of each phase and the number
+    of elements visited and modified. It does nothing unless enabled.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.seconds = {}
+        self.memory = {}
+        self.order = []
+        self.stack = []
+        self.started = None
+        self.visited = 0
+        self.modified = 0
+
+    def charge(self, now):
+        """Add the time since the last change of phase to the current phase."""
+        phase = self.stack[-1]
+        if phase not in self.seconds:
+            self.seconds[phase] = 0.0
+            self.order.append(phase)
+        self.seconds[phase] = self.seconds[phase] + now - self.started
+        self.memory[phase] = peakMemoryMB()
+
+    def enter(self, phase):
+        """Start a phase inside the current one."""
+        if not self.enabled:
+            return
+        now = time.time()
+        if self.stack:
+            self.charge(now)
+        self.stack.append(phase)
+        self.started = now
+
+    def leave(self):
+        """End the current phase and go back to the one it was entered from."""
+        if not self.enabled or not self.stack:
+            return
+        now = time.time()
+        self.charge(now)
+        self.stack.pop()
+        self.started = now
+
+    def switch(self, phase):
+        """End the current phase, if any, and start the next one."""
+        if not self.enabled:
+            return
+        if self.stack and self.stack[-1] == phase:
+            return
+        self.leave()
+        self.enter(phase)
+
+    def stop(self):
+        """End every phase."""
+        while self.enabled and self.stack:
+            self.leave()
+
+    def count(self, visited=0, modified=0):
+        """Add to the number of elements visited and modified."""
+        if self.enabled:
+            self.visited = self.visited + visited
+            self.modified = self.modified + modified
+
+    def report(self, log=stderr):
+        """
+        report: file -> void
+        ends every phase and prints the time and peak memory of each,
+        followed by the element counts. Peak memory is that of the whole
+        process at the end of the phase.
+        """
+        if not self.enabled:
+            return
+        self.stop()
+        print >>log, 'Profile:'
+        print >>log, '  %-10s %10s %12s'%('phase', 'seconds', 'peak MB')
+        total = 0.0
+        for phase in self.order:
+            total = total + self.seconds[phase]
+            memory = self.memory[phase]
+            if memory is None:
+                memory = '-'
+            else:
+                memory = '%.1f'%memory
+            print >>log, '  %-10s %10.3f %12s'%(phase, self.seconds[phase], memory)
+        print >>log, '  %-10s %10.3f'%('total', total)
+        print >>log, '  %d elements visited, %d modified.'%(self.visited, self.modified)
@@ -0,0 +1,363 @@
+#!/nmr/programs/python/bin/python2.5
+"""
+caraProtection.py turns a time series of Sparky peak lists from HSQC
+spectra recorded in D2O into rules for hideSpinLinks.py. An amide that
+still gives a peak at a time point is protected from exchange then, so
+spinlinks to its proton are kept in the spectra recorded at that time.
+
+Each time point is a peak list, bound to the spectra it applies to and
+optionally given an intensity threshold, written as
+list:spectra=ID+ID[,threshold=HEIGHT][,name=NAME], for example
+
+caraProtection.py -o protection.ini halfday.list:spectra=174,threshold=100000 \\
+    month.list:spectra=194
+
+For each time point the exchangeable rule of the base rules file (by
+default hideSpinLinks.ini) is copied, with its exempt residues replaced by
+the residues protected at that time point and its spectra by the ones the
+time point is bound to. The other rules are copied unchanged. Use the result
+with hideSpinLinks.py -r protection.ini.
+
+The peak lists are read in parallel worker processes where the
+multiprocessing module is available (python 2.6 or above), and kept in the
+cache of caraCache.py, so that trying other thresholds does not read them
+again. Residue numbers in the peak lists are used as residue IDs, as the
+lists in hideSpinLinks.py were, unless a repository is given with -i to look
+up the ID of each residue number.
+
+Use caraProtection.py -h or caraProtection.py --help to learn more about inputs.
+"""
+
+### Import some libraries #################################################
+
+from optparse import OptionParser # for parsing commandline input
+import os # for naming time points and cache entries
+import re # for reading Sparky assignments
+import marshal # for the cache entries
+from ConfigParser import RawConfigParser # for reading the base rules
+from caraCache import cacheDirectory, entryName, storeTables, evict # for caching peak lists
+from caraRules import defaultRulesFile, splitList # for the rules files
+try:
+    import multiprocessing # for reading several peak lists at once
+except ImportError:
+    multiprocessing = None
+
+### Data Definitions ######################################################
+
+# peaks is a list of (residue number, height), one per amide peak, with
+# height None if the peak list has no Data Height column.
+# A time point is a dict with the keys list (the peak list's filename),
+# name, spectra (a list of spectrum IDs) and threshold (a float or None).
+
+# Sparky names amide peaks like G12N-H or G12N-HN.
+amidePattern = re.compile(r'^[A-Za-z]*(\d+)N-HN?$')
+
+# Cache entries of peak lists are only used with the same format and an
+# unchanged file.
+FORMAT = ('cara-peaks', 1)
+
+### Reading peak lists ####################################################
+
+def parsePeakList(filename):
+    """
+    parsePeakList: filename -> peaks
+    reads the amide peaks of a Sparky peak list. Peaks with other
+    assignments, or none, are left out.
+    """
+    peaks = []
+    heightColumn = None
+    openfile = open(filename, 'r')
+    for line in openfile:
+        columns = line.split()
+        if not columns:
+            continue
+        if columns[0] == 'Assignment':
+            header = ' '.join(columns).replace('Data Height', 'Data-Height').split()
+            if 'Data-Height' in header:
+                heightColumn = header.index('Data-Height')
+            continue
+        match = amidePattern.match(columns[0])
+        if match is None:
+            continue
+        height = None
+        if heightColumn is not None and heightColumn < len(columns):
+            height = float(columns[heightColumn])
+        peaks.append((int(match.group(1)), height))
+    openfile.close()
+    return peaks
+
+def loadPeaks(filename, cacheDir=None):
+    """
+    loadPeaks: filename, directory -> peaks
+    returns the amide peaks of a Sparky peak list, from the cache if the
+    list has not changed since it was last read.
+    """
+    if cacheDir is None:
+        cacheDir = cacheDirectory()
+    entry = entryName(filename, cacheDir, '.peaks')
+    status = os.stat(filename)
+    header = (FORMAT, status.st_size, status.st_mtime)
+    if os.path.exists(entry):
+        try:
+            openfile = open(entry, 'rb')
+            storedHeader = marshal.load(openfile)
+            if storedHeader == header:
+                peaks = marshal.load(openfile)
+                openfile.close()
+                os.utime(entry, None) # mark the entry as recently used
+                return peaks
+            openfile.close()
+        except (EOFError, ValueError, TypeError):
+            pass # a damaged entry is simply replaced
+    peaks = parsePeakList(filename)
+    storeTables(entry, header, peaks)
+    return peaks
+
+def loadPeaksJob(job):
+    """loadPeaksJob: (filename, directory) -> peaks, for the worker processes."""
+    return loadPeaks(job[0], job[1])
+
+def loadAllPeaks(filenames, workers=1, cacheDir=None):
+    """
+    loadAllPeaks: list of filenames, int, directory -> list of peaks
+    reads the peak lists, in a pool of worker processes if workers is more
+    than 1, returning their peaks in the order of the files.
+    """
+    if cacheDir is None:
+        cacheDir = cacheDirectory()
+    jobs = [(filename, cacheDir) for filename in filenames]
+    if workers > 1 and multiprocessing is not None and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        try:
+            results = pool.map(loadPeaksJob, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(loadPeaksJob, jobs)
+    evict(cacheDir)
+    return results
+
+def protectedResidues(peaks, threshold=None):
+    """
+    protectedResidues: peaks, float -> frozenset of residue numbers
+    returns the residues with an amide peak at least as high as threshold,
+    or with any amide peak if threshold is None. Raises a ValueError if a
+    threshold is given for a peak list without heights.
+    """
+    if threshold is None:
+        return frozenset([number for (number, height) in peaks])
+    for number, height in peaks:
+        if height is None:
+            raise ValueError, "There are no peak heights to compare with the threshold."
+    return frozenset([number for (number, height) in peaks if abs(height) >= threshold])
+
+### Writing rules #########################################################
+
+def parseTimePoint(text):
+    """
+    parseTimePoint: string -> time point
+    splits a time point such as 'halfday.list:spectra=174+194,threshold=1e5'
+    into its parts. Raises a ValueError if it is badly formed or has no
+    spectra.
+    """
+    if ':' in text:
+        filename, argumentText = text.split(':', 1)
+    else:
+        filename, argumentText = text, ''
+    arguments = {}
+    for item in argumentText.split(','):
+        if item:
+            if '=' not in item:
+                raise ValueError, "Argument \"%s\" of %s should look like key=value."%(item, filename)
+            key, value = item.split('=', 1)
+            arguments[key] = value
+    for key in arguments:
+        if key not in ('spectra', 'threshold', 'name'):
+            raise ValueError, "Unknown argument \"%s\" of %s."%(key, filename)
+    if not arguments.get('spectra'):
+        raise ValueError, "Please give the spectra of %s, as %s:spectra=ID+ID."%(filename, filename)
+    point = {'list': filename,
+             'name': arguments.get('name') or os.path.splitext(os.path.basename(filename))[0],
+             'spectra': [int(spectrumID) for spectrumID in arguments['spectra'].split('+')],
+             'threshold': None}
+    if arguments.get('threshold'):
+        point['threshold'] = float(arguments['threshold'])
+    return point
+
+def formatIDs(ids):
+    """
+    formatIDs: collection of ints -> string
+    writes IDs in order, runs of consecutive IDs as ranges such as 1299-1307,
+    wrapped onto continuation lines for the rules file.
+    """
+    ids = list(ids)
+    ids.sort()
+    items = []
+    index = 0
+    while index < len(ids):
+        last = index
+        while last + 1 < len(ids) and ids[last + 1] == ids[last] + 1:
+            last = last + 1
+        if last == index:
+            items.append('%d'%ids[index])
+        else:
+            items.append('%d-%d'%(ids[index], ids[last]))
+        index = last + 1
+    lines = []
+    line = ''
+    for item in items:
+        if line and len(line) + len(item) > 60:
+            lines.append(line)
+            line = item
+        elif line:
+            line = line + ' ' + item
+        else:
+            line = item
+    lines.append(line)
+    return '\n'.join(lines)
+
+def writeSection(openfile, name, options):
+    """writeSection: file, string, list of (key, value) -> void, in INI form."""
+    print >>openfile, '[%s]'%name
+    for key, value in options:
+        print >>openfile, ('%s = %s'%(key, value.replace('\n', '\n    '))).rstrip()
+    print >>openfile
+
+def writeProtectionRules(openfile, baseRules, ruleName, points, protected):
+    """
+    writeProtectionRules: file, filename, string, list of time points, list of sets -> void
+    writes a rules file in which the rule ruleName of the base rules file is
+    replaced by one copy per time point, exempting the residues protected
+    at that time point and hiding spinlinks in its spectra. Raises a
+    ValueError if the base rules file has no such rule.
+    """
+    parser = RawConfigParser()
+    if not parser.read(baseRules):
+        raise ValueError, "Cannot read rules file \"%s\"."%baseRules
+    if not parser.has_section(ruleName):
+        raise ValueError, "There is no rule named \"%s\" in \"%s\"."%(ruleName, baseRules)
+    baseOptions = parser.items(ruleName)
+    label = parser.has_option(ruleName, 'label') and parser.get(ruleName, 'label') or ruleName
+
+    names = []
+    apply = []
+    for name in splitList(parser.get('rules', 'apply')):
+        if name == ruleName:
+            names = ['%s-%s'%(ruleName, point['name']) for point in points]
+            apply.extend(names)
+        else:
+            apply.append(name)
+
+    print >>openfile, '# Rules written by caraProtection.py from %s and the peak lists'%baseRules
+    for point in points:
+        threshold = point['threshold']
+        if threshold is None:
+            print >>openfile, '#   %s'%point['list']
+        else:
+            print >>openfile, '#   %s, peaks of at least %g'%(point['list'], threshold)
+    print >>openfile
+    writeSection(openfile, 'rules', [('apply', ' '.join(apply))])
+    for name, point, residues in zip(names, points, protected):
+        options = [('label', '%s (%s)'%(label, point['name']))]
+        for key, value in baseOptions:
+            if key not in ('label', 'except-residues', 'hide', 'show'):
+                options.append((key, value))
+        options.append(('except-residues', formatIDs(residues)))
+        options.append(('hide', ' '.join(['%d'%spectrumID for spectrumID in point['spectra']])))
+        writeSection(openfile, name, options)
+    for section in parser.sections():
+        if section not in ('rules', ruleName):
+            writeSection(openfile, section, parser.items(section))
+
+### Main body of the script ###############################################
+
+def main():
+    parser = OptionParser() # creates an instance of the parser
+    parser.usage = "%prog -o rules.ini [-i input.cara] [-b base.ini] list:spectra=ID[+ID...][,threshold=HEIGHT][,name=NAME] ..."
+    parser.description = "%prog reads a time series of Sparky peak lists from HSQC spectra recorded in D2O and writes hideSpinLinks.py rules that keep spinlinks to protected amide protons in the spectra of each time point."
+    parser.epilog = ""
+    parser.add_option("-o", "--output", dest="outfile",type="string",default=None,
+                      help="name of new rules file, required.", metavar="FILE")
+    parser.add_option("-b", "--base", dest="base",type="string",default=defaultRulesFile('hideSpinLinks'),
+                      help="rules file to start from, defaults to %default.", metavar="FILE")
+    parser.add_option("-r", "--rule", dest="rule",type="string",default='exchangeable',
+                      help="name of the rule in the base rules file to copy for each time point, defaults to %default.")
+    parser.add_option("-t", "--threshold", dest="threshold",type="float",default=None,
+                      help="least peak height for an amide to count as protected, for time points without their own threshold; defaults to any peak.")
+    parser.add_option("-i", "--input", dest="infile",type="string",default=None,
+                      help="CARA repository in which to look up the residue ID of each residue number, by default the numbers are used as IDs.", metavar="FILE")
+    parser.add_option("-p", "--project", metavar="NAME", dest="project", default=None,type="string",
+                      help="name of project in the repository, defaults to the first project.")
+    parser.add_option("-j", "--jobs", dest="workers",type="int",default=None,
+                      help="number of peak lists to read at once, defaults to the number of CPUs.")
+
+    # Now parse the command-line options
+    (options, args) = parser.parse_args()
+
+    if options.outfile == None:
+        parser.print_help()
+        parser.error("Please specify an output rules file.")
+
+    if not args:
+        parser.print_help()
+        parser.error("Please specify at least one peak list.")
+
+    points = []
+    for text in args:
+        try:
+            point = parseTimePoint(text)
+        except ValueError, e:
+            parser.error(str(e))
+        if point['threshold'] is None:
+            point['threshold'] = options.threshold
+        points.append(point)
+
+    if os.path.exists(options.outfile):
+        print '\nOutput file \'%s\' exists. Choose a new name to avoid overwriting.\n'%options.outfile
+        return
+
+    workers = options.workers
+    if workers == None:
+        if multiprocessing is not None:
+            workers = multiprocessing.cpu_count()
+        else:
+            workers = 1
+
+    allPeaks = loadAllPeaks([point['list'] for point in points], workers)
+
+    residueIDs = None
+    if options.infile:
+        from caraRepository import CaraRepository # only needed to look up residue IDs
+        repository = CaraRepository(options.infile, options.project)
+        residueIDs = {}
+        for number, residue in repository.residueNumberIndex.items():
+            residueIDs[number] = int(residue.get('id'))
+
+    protected = []
+    for point, peaks in zip(points, allPeaks):
+        try:
+            residues = protectedResidues(peaks, point['threshold'])
+        except ValueError, e:
+            parser.error('%s: %s'%(point['list'], e))
+        if residueIDs is not None:
+            missing = [number for number in residues if number not in residueIDs]
+            if missing:
+                missing.sort()
+                print '%s: no residue numbered %s in the repository.'%(point['list'], ', '.join(['%d'%number for number in missing]))
+            residues = frozenset([residueIDs[number] for number in residues if number in residueIDs])
+        protected.append(residues)
+        print '%s: %d amide peaks, %d protected residues, spectra %s.'%(
+            point['name'], len(peaks), len(residues), ', '.join(['%d'%spectrumID for spectrumID in point['spectra']]))
+
+    openfile = open(options.outfile, 'w')
+    try:
+        writeProtectionRules(openfile, options.base, options.rule, points, protected)
+    except ValueError, e:
+        openfile.close()
+        os.remove(options.outfile)
+        parser.error(str(e))
+    openfile.close()
+
+if __name__ == '__main__':
+    main()
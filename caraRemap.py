@@ -0,0 +1,379 @@
+#!/nmr/programs/python/bin/python2.5
+"""
+caraRemap.py changes the IDs of spins, spin systems, spectra and residues
+in a CARA repository, and every attribute that refers to them, in one copy
+of the file. Each kind of ID is given a mapping function, which is called
+once for every element of that kind to build a lookup table of old ID ->
+new ID before anything is written. The tables are then spliced into a copy
+of the file (see caraSplice.py), rewriting
+
+  spins     spin id, pair lhs and rhs
+  systems   spinsys id, spin sys, link pred and succ
+  spectra   spectrum id, pos spec (aliases), inst spec (spinlink visibility)
+  residues  residue id, spinsys ass
+  peaklists peaklist id
+
+and, in every peaklist of the project, the spectrum the peaklist belongs
+to, the spectra of the peak positions, the spins assigned to each peak and
+the system a peak is labelled with
+(see PEAKLIST_ELEMENTS for the format assumed). Several renumberings, such
+as numbering the systems by assignment and moving the spins and spectra out
+of the way of another repository, thus cost one read of the IDs and one
+copy of the file instead of a parse and a write each, and the peaklists no
+longer have to be fixed by hand in CARA afterwards. Spectrum 0, which stands for every spectrum in aliases and spinlinks,
+is never changed. A remap that would give two elements of a kind the same
+ID is refused before anything is written.
+
+A mapping function takes the old ID (an integer), the attributes of the
+element and the Catalog of the repository, and returns the new ID, or None
+to keep the old one. They are called in the order of the file.
+
+Used as a script, caraRemap.py offers the remaps of add10000toSpinIDsWithPairs.py,
+add1000toSpectrumIDsWithAliases.py, RenumberCaraSystems.py,
+NumberCaraSystemsByAssignment.py and ModifyCARAresidueIDs.py as options that
+can be combined. Use caraRemap.py -h or caraRemap.py --help to learn more
+about inputs.
+"""
+
+### Import some libraries #################################################
+
+from optparse import OptionParser # for parsing commandline input
+import re # for finding system IDs in peak labels
+from os.path import exists # for making sure not to overwrite files
+from caraSplice import spliceRewrite # for reading and rewriting attributes in one pass
+from caraOperations import locateUnassignedSystems # for numbering unassigned systems
+from caraProfile import Profiler # for the --profile option
+
+### Data Definitions ######################################################
+
+# KINDS are the kinds of ID that can be remapped.
+KINDS = ('spin', 'system', 'spectrum', 'residue', 'peaklist')
+
+# ELEMENTS gives, for each kind, the (tag, parent tag) of the elements that
+# carry an ID of that kind in their id attribute.
+ELEMENTS = {
+    'spin': ('spin', 'spinbase'),
+    'system': ('spinsys', 'spinbase'),
+    'spectrum': ('spectrum', 'project'),
+    'residue': ('residue', 'sequence'),
+    'peaklist': ('peaklist', 'project'),
+    }
+
+# REFERENCES gives, for each (tag, parent tag), the attributes that hold an
+# ID and the kind of that ID; * stands for every attribute.
+REFERENCES = {
+    ('spin', 'spinbase'): (('id', 'spin'), ('sys', 'system')),
+    ('pair', 'spinbase'): (('lhs', 'spin'), ('rhs', 'spin')),
+    ('spinsys', 'spinbase'): (('id', 'system'), ('ass', 'residue')),
+    ('link', 'spinbase'): (('pred', 'system'), ('succ', 'system')),
+    ('pos', 'spin'): (('spec', 'spectrum'),),
+    ('inst', 'pair'): (('spec', 'spectrum'),),
+    ('spectrum', 'project'): (('id', 'spectrum'),),
+    ('residue', 'sequence'): (('id', 'residue'),),
+    ('peaklist', 'project'): (('id', 'peaklist'), ('home', 'spectrum')),
+    ('pos', 'peak'): (('spec', 'spectrum'),),
+    ('ass', 'peak'): (('*', 'spin'),),
+    }
+
+# PEAKLIST_ELEMENTS are the (tag, parent tag) of the elements of peaklists,
+# which are assumed to be written as
+#   <peaklist id='3' name='N15-NOESY' home='174'>
+#   <peak id='1' tag='1023 HN' ...>
+#   <pos spec='0' x0='8.120' x1='120.500' x2='4.200'/>
+#   <ass x0='37' x1='1979' x2='38'/>
+#   </peak>
+#   </peaklist>
+# where home and the spec of <pos> are spectrum IDs, with 0 for the
+# position in every spectrum without one of its own, and every attribute
+# of <ass> (one per dimension) is a spin ID, with 0 for an unassigned
+# dimension. A tag that is a system ID alone, or a system ID, one space
+# and a spin tag in capitals, as in '1023' or '1023 HN', is the label CARA
+# gives the peaks it picks from spin systems. Any other tag, such as
+# '12 ambiguous', was typed in and is left alone, as are labels with the
+# ID of a system that is not remapped. LABELS gives, for each (tag, parent
+# tag), the attribute holding such a label and the kind of the ID in it.
+PEAKLIST_ELEMENTS = (('peaklist', 'project'), ('peak', 'peaklist'), ('pos', 'peak'), ('ass', 'peak'))
+LABELS = {
+    ('peak', 'peaklist'): ('tag', 'system'),
+    }
+labelPattern = re.compile(r"^(\d+)( [A-Z][A-Z0-9'*#]*)?$")
+
+### Helper functions ######################################################
+
+class Discard(object):
+    """A file that throws away everything written to it."""
+    def write(self, data):
+        pass
+
+class Catalog(object):
+    """
+    Catalog holds the IDs and attributes of the elements of the kinds that
+    are read from a repository, in the order of the file:
+    records[kind] is a list of (ID, attribute dict), with integer IDs.
+    residueNumbers is a dict[residueID,residue number] of every residue,
+    and project the name of the project they were read from.
+    """
+
+    def __init__(self):
+        self.records = {}
+        self.residueNumbers = {}
+        self.project = None
+
+    def count(self, kind):
+        """count: kind -> int, the number of elements of a kind that were read."""
+        return len(self.records.get(kind, ()))
+
+def readCatalog(infile, kinds, projectName=None, projectNumber=None):
+    """
+    readCatalog: filename, list of kinds, string, int -> (Catalog, string, int)
+    reads the IDs and attributes of the elements of the given kinds, and the
+    residue numbers, from the selected project, without writing anything.
+    Returns the catalog, the name of the selected project, which is None if
+    there was no such project, and the number of projects.
+    """
+    catalog = Catalog()
+    wanted = {}
+    for kind in kinds:
+        catalog.records[kind] = []
+        wanted[ELEMENTS[kind]] = catalog.records[kind]
+    def collect(tag, attrs, ancestors):
+        key = (tag, ancestors[-1][0])
+        if key in wanted and 'id' in attrs:
+            wanted[key].append((int(attrs['id']), attrs))
+        if key == ELEMENTS['residue'] and 'nr' in attrs:
+            catalog.residueNumbers[int(attrs['id'])] = int(attrs['nr'])
+        return None
+    numChanged, selected, numProjects = spliceRewrite(infile, Discard(), collect, projectName, projectNumber)
+    catalog.project = selected
+    return (catalog, selected, numProjects)
+
+def buildRemaps(catalog, mappings):
+    """
+    buildRemaps: Catalog, dict[kind,mapping function] -> dict[kind,dict[string,string]]
+    calls the mapping function of each kind once for every element of that
+    kind, and returns the old ID -> new ID tables, as strings, holding only
+    the IDs that change. Raises a ValueError if two elements of a kind would
+    end up with the same ID.
+    """
+    remaps = {}
+    for kind in KINDS:
+        if kind not in mappings:
+            continue
+        remap = {}
+        taken = {}
+        for oldID, attrs in catalog.records[kind]:
+            newID = mappings[kind](oldID, attrs, catalog)
+            if newID is None:
+                newID = oldID
+            if newID in taken:
+                raise ValueError, "The %s IDs %d and %d would both become %d."%(kind, taken[newID], oldID, newID)
+            taken[newID] = oldID
+            if newID != oldID:
+                remap['%d'%oldID] = '%d'%newID
+        remaps[kind] = remap
+    return remaps
+
+def idRewriter(remaps, counts):
+    """
+    idRewriter: dict[kind,remap], dict[kind,int] -> function
+    returns a rewriteAttributes function for spliceRewrite() that replaces
+    every ID attribute in REFERENCES, and every ID at the start of a label
+    in LABELS, that has an entry in the remap of its kind. A remap is a
+    dict[string,string] of old ID -> new ID, or anything else with a get
+    method. The number of attributes changed for each kind, and under
+    'peak' the number of peaklist elements changed, are added to counts.
+    """
+    def rewrite(tag, attrs, ancestors):
+        key = (tag, ancestors[-1][0])
+        changes = {}
+        for name, kind in REFERENCES.get(key, ()):
+            remap = remaps.get(kind)
+            if not remap:
+                continue
+            if name == '*':
+                names = attrs.keys()
+            else:
+                names = [name]
+            for name in names:
+                newID = remap.get(attrs.get(name))
+                if newID is not None:
+                    changes[name] = newID
+                    counts[kind] = counts[kind] + 1
+        if key in LABELS:
+            name, kind = LABELS[key]
+            match = labelPattern.match(attrs.get(name, ''))
+            if match and remaps.get(kind):
+                newID = remaps[kind].get(match.group(1))
+                if newID is not None:
+                    changes[name] = newID + (match.group(2) or '')
+                    counts[kind] = counts[kind] + 1
+        if changes and key in PEAKLIST_ELEMENTS:
+            counts['peak'] = counts['peak'] + 1
+        return changes
+    return rewrite
+
+def rewriteIDs(infile, outfile, remaps, projectName=None, projectNumber=None):
+    """
+    rewriteIDs: filename, filename or file, dict[kind,dict[string,string]], string, int -> (dict[kind,int], string, int)
+    copies the repository to outfile, rewriting the IDs in remaps with
+    idRewriter(). Returns the number of attributes changed for each kind,
+    and under 'peak' the number of peaklist elements changed, the name of
+    the selected project, which is None if there was no such project, and
+    the number of projects.
+    """
+    counts = {'peak': 0}
+    for kind in KINDS:
+        counts[kind] = 0
+    numChanged, selected, numProjects = spliceRewrite(infile, outfile, idRewriter(remaps, counts), projectName, projectNumber)
+    return (counts, selected, numProjects)
+
+def remapRepository(infile, outfile, mappings, projectName=None, projectNumber=None):
+    """
+    remapRepository: filename, filename or file, dict[kind,mapping function], string, int -> (Catalog, dict[kind,int])
+    remaps the IDs of the kinds in mappings with readCatalog(),
+    buildRemaps() and rewriteIDs(). Returns the catalog and the number of
+    attributes changed for each kind. Raises a NameError if there is no such
+    project and a ValueError if the remap is not one to one, in both cases
+    before anything is written.
+    """
+    kinds = [kind for kind in KINDS if kind in mappings]
+    catalog, selected, numProjects = readCatalog(infile, kinds, projectName, projectNumber)
+    if selected is None:
+        if projectName:
+            raise NameError, "There is no project named \"%s\"."%projectName
+        raise NameError, "You requested project number %d, but there are only %d projects in this repository."%(
+            (projectNumber or 0) + 1, numProjects)
+    remaps = buildRemaps(catalog, mappings)
+    counts, selected, numProjects = rewriteIDs(infile, outfile, remaps, projectName, projectNumber)
+    return (catalog, counts)
+
+### Mapping functions #####################################################
+
+def offsetIDs(offset):
+    """offsetIDs: int -> mapping function, adding offset to every ID."""
+    def mapID(oldID, attrs, catalog):
+        return oldID + offset
+    return mapID
+
+def inOrder(start=1):
+    """
+    inOrder: int -> mapping function
+    numbers the elements in the order of the file, from start, with no gaps.
+    """
+    state = {'next': start}
+    def mapID(oldID, attrs, catalog):
+        newID = state['next']
+        state['next'] = newID + 1
+        return newID
+    return mapID
+
+def systemsByAssignment(log=None):
+    """
+    systemsByAssignment: file -> mapping function
+    numbers each assigned system with the number of its residue, and the
+    unassigned ones in order in the lowest block, starting at 1 or just
+    above a multiple of 1000, that holds no residue number. The range of
+    residue numbers, the number of systems and each unassigned system are
+    written to log if one is given.
+    """
+    state = {}
+    def mapID(oldID, attrs, catalog):
+        if not state:
+            numUnassigned = len([1 for systemID, systemAttrs in catalog.records['system'] if not systemAttrs.get('ass')])
+            state['next'] = locateUnassignedSystems(catalog.residueNumbers.values(), numUnassigned)
+            if log is not None:
+                if catalog.residueNumbers:
+                    print >>log, 'Real assignments run from %d to %d.'%(
+                        min(catalog.residueNumbers.values()), max(catalog.residueNumbers.values()))
+                print >>log, 'There are %d total systems.'%catalog.count('system')
+        assignment = attrs.get('ass')
+        if assignment:
+            return catalog.residueNumbers[int(assignment)]
+        newID = state['next']
+        state['next'] = newID + 1
+        if log is not None:
+            print >>log, 'Unassigned: %d, %s'%(newID, [(str(key), str(value)) for key, value in attrs.items()])
+        return newID
+    return mapID
+
+def residuesByNumber(oldID, attrs, catalog):
+    """residuesByNumber: mapping function giving each residue its residue number as ID."""
+    return int(attrs['nr'])
+
+### Main body of the script ###############################################
+
+def main():
+    parser = OptionParser() # creates an instance of the parser
+    parser.usage = "%prog -i input.cara -o output.cara [-p project-name] [remap options]"
+    parser.description = "%prog changes the IDs of spins, spin systems, spectra and residues, and every reference to them, in one pass over a CARA repository."
+    parser.epilog = "Everything that is not remapped is copied byte for byte."
+    parser.add_option("-i", "--input", dest="infile",type="string",default=None,
+                      help="name of original CARA repository, required.", metavar="FILE")
+    parser.add_option("-o", "--output", dest="outfile",type="string",default=None,
+                      help="name of new CARA repository, required.", metavar="FILE")
+    parser.add_option("-p", "--project", metavar="NAME", dest="project", default=None,type="string",
+                      help="name of project to alter, if there is more than one project in the repository, defaults to the first project.")
+    parser.add_option("--spin-offset", dest="spinOffset",type="int",default=None,
+                      help="add this number to every spin ID.")
+    parser.add_option("--spectrum-offset", dest="spectrumOffset",type="int",default=None,
+                      help="add this number to every spectrum ID.")
+    parser.add_option("--system-offset", dest="systemOffset",type="int",default=None,
+                      help="add this number to every spin system ID.")
+    parser.add_option("--renumber-systems", dest="renumberSystems",action="store_true",default=False,
+                      help="number the spin systems in order from 1, with no gaps.")
+    parser.add_option("--systems-by-assignment", dest="systemsByAssignment",action="store_true",default=False,
+                      help="number the assigned spin systems by their residue number, and the others in order above them.")
+    parser.add_option("--residues-by-number", dest="residuesByNumber",action="store_true",default=False,
+                      help="replace residue IDs with residue numbers.")
+    parser.add_option("--profile", dest="profile", action="store_true", default=False,
+                      help="report the time and peak memory of each phase of the run, and the number of elements visited and modified, on stderr.")
+
+    # Now parse the command-line options
+    (options, args) = parser.parse_args()
+
+    profiler = Profiler(options.profile)
+
+    if options.infile == None or options.outfile == None:
+        parser.print_help()
+        parser.error("Please specify an input and an output cara file.")
+
+    if [options.systemOffset != None, options.renumberSystems, options.systemsByAssignment].count(True) > 1:
+        parser.error("Please choose only one way of renumbering the spin systems.")
+
+    mappings = {}
+    if options.spinOffset != None:
+        mappings['spin'] = offsetIDs(options.spinOffset)
+    if options.spectrumOffset != None:
+        mappings['spectrum'] = offsetIDs(options.spectrumOffset)
+    if options.systemOffset != None:
+        mappings['system'] = offsetIDs(options.systemOffset)
+    if options.renumberSystems:
+        mappings['system'] = inOrder(1)
+    if options.systemsByAssignment:
+        mappings['system'] = systemsByAssignment()
+    if options.residuesByNumber:
+        mappings['residue'] = residuesByNumber
+
+    if not mappings:
+        parser.print_help()
+        parser.error("Please choose at least one remap.")
+
+    if exists(options.outfile):
+        print '\nOutput file \'%s\' exists. Choose a new name to avoid overwriting.\n'%options.outfile
+        return
+
+    profiler.switch('stream')
+    try:
+        catalog, counts = remapRepository(options.infile, options.outfile, mappings, options.project)
+    except (NameError, ValueError), e:
+        print '\n%s Try again.\n'%e
+        return
+    for kind in KINDS:
+        if kind in mappings:
+            print '%d %s IDs read, %d references changed.'%(catalog.count(kind), kind, counts[kind])
+    print 'Changed %d peaklist elements.'%counts['peak']
+    profiler.count(sum([catalog.count(kind) for kind in mappings]), sum(counts.values()))
+    profiler.report()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+"""
+caraRepository.py loads a CARA repository file once and gives access to the
+selected project together with hash indexes of its spins, spinlinks, spin
+systems and residues, so that scripts can look things up by ID instead of
+scanning spinbase.findall() over and over.
+
+Each index is built the first time it is used. Indexes are keyed on
+integers, e.g. repository.spinIndex[37] or repository.pairIndex[(37,1979)].
+Scripts that change IDs in place should call resetIndexes() afterwards.
+"""
+
+### Import some libraries #################################################
+
+import caraXML as ET # for parsing XML, with lxml if it is installed
+from caraColumns import PositionColumns # for changing shifts a column at a time
+from caraProfile import Profiler # for timing the phases of a run
+
+### Data Definitions ######################################################
+
+# spinIndex is a dict[spinID,spin element]
+# spinTagIndex is a dict[(systemID,atom,tag),spin element], the last spin
+# of that atom type and tag in the system
+# pairIndex is a dict[(lhs,rhs),pair element], with lhs < rhs
+# systemIndex is a dict[systemID,spinsys element]
+# assignmentIndex is a dict[residueID,spinsys element]
+# residueIndex is a dict[residueID,residue element]
+# residueNumberIndex is a dict[residue number,residue element]
+# spinID, systemID, residueID and residue numbers are integers.
+
+### Helper functions ######################################################
+
+def getProject(projectName,projects):
+    """This function, getProject, is only used if the user specifies a project
+    name from the command line, rather than simply allowing the script to
+    select the first (and likely only) project in a repository."""
+    for project in projects:
+        if project.get('name') == projectName:
+            return project
+    # if that doesn't work, raise an error:
+    raise NameError,"There is no project named \"%s\"."%projectName
+
+def selectProject(projects,projectName=None,projectNumber=None):
+    """
+    selectProject: list of projects, string, int -> project
+    returns the project named projectName, or else the project at position
+    projectNumber (counting from 0), or else the first project.
+    """
+    if projectName:
+        return getProject(projectName,projects)
+    if projectNumber:
+        if projectNumber >= len(projects):
+            raise IndexError,"You requested project number %d, but there are only %d projects in this repository."%(projectNumber + 1, len(projects))
+        return projects[projectNumber]
+    if projects:
+        return projects[0]
+    raise NameError,"There is no project in this repository."
+
+def canonicalPair(lhs,rhs):
+    """
+    canonicalPair: spinID, spinID -> (spinID, spinID)
+    returns the two spin IDs of a spinlink as integers, smallest first, so
+    that (a,b) and (b,a) give the same key.
+    """
+    lhs = int(lhs)
+    rhs = int(rhs)
+    if lhs < rhs:
+        return (lhs,rhs)
+    return (rhs,lhs)
+
+def intOrNone(value):
+    """
+    intOrNone: string -> int or None
+    returns value as an integer, or None if it is missing or not a number.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+### Indexes shared by every kind of repository ##########################
+
+class RepositoryIndexes(object):
+    """
+    RepositoryIndexes builds the lazy hash indexes from the element lists
+    spins, pairs, systems and residues, which subclasses provide. Anything
+    with a get(attribute) method will do as an element. Time spent building
+    indexes is counted as the index phase of the profiler.
+    """
+
+    profiler = Profiler(False)
+
+    def resetIndexes(self):
+        """Forget all indexes and element lists, so that they are rebuilt
+        from the tree the next time they are used."""
+        self._lists = {}
+        self._spinIndex = None
+        self._spinTagIndex = None
+        self._pairIndex = None
+        self._systemIndex = None
+        self._assignmentIndex = None
+        self._residueIndex = None
+        self._residueNumberIndex = None
+        self._positionColumns = None
+
+    ### Indexes ###########################################################
+
+    @property
+    def spinIndex(self):
+        if self._spinIndex is None:
+            self.profiler.enter('index')
+            self._spinIndex = {}
+            for spin in self.spins:
+                self._spinIndex[int(spin.get('id'))] = spin
+            self.profiler.leave()
+        return self._spinIndex
+
+    @property
+    def spinTagIndex(self):
+        if self._spinTagIndex is None:
+            self.profiler.enter('index')
+            self._spinTagIndex = {}
+            for spin in self.spins:
+                systemID = intOrNone(spin.get('sys'))
+                if systemID is not None:
+                    self._spinTagIndex[(systemID,spin.get('atom'),spin.get('tag'))] = spin
+            self.profiler.leave()
+        return self._spinTagIndex
+
+    @property
+    def pairIndex(self):
+        if self._pairIndex is None:
+            self.profiler.enter('index')
+            self._pairIndex = {}
+            for pair in self.pairs:
+                key = canonicalPair(pair.get('lhs'),pair.get('rhs'))
+                self._pairIndex.setdefault(key,pair)
+            self.profiler.leave()
+        return self._pairIndex
+
+    @property
+    def systemIndex(self):
+        if self._systemIndex is None:
+            self.profiler.enter('index')
+            self._systemIndex = {}
+            for system in self.systems:
+                self._systemIndex[int(system.get('id'))] = system
+            self.profiler.leave()
+        return self._systemIndex
+
+    @property
+    def assignmentIndex(self):
+        if self._assignmentIndex is None:
+            self.profiler.enter('index')
+            self._assignmentIndex = {}
+            for system in self.systems:
+                residueID = intOrNone(system.get('ass'))
+                if residueID is not None:
+                    self._assignmentIndex[residueID] = system
+            self.profiler.leave()
+        return self._assignmentIndex
+
+    @property
+    def residueIndex(self):
+        if self._residueIndex is None:
+            self.profiler.enter('index')
+            self._residueIndex = {}
+            for residue in self.residues:
+                self._residueIndex[int(residue.get('id'))] = residue
+            self.profiler.leave()
+        return self._residueIndex
+
+    @property
+    def residueNumberIndex(self):
+        if self._residueNumberIndex is None:
+            self.profiler.enter('index')
+            self._residueNumberIndex = {}
+            for residue in self.residues:
+                self._residueNumberIndex[int(residue.get('nr'))] = residue
+            self.profiler.leave()
+        return self._residueNumberIndex
+
+    @property
+    def positionColumns(self):
+        """The shift positions of all spins as PositionColumns. Shifts
+        changed through the columns must be written back with writeBack()."""
+        if self._positionColumns is None:
+            self.profiler.enter('index')
+            self._positionColumns = PositionColumns(self.spins)
+            self.profiler.leave()
+        return self._positionColumns
+
+    ### Lookups ###########################################################
+
+    def findSpin(self, systemID, tag, atom='H1'):
+        """Return the spin of an atom type with the given tag in a system, or None."""
+        return self.spinTagIndex.get((systemID,atom,tag))
+
+    def spinResidue(self, spin):
+        """
+        spinResidue: spin element -> residue element or None
+        returns the residue that the system of a spin is assigned to.
+        """
+        system = self.systemIndex.get(intOrNone(spin.get('sys')))
+        if system is None:
+            return None
+        return self.residueIndex.get(intOrNone(system.get('ass')))
+
+    def hasPair(self, lhs, rhs):
+        """Return True if there is a spinlink between two spins, in either order."""
+        return canonicalPair(lhs,rhs) in self.pairIndex
+
+### Repository object #####################################################
+
+class CaraRepository(RepositoryIndexes):
+    """
+    CaraRepository holds a parsed CARA repository and one selected project.
+    The project is chosen by name with projectName, or by position with
+    projectNumber (counting from 0), and defaults to the first project.
+    If a Profiler is given, parsing, selecting elements, building indexes and
+    writing are timed with it.
+    """
+
+    def __init__(self, infile, projectName=None, projectNumber=None, profiler=None):
+        if profiler is not None:
+            self.profiler = profiler
+        self.profiler.switch('parse')
+        self.tree = ET.parse(infile)
+        self.root = self.tree.getroot() #retrieves the whole repository
+        self.profiler.switch('select')
+        self.projects = self.root.findall('project') #retrieves every project in the repository
+        self.project = selectProject(self.projects,projectName,projectNumber)
+        self.library = self.root.find('library')
+        self.sequence = self.project.find('sequence')
+        self.spinbase = self.project.find('spinbase')
+        self.resetIndexes()
+
+    def write(self, outfile):
+        """Write out the whole repository, to a filename or open file."""
+        self.profiler.switch('serialize')
+        ET.write(self.tree,outfile)
+
+    ### Element lists #####################################################
+
+    def _findall(self, parent, tag):
+        if tag not in self._lists:
+            self.profiler.enter('select')
+            if parent is None:
+                self._lists[tag] = []
+            else:
+                self._lists[tag] = parent.findall(tag)
+            self.profiler.leave()
+        return self._lists[tag]
+
+    @property
+    def spins(self):
+        return self._findall(self.spinbase,'spin')
+
+    @property
+    def pairs(self):
+        return self._findall(self.spinbase,'pair')
+
+    @property
+    def systems(self):
+        return self._findall(self.spinbase,'spinsys')
+
+    @property
+    def links(self):
+        return self._findall(self.spinbase,'link')
+
+    @property
+    def residues(self):
+        return self._findall(self.sequence,'residue')
+
+    @property
+    def spectra(self):
+        return self._findall(self.project,'spectrum')
+
+    ### Changes ###########################################################
+
+    def addPair(self, lhs, rhs):
+        """
+        addPair: spinID, spinID -> pair element
+        appends a new spinlink to the spinbase, smallest spin ID first, and
+        keeps the pair index and list up to date.
+        """
+        key = canonicalPair(lhs,rhs)
+        newpair = ET.Element("pair")
+        newpair.attrib['lhs'] = '%d'%key[0]
+        newpair.attrib['rhs'] = '%d'%key[1]
+        self.spinbase.append(newpair)
+        if 'pair' in self._lists:
+            self._lists['pair'].append(newpair)
+        if self._pairIndex is not None:
+            self._pairIndex.setdefault(key,newpair)
+        return newpair
+
+    def addPairs(self, keys):
+        """
+        addPairs: list of (spinID, spinID) -> list of pair elements
+        appends a new spinlink for each pair of spin IDs in one operation on
+        the spinbase, and keeps the pair index and list up to date. The
+        caller is responsible for leaving out pairs that already exist.
+        """
+        newpairs = []
+        for lhs, rhs in keys:
+            key = canonicalPair(lhs,rhs)
+            newpair = ET.Element("pair")
+            newpair.attrib['lhs'] = '%d'%key[0]
+            newpair.attrib['rhs'] = '%d'%key[1]
+            newpairs.append(newpair)
+            if self._pairIndex is not None:
+                self._pairIndex.setdefault(key,newpair)
+        end = len(self.spinbase)
+        self.spinbase[end:end] = newpairs
+        if 'pair' in self._lists:
+            self._lists['pair'].extend(newpairs)
+        return newpairs
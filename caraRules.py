@@ -0,0 +1,244 @@
+"""
+caraRules.py reads the rules that hideSpinLinks.py and showSpinLinks.py use
+to decide in which spectra a spinlink is visible. The rules are written in
+an INI file, one section per rule, and compiled into frozensets, so that
+deciding whether a spin matches a rule is a few set lookups. The verdict for
+each spin is cached, so every spinlink is checked in one pass, at the cost
+of two dict lookups plus one set operation per rule.
+
+A rules file looks like this:
+
+[rules]
+apply = exchangeable deuterated
+
+[exchangeable]
+label = Exchangeable
+tags = H
+residue-tags = TRP:HE1 THR:HG1 GLN:HE21 GLN:HE22
+except-residues = 1278-1280 1299-1307
+except-tags = H
+hide = 174 194
+
+[deuterated]
+label = Deuterated
+residues = 4-9
+tags =
+
+The apply option of [rules] names the rules to use, in order. In a rule:
+  label            is written in the log for every spinlink that matches;
+  tags             are proton tags that match on any residue type;
+  residue-tags     are residue type:tag pairs that match;
+  residues         limits the rule to these residue IDs, all if empty;
+  except-residues  are residue IDs exempt from the rule, for the
+                   except-tags only if those are given;
+  match            is either (the default) or both, the spins of a
+                   spinlink that must match;
+  hide             are spectra in which matching spinlinks are hidden;
+  show             are spectra in which matching spinlinks are shown,
+                   after those in hide are hidden. Spectrum 0 stands for
+                   every spectrum.
+Lists are separated by spaces or commas, and residue IDs may be given as
+ranges such as 1299-1307. Lines starting with # are comments.
+"""
+
+### Import some libraries #################################################
+
+from sys import stdout # for the default log
+import os # for finding the default rules next to the scripts
+from ConfigParser import RawConfigParser # for reading the rules file
+from caraRepository import intOrNone # for residue IDs
+
+### Data Definitions ######################################################
+
+# spindict is a dict[spinID,attributeDict]
+# attributeDict is a dict["tag":atomType, "sys":systemID, "res":residueID, "AA":residueType]
+# spinID, systemID, residueID and spectrumIDs are integers.
+# A verdict is a frozenset of the positions in RuleSet.rules of the rules a
+# spin matches.
+
+RULES_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+### Helper functions ######################################################
+
+def splitList(text):
+    """splitList: string -> list of strings, split on commas and whitespace."""
+    return text.replace(',', ' ').split()
+
+def parseIDs(text):
+    """
+    parseIDs: string -> frozenset of ints
+    reads a list of IDs in which ranges such as 1299-1307 include both ends.
+    """
+    ids = set()
+    for item in splitList(text):
+        if '-' in item[1:]:
+            first, last = item.split('-', 1)
+            ids.update(range(int(first), int(last) + 1))
+        else:
+            ids.add(int(item))
+    return frozenset(ids)
+
+def parseResidueTags(text):
+    """parseResidueTags: string -> frozenset of (residueType, tag), from TYPE:TAG items."""
+    pairs = set()
+    for item in splitList(text):
+        if ':' not in item:
+            raise ValueError, "Residue tag \"%s\" should look like TYPE:TAG."%item
+        residueType, tag = item.split(':', 1)
+        pairs.add((residueType, tag))
+    return frozenset(pairs)
+
+def defaultRulesFile(script):
+    """
+    defaultRulesFile: string -> filename
+    returns the rules file shipped with a script, such as hideSpinLinks.ini
+    for hideSpinLinks.
+    """
+    return os.path.join(RULES_DIRECTORY, '%s.ini'%script)
+
+def makeSpindict(repository,log=stdout):
+    """
+    makeSpindict: repository, file -> spindict
+    collects the tag, system, residue ID and residue type of every proton
+    spin. Spins whose system or residue cannot be found are reported to log
+    and left out.
+    """
+    spindict = {}
+    for spin in repository.spins:
+        atom = spin.get('atom')
+        if atom == 'H1':
+            spinid = int(spin.get('id'))
+            try:
+                systemID = int(spin.get('sys'))
+                residueID = intOrNone(repository.systemIndex[systemID].get('ass'))
+                residueType = repository.residueIndex[residueID].get('type')
+                tag = spin.get('tag')
+                spindict[spinid] = {'tag': tag, 'sys': systemID, 'res': residueID, 'AA':residueType}
+            except Exception, e:
+                print >>log, "Orphan spin: ",e
+    return spindict
+
+### Rules #################################################################
+
+class Rule(object):
+    """
+    Rule is one compiled section of a rules file. Every list in it is a
+    frozenset.
+    """
+
+    def __init__(self, name, label=None, tags=(), residueTags=(), residues=(),
+                 exceptResidues=(), exceptTags=(), both=False, hide=(), show=()):
+        self.name = name
+        self.label = label or name
+        self.tags = frozenset(tags)
+        self.residueTags = frozenset(residueTags)
+        self.residues = frozenset(residues)
+        self.exceptResidues = frozenset(exceptResidues)
+        self.exceptTags = frozenset(exceptTags)
+        self.both = both
+        self.hide = list(hide)
+        self.show = list(show)
+
+    def matchesSpin(self, residueType, residueID, tag):
+        """
+        matchesSpin: string, int, string -> bool
+        returns true if a spin with this residue type, residue ID and tag
+        is one the rule applies to.
+        """
+        if tag not in self.tags and (residueType, tag) not in self.residueTags:
+            return False
+        if self.residues and residueID not in self.residues:
+            return False
+        if residueID in self.exceptResidues and (not self.exceptTags or tag in self.exceptTags):
+            return False
+        return True
+
+def compileRule(parser, name):
+    """
+    compileRule: RawConfigParser, string -> Rule
+    compiles the section of a rules file describing one rule. Raises a
+    ValueError if the section is missing or badly written.
+    """
+    if not parser.has_section(name):
+        raise ValueError, "There is no rule named \"%s\"."%name
+
+    def option(key):
+        if parser.has_option(name, key):
+            return parser.get(name, key)
+        return ''
+
+    match = option('match') or 'either'
+    if match not in ('either', 'both'):
+        raise ValueError, "Rule \"%s\": match should be either or both, not \"%s\"."%(name, match)
+    try:
+        return Rule(name, label=option('label'), tags=splitList(option('tags')),
+                    residueTags=parseResidueTags(option('residue-tags')),
+                    residues=parseIDs(option('residues')),
+                    exceptResidues=parseIDs(option('except-residues')),
+                    exceptTags=splitList(option('except-tags')),
+                    both=(match == 'both'),
+                    hide=[int(spectrumID) for spectrumID in splitList(option('hide'))],
+                    show=[int(spectrumID) for spectrumID in splitList(option('show'))])
+    except ValueError, e:
+        raise ValueError, "Rule \"%s\": %s"%(name, e)
+
+def readRules(filename):
+    """
+    readRules: filename -> list of Rules
+    reads a rules file and compiles the rules named by the apply option of
+    its [rules] section, in that order. Raises a ValueError if the file is
+    badly written.
+    """
+    parser = RawConfigParser()
+    if not parser.read(filename):
+        raise ValueError, "Cannot read rules file \"%s\"."%filename
+    if not parser.has_option('rules', 'apply'):
+        raise ValueError, "Rules file \"%s\" has no apply option in a [rules] section."%filename
+    return [compileRule(parser, name) for name in splitList(parser.get('rules', 'apply'))]
+
+class RuleSet(object):
+    """
+    RuleSet applies a list of rules to spinlinks, caching the verdict for
+    each spin so that the rules are evaluated once per spin rather than once
+    per spinlink.
+    """
+
+    def __init__(self, rules, spindict):
+        self.rules = list(rules)
+        self.spindict = spindict
+        self.verdicts = {}
+        self.nothing = frozenset()
+
+    def verdict(self, spinID):
+        """
+        verdict: spinID -> verdict
+        returns the rules that match a spin. Spins that are not in the
+        spindict match nothing.
+        """
+        try:
+            return self.verdicts[spinID]
+        except KeyError:
+            pass
+        attributes = self.spindict.get(spinID)
+        if attributes is None:
+            result = self.nothing
+        else:
+            result = frozenset([number for number in range(len(self.rules))
+                                if self.rules[number].matchesSpin(attributes['AA'], attributes['res'], attributes['tag'])])
+        self.verdicts[spinID] = result
+        return result
+
+    def matchingRules(self, lhs, rhs):
+        """
+        matchingRules: spinID, spinID -> list of Rules
+        returns the rules that apply to the spinlink between two spins, in
+        the order of the rules file.
+        """
+        left = self.verdict(lhs)
+        right = self.verdict(rhs)
+        if not left and not right:
+            return []
+        either = left | right
+        both = left & right
+        return [rule for number, rule in enumerate(self.rules)
+                if number in either and (not rule.both or number in both)]
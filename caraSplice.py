@@ -0,0 +1,147 @@
+"""
+caraSplice.py rewrites attribute values in a CARA repository without
+re-serializing it. While expat parses the file, the byte offsets of the
+attribute values that change are located in the original bytes, and the
+output is written by copying everything in between verbatim and splicing in
+only the new values. Spectra, peaklists and everything else that is not
+touched come out exactly as they went in, attribute order and quoting
+included, and the cost approaches that of copying the file.
+
+Only attribute values can be changed this way; elements cannot be added or
+removed.
+"""
+
+### Import some libraries #################################################
+
+import re # for finding attribute values in a start tag
+import mmap # for reading large repositories without loading them
+import xml.parsers.expat # for parsing with byte offsets
+from caraXML import escapeAttrib # for writing attribute values
+from caraStream import findProject # for checking the project before writing
+
+### Helper functions ######################################################
+
+attributePattern = re.compile(r'''\s+([^\s=/>]+)\s*=\s*("[^"]*"|'[^']*')''')
+namePattern = re.compile(r'<[^\s/>]+')
+
+def attributeSpans(data, index):
+    """
+    attributeSpans: bytes, int -> dict[string,(int,int,string)]
+    returns the start and end offset of each attribute value in the start
+    tag beginning at index, along with the quote character used. The offsets
+    exclude the quotes.
+    """
+    spans = {}
+    position = namePattern.match(data, index).end()
+    match = attributePattern.match(data, position)
+    while match:
+        spans[match.group(1)] = (match.start(2)+1, match.end(2)-1, match.group(2)[0])
+        match = attributePattern.match(data, match.end())
+    return spans
+
+def quoteValue(value, quote):
+    """
+    quoteValue: string, string -> string
+    escapes a new attribute value for the quote character it will sit in.
+    """
+    value = escapeAttrib(value)
+    if quote == "'":
+        value = value.replace("'", '&apos;')
+    return value
+
+### Splicing engine #######################################################
+
+def spliceRewrite(infile, outfile, rewriteAttributes, projectName=None, projectNumber=None):
+    """
+    spliceRewrite: filename, filename or file, function, string, int -> (int, string, int)
+    copies the repository in infile to outfile, calling
+    rewriteAttributes(tag, attrs, ancestors) for every element inside the
+    selected project. attrs is a dict of the element's attributes and
+    ancestors a list of (tag, attrs) from the repository root down to the
+    parent. rewriteAttributes returns a dict of attributes to change, or
+    None. Returns the number of attribute values changed, the name of the
+    selected project, which is None if there was no such project, and the
+    number of projects in the repository.
+
+    The selected project is the one named projectName, else the one at
+    position projectNumber (counting from 0), else the first.
+    """
+    infileObject = open(infile, 'rb')
+    data = mmap.mmap(infileObject.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(outfile, 'write'):
+        output = outfile
+    else:
+        output = open(outfile, 'wb')
+
+    state = {'copied': 0, 'changed': 0, 'projects': 0, 'inProject': False, 'selected': None}
+    stack = []
+    parser = xml.parsers.expat.ParserCreate()
+
+    def startElement(tag, attrs):
+        if len(stack) == 1 and tag == 'project':
+            if projectName:
+                state['inProject'] = attrs.get('name') == projectName
+            else:
+                state['inProject'] = state['projects'] == (projectNumber or 0)
+            if state['inProject']:
+                state['selected'] = attrs.get('name')
+            state['projects'] = state['projects'] + 1
+        elif state['inProject'] and len(stack) > 1:
+            changes = rewriteAttributes(tag, attrs, stack)
+            if changes:
+                spans = attributeSpans(data, parser.CurrentByteIndex)
+                edits = []
+                for key, value in changes.items():
+                    start, end, quote = spans[key]
+                    edits.append((start, end, quoteValue(value, quote)))
+                edits.sort()
+                for start, end, value in edits:
+                    output.write(data[state['copied']:start])
+                    output.write(value)
+                    state['copied'] = end
+                state['changed'] = state['changed'] + len(edits)
+        stack.append((tag, attrs))
+
+    def endElement(tag):
+        tag, attrs = stack.pop()
+        if len(stack) == 1 and tag == 'project':
+            state['inProject'] = False
+
+    parser.StartElementHandler = startElement
+    parser.EndElementHandler = endElement
+    blockSize = 1048576
+    for position in xrange(0, len(data), blockSize):
+        parser.Parse(data[position:position+blockSize], False)
+    parser.Parse('', True)
+    output.write(data[state['copied']:])
+
+    if output is not outfile:
+        output.close()
+    data.close()
+    infileObject.close()
+    return (state['changed'], state['selected'], state['projects'])
+
+def spliceShiftSpins(infile, outfile, selectSpin, newShift, alias=False, projectName=None):
+    """
+    spliceShiftSpins: filename, filename or file, function, function, bool, string -> int
+    splices new shifts into the repository, replacing the shift of every
+    position of each spin for which selectSpin(spin) is true with
+    newShift(shift). selectSpin is given the spin's attribute dict. Only the
+    unaliased position (spec 0) is changed unless alias is True. Raises a
+    NameError if there is no such project, before anything is written.
+    Returns the number of positions changed.
+    """
+    if not findProject(infile, projectName):
+        if projectName:
+            raise NameError,"There is no project named \"%s\"."%projectName
+        raise NameError,"There is no project in this repository."
+    def rewritePos(tag, attrs, ancestors):
+        if tag != 'pos' or ancestors[-1][0] != 'spin' or ancestors[-2][0] != 'spinbase':
+            return None
+        if not selectSpin(ancestors[-1][1]):
+            return None
+        if attrs.get('spec') == '0' or alias == True:
+            return {'shift': str(newShift(float(attrs['shift'])))}
+        return None
+    numChanged, selected, numProjects = spliceRewrite(infile, outfile, rewritePos, projectName)
+    return numChanged
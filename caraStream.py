@@ -0,0 +1,187 @@
+"""
+caraStream.py rewrites a CARA repository file while it is being read, using
+iterparse from the XML library chosen by caraXML.py. Each element is written
+out as soon as it is complete and is then dropped from the tree, so memory
+use stays flat no matter how many spectra, spins and aliases the repository
+holds.
+
+The output is byte-for-byte what tree.write() would have produced for the
+same modifications.
+
+An element can also be stripped as it passes: it is then written with its
+attributes only, and its text and everything inside it are read past
+without being kept or written.
+"""
+
+### Import some libraries #################################################
+
+import caraXML as ET # for parsing XML, with lxml if it is installed
+from caraXML import encodeText, escapeCdata, startTag # for writing XML
+
+### Data Definitions ######################################################
+
+# STRIP is returned by a rewriteElement function to have the element
+# written without its content.
+
+STRIP = 'strip'
+
+### Streaming engine ######################################################
+
+def findProject(infile, projectName=None, projectNumber=None):
+    """
+    findProject: filename, string, int -> bool
+    returns True if the repository has the project named projectName, else
+    the one at position projectNumber (counting from 0), else any project.
+    Only as much is read as it takes to reach the project's start tag, so a
+    missing project can be reported before any output is written.
+    """
+    stack = []
+    numProjects = 0
+    for event, elem in ET.iterparse(infile, events=('start', 'end')):
+        if event == 'start':
+            if len(stack) == 1 and elem.tag == 'project':
+                if projectName:
+                    if elem.get('name') == projectName:
+                        return True
+                elif numProjects == (projectNumber or 0):
+                    return True
+                numProjects = numProjects + 1
+            stack.append(elem)
+        else:
+            stack.pop()
+            if stack:
+                stack[-1].remove(elem)
+    return False
+
+def streamRewrite(infile, outfile, rewriteElement, projectName=None):
+    """
+    streamRewrite: filename, file or filename, function, string -> int
+    copies the repository in infile to outfile, calling
+    rewriteElement(elem, ancestors) on every element inside the selected
+    project as soon as its start tag has been read. ancestors is the list of
+    open elements from the repository root down to the parent of elem.
+    rewriteElement may change the attributes of elem, and returns True if it
+    did so, or STRIP to also drop the text and children of elem. Returns the
+    number of elements that were modified.
+
+    The selected project is the one named projectName, or the first project
+    if no name is given. A NameError is raised if there is no such project,
+    before anything is written.
+    """
+    if not findProject(infile, projectName):
+        if projectName:
+            raise NameError,"There is no project named \"%s\"."%projectName
+        raise NameError,"There is no project in this repository."
+    if hasattr(outfile, 'write'):
+        output = outfile
+    else:
+        output = open(outfile, 'wb')
+    write = output.write
+
+    stack = []      # elements whose start tag has been read, root first
+    opened = []     # whether the start tag of each of those has been written
+    pending = None  # (element, parent, keep) whose tail is not yet known
+    stripped = None # depth of the element being stripped, if any
+    inProject = False
+    foundProject = False
+    numModified = 0
+
+    for event, elem in ET.iterparse(infile, events=('start', 'end')):
+        # The tail of the last completed element is known by now, and it is
+        # no longer needed, so it is written out and dropped from the tree.
+        if pending is not None:
+            done, parent, keep = pending
+            if keep and done.tail:
+                write(escapeCdata(done.tail))
+            if parent is not None:
+                parent.remove(done)
+            pending = None
+        if event == 'start' and stripped is not None:
+            # inside a stripped element: keep track of depth, write nothing
+            stack.append(elem)
+            opened.append(True)
+        elif event == 'start':
+            if stack and not opened[-1]:
+                parent = stack[-1]
+                write(startTag(parent) + '>')
+                if parent.text:
+                    write(escapeCdata(parent.text))
+                opened[-1] = True
+            if len(stack) == 1 and elem.tag == 'project':
+                if projectName:
+                    inProject = elem.get('name') == projectName
+                else:
+                    inProject = not foundProject
+                foundProject = foundProject or inProject
+            elif inProject and len(stack) > 1:
+                result = rewriteElement(elem, stack)
+                if result:
+                    numModified = numModified + 1
+                if result is STRIP:
+                    stripped = len(stack)
+            stack.append(elem)
+            opened.append(False)
+        elif stripped is not None and len(stack) > stripped + 1:
+            # the end of something inside a stripped element: drop it
+            stack.pop()
+            opened.pop()
+            pending = (elem, stack[-1], False)
+        else:
+            stack.pop()
+            if stripped == len(stack):
+                write(startTag(elem) + ' />')
+                stripped = None
+                opened.pop()
+            elif opened.pop():
+                write('</%s>'%encodeText(elem.tag))
+            elif elem.text:
+                write(startTag(elem) + '>' + escapeCdata(elem.text) +
+                      '</%s>'%encodeText(elem.tag))
+            else:
+                write(startTag(elem) + ' />')
+            if len(stack) == 1 and elem.tag == 'project':
+                inProject = False
+            if stack:
+                pending = (elem, stack[-1], True)
+            elif elem.tail:
+                write(escapeCdata(elem.tail))
+
+    if output is not outfile:
+        output.close()
+    return numModified
+
+def streamShiftSpins(infile, outfile, selectSpin, newShift, alias=False, projectName=None):
+    """
+    streamShiftSpins: filename, file or filename, function, function, bool, string -> int
+    streams the repository from infile to outfile, replacing the shift of
+    every position of each spin for which selectSpin(spin) is true with
+    newShift(shift). Only the unaliased position (spec 0) is changed unless
+    alias is True. Returns the number of positions changed.
+    """
+    def rewritePos(elem, ancestors):
+        if elem.tag != 'pos' or ancestors[-1].tag != 'spin':
+            return False
+        if ancestors[-2].tag != 'spinbase' or not selectSpin(ancestors[-1]):
+            return False
+        if elem.get('spec') == '0' or alias == True:
+            shift = float(elem.get('shift'))
+            elem.set('shift', str(newShift(shift)))
+            return True
+        return False
+    return streamRewrite(infile, outfile, rewritePos, projectName)
+
+def streamResetSpinLinks(infile, outfile, projectName=None):
+    """
+    streamResetSpinLinks: filename, file or filename, string -> int
+    streams the repository from infile to outfile, writing every spinlink
+    with its lhs and rhs only, so that it is visible in every spectrum.
+    Returns the number of spinlinks written.
+    """
+    def resetPair(elem, ancestors):
+        if elem.tag != 'pair' or ancestors[-1].tag != 'spinbase':
+            return False
+        for key in elem.keys():
+            if key not in ('lhs', 'rhs'):
+                del elem.attrib[key]
+        return STRIP
+    return streamRewrite(infile, outfile, resetPair, projectName)
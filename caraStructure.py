@@ -0,0 +1,229 @@
+"""
+caraStructure.py reads the protons of a PDB or mmCIF structure, one model
+or a whole ensemble, and finds every pair of protons closer than a distance
+cutoff, for the scripts that turn a structure into expected NOEs.
+
+Close pairs are found with a grid of cubic cells as wide as the cutoff:
+each proton only needs to be compared with the protons in its own cell and
+the 26 around it, and each pair of neighbouring cells is visited once, so
+that the work grows with the number of protons rather than with its square.
+For a 400-residue protein that is a few 10^5 distance checks per model
+instead of 10^7.
+
+The models of an ensemble are searched in parallel worker processes where
+the multiprocessing module is available (python 2.6 or above), and one after
+another otherwise.
+"""
+
+### Import some libraries #################################################
+
+import re # for reading quoted mmCIF values
+from math import floor # for the grid cells
+try:
+    import multiprocessing # for searching several models at once
+except ImportError:
+    multiprocessing = None
+
+### Data Definitions ######################################################
+
+# An atom is a tuple (chain, residue number, atom name, x, y, z). Atom names
+# are in the current PDB style, HG21 rather than 1HG2.
+# A model is a list of atoms, and a structure a list of models.
+# A point is a tuple (key, x, y, z), where key is any value naming the atom,
+# such as a spinID; a contact is a (key, key) tuple with the smaller key
+# first.
+
+# The offsets of the 13 neighbouring cells that come after a cell, so that
+# every pair of neighbouring cells is visited from one side only.
+HALF_STENCIL = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+                if (dx, dy, dz) > (0, 0, 0)]
+
+# mmCIF values are separated by whitespace and may be quoted.
+cifToken = re.compile(r"""'([^']*)'(?=\s|$)|"([^"]*)"(?=\s|$)|(\S+)""")
+
+### Reading structures ####################################################
+
+def pdbAtomName(name):
+    """
+    pdbAtomName: string -> string
+    returns an atom name in the current PDB style, moving a leading digit
+    to the end as in 1HG2 -> HG21.
+    """
+    name = name.strip()
+    if name[:1].isdigit():
+        name = name[1:] + name[0]
+    return name
+
+def isProton(name, element):
+    """isProton: atom name, element -> bool, true for hydrogen and deuterium."""
+    if element:
+        return element.upper() in ('H', 'D')
+    return name[:1] in ('H', 'D')
+
+def readPdb(filename):
+    """
+    readPdb: filename -> structure
+    reads the protons of every model of a PDB file. A file without MODEL
+    records is one model. Of atoms with alternate locations only the first
+    is kept.
+    """
+    models = []
+    atoms = []
+    openfile = open(filename, 'r')
+    for line in openfile:
+        record = line[:6]
+        if record == 'MODEL ':
+            atoms = []
+        elif record == 'ENDMDL':
+            models.append(atoms)
+            atoms = []
+        elif record == 'ATOM  ' or record == 'HETATM':
+            if line[16] not in ' A1':
+                continue
+            name = pdbAtomName(line[12:16])
+            if not isProton(name, line[76:78].strip()):
+                continue
+            atoms.append((line[21], int(line[22:26]), name,
+                          float(line[30:38]), float(line[38:46]), float(line[46:54])))
+    openfile.close()
+    if atoms or not models:
+        models.append(atoms)
+    return models
+
+def cifTokens(line):
+    """cifTokens: string -> list of strings, the values on an mmCIF line without their quotes."""
+    return [single or double or bare for single, double, bare in cifToken.findall(line)]
+
+def readMmcif(filename):
+    """
+    readMmcif: filename -> structure
+    reads the protons of every model in the _atom_site loop of an mmCIF
+    file, using the author residue numbers and atom names where given.
+    """
+    models = {}
+    order = []
+    columns = []
+    values = []
+    inLoop = False
+    inAtoms = False
+    openfile = open(filename, 'r')
+    for line in openfile:
+        stripped = line.strip()
+        if stripped == 'loop_':
+            inLoop = True
+            inAtoms = False
+            columns = []
+            continue
+        if inLoop and stripped.startswith('_'):
+            if stripped.startswith('_atom_site.'):
+                inAtoms = True
+                columns.append(stripped.split()[0][len('_atom_site.'):])
+            continue
+        inLoop = False
+        if not inAtoms:
+            continue
+        if not stripped or stripped[0] == '#' or stripped[0] == '_' or stripped.startswith('data_'):
+            inAtoms = False
+            continue
+        values.extend(cifTokens(stripped))
+        if len(values) < len(columns):
+            continue # a row continued on the next line
+        row = dict(zip(columns, values))
+        values = []
+        if row.get('label_alt_id', '.') not in '.?A1':
+            continue
+        name = pdbAtomName(row.get('auth_atom_id', row.get('label_atom_id', '')))
+        if not isProton(name, row.get('type_symbol')):
+            continue
+        model = row.get('pdbx_PDB_model_num', '1')
+        if model not in models:
+            models[model] = []
+            order.append(model)
+        models[model].append((row.get('auth_asym_id', row.get('label_asym_id')),
+                              int(row.get('auth_seq_id', row.get('label_seq_id'))), name,
+                              float(row['Cartn_x']), float(row['Cartn_y']), float(row['Cartn_z'])))
+    openfile.close()
+    return [models[model] for model in order] or [[]]
+
+def readStructure(filename):
+    """
+    readStructure: filename -> structure
+    reads a .cif or .mmcif file with readMmcif() and anything else with
+    readPdb().
+    """
+    if filename.lower().endswith(('.cif', '.mmcif')):
+        return readMmcif(filename)
+    return readPdb(filename)
+
+### Close pairs ###########################################################
+
+def closePairs(points, cutoff):
+    """
+    closePairs: list of points, float -> list of contacts
+    returns every pair of points with different keys that are no further
+    apart than cutoff, each once, using a grid of cells as wide as the
+    cutoff.
+    """
+    cells = {}
+    for point in points:
+        key, x, y, z = point
+        cell = (int(floor(x/cutoff)), int(floor(y/cutoff)), int(floor(z/cutoff)))
+        cells.setdefault(cell, []).append(point)
+    limit = cutoff*cutoff
+    contacts = []
+    append = contacts.append
+    for (cx, cy, cz), members in cells.iteritems():
+        neighbourhood = [members]
+        for dx, dy, dz in HALF_STENCIL:
+            neighbours = cells.get((cx+dx, cy+dy, cz+dz))
+            if neighbours:
+                neighbourhood.append(neighbours)
+        for i in range(len(members)):
+            lkey, lx, ly, lz = members[i]
+            for neighbours in neighbourhood:
+                if neighbours is members:
+                    candidates = members[i+1:]
+                else:
+                    candidates = neighbours
+                for rkey, rx, ry, rz in candidates:
+                    dx = lx - rx
+                    dy = ly - ry
+                    dz = lz - rz
+                    if dx*dx + dy*dy + dz*dz <= limit and lkey != rkey:
+                        if rkey < lkey:
+                            append((rkey, lkey))
+                        else:
+                            append((lkey, rkey))
+    return contacts
+
+def modelContacts(job):
+    """
+    modelContacts: (list of points, float) -> list of contacts
+    returns the distinct contacts of one model. This runs in the worker
+    processes.
+    """
+    points, cutoff = job
+    return dict.fromkeys(closePairs(points, cutoff)).keys()
+
+def ensembleContacts(models, cutoff, workers=1):
+    """
+    ensembleContacts: list of lists of points, float, int -> dict[contact,int]
+    searches every model for close pairs, in a pool of worker processes if
+    workers is more than 1, and returns the number of models each contact
+    is found in.
+    """
+    jobs = [(points, cutoff) for points in models]
+    if workers > 1 and multiprocessing is not None and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        try:
+            results = pool.map(modelContacts, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [modelContacts(job) for job in jobs]
+    counts = {}
+    for contacts in results:
+        for contact in contacts:
+            counts[contact] = counts.get(contact, 0) + 1
+    return counts
@@ -0,0 +1,142 @@
+"""
+caraUpl.py reads CYANA UPL files for the scripts that turn distance
+restraints into spinlinks. A file is read one line at a time and reduced to
+the set of distinct restraints it contains, so that the memory used grows
+with the number of distinct restraints and not with the size of the files.
+
+Many files, such as one per CYANA cycle or per structure calculation, are
+read in parallel in worker processes where the multiprocessing module is
+available (python 2.6 or above), and one after another otherwise. Their
+restraints are merged in the order the files were given.
+
+Restraints going the other way, from spinlinks back to a structure
+calculation, are written one line at a time as CYANA UPL or XPLOR/CNS
+assign statements by the functions in RESTRAINT_FORMATS.
+"""
+
+### Import some libraries #################################################
+
+import os # for reading directories of UPL files
+try:
+    import multiprocessing # for reading several files at once
+except ImportError:
+    multiprocessing = None
+
+### Data Definitions ######################################################
+
+# A restraint is a tuple ((systemID, tag), (systemID, tag)) with the smaller
+# end first, so that a restraint and its reverse are the same. systemIDs are
+# integers and tags are proton names as they appear in the UPL file.
+# Counts are a dict[string,int] with the keys lines, duplicate,
+# intraresidue and malformed.
+# An end is a tuple (residue number, residue type, tag) naming a proton in
+# a restraint that is written out.
+
+### Helper functions ######################################################
+
+def uplFiles(paths):
+    """
+    uplFiles: list of filenames or directories -> list of filenames
+    replaces each directory with the .upl files in it, sorted by name.
+    """
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            names = [name for name in os.listdir(path) if name.lower().endswith('.upl')]
+            names.sort()
+            filenames.extend([os.path.join(path, name) for name in names])
+        else:
+            filenames.append(path)
+    return filenames
+
+def defaultWorkers():
+    """defaultWorkers: -> int, the number of CPUs, or 1 without multiprocessing."""
+    if multiprocessing is None:
+        return 1
+    return multiprocessing.cpu_count()
+
+def restraintText(restraint):
+    """restraintText: restraint -> string, as system tag system tag."""
+    (leftsys, lefttag), (rightsys, righttag) = restraint
+    return '%d %s %d %s'%(leftsys, lefttag, rightsys, righttag)
+
+def parseUpl(uplfile):
+    """
+    parseUpl: filename -> (list of restraints, counts, list of strings)
+    reads a UPL file line by line and returns its distinct inter-residue
+    restraints in the order they first appear, how many restraint lines were
+    duplicates, intraresidue or malformed, and the malformed lines
+    themselves. This runs in the worker processes.
+    """
+    counts = {'lines': 0, 'duplicate': 0, 'intraresidue': 0, 'malformed': 0}
+    seen = {}
+    restraints = []
+    badLines = []
+    openfile = open(uplfile, 'r')
+    for line in openfile:
+        if line[0] == '#' or not line.strip():
+            continue
+        counts['lines'] = counts['lines'] + 1
+        try:
+            columns = line.split()
+            left = (int(columns[0]), columns[2])
+            right = (int(columns[3]), columns[5])
+        except (IndexError, ValueError):
+            counts['malformed'] = counts['malformed'] + 1
+            badLines.append(line)
+            continue
+        if left[0] == right[0]:
+            counts['intraresidue'] = counts['intraresidue'] + 1
+            continue
+        if right < left:
+            left, right = right, left
+        restraint = (left, right)
+        if restraint in seen:
+            counts['duplicate'] = counts['duplicate'] + 1
+        else:
+            seen[restraint] = True
+            restraints.append(restraint)
+    openfile.close()
+    return (restraints, counts, badLines)
+
+def parseUplFiles(uplfiles, workers=1):
+    """
+    parseUplFiles: list of filenames, int -> iterator of (filename, list of restraints, counts, list of strings)
+    parses each file with parseUpl(), in a pool of worker processes if
+    workers is more than 1, yielding the results in the order of the files.
+    """
+    if workers > 1 and multiprocessing is not None and len(uplfiles) > 1:
+        pool = multiprocessing.Pool(min(workers, len(uplfiles)))
+        try:
+            results = pool.imap(parseUpl, uplfiles)
+            for uplfile in uplfiles:
+                yield (uplfile,) + results.next()
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for uplfile in uplfiles:
+            yield (uplfile,) + parseUpl(uplfile)
+
+### Writing restraints ####################################################
+
+def uplLine(left, right, upper, lower=0.0):
+    """
+    uplLine: end, end, float, float -> string
+    returns a CYANA UPL line for an upper distance bound between two
+    protons, in the columns parseUpl() reads back. UPL files have no lower
+    bound.
+    """
+    return '%5d %-4s %-5s %5d %-4s %-5s %7.2f\n'%(left + right + (upper,))
+
+def xplorLine(left, right, upper, lower=0.0):
+    """
+    xplorLine: end, end, float, float -> string
+    returns an XPLOR/CNS assign statement for a distance between lower and
+    upper between two protons, as the distance lower, minus 0 and plus
+    upper-lower.
+    """
+    return 'assign (resid %4d and name %-5s) (resid %4d and name %-5s) %6.2f %6.2f %6.2f\n'%(
+        left[0], left[2], right[0], right[2], lower, 0.0, upper - lower)
+
+RESTRAINT_FORMATS = {'upl': uplLine, 'xplor': xplorLine}
@@ -0,0 +1,226 @@
+#!/nmr/programs/python/bin/python2.5
+"""
+caraValidate.py checks that every reference between the elements of a CARA
+project points at an element that exists, and writes a JSON report, so that
+broken references are found before a pipeline runs rather than as a warning
+or a KeyError halfway through a script.
+
+The references checked are those that caraRemap.py rewrites (see REFERENCES
+there):
+
+  spin sys                  -> spinsys id
+  pair lhs and rhs          -> spin id
+  link pred and succ        -> spinsys id
+  pos spec and inst spec    -> spectrum id
+  spinsys ass               -> residue id
+  peaklist home             -> spectrum id
+  peak pos spec             -> spectrum id
+  peak ass                  -> spin id
+
+along with IDs that are used twice for the same kind of element. 0, which
+stands for every spectrum in aliases and spinlinks, for an unassigned
+dimension of a peak and for no system, is never an error.
+
+The repository is read in one streaming pass, without building a tree.
+The IDs are collected in dicts as they go by, and a reference to an ID
+that has already been seen is settled at once; the others, such as the
+systems of the spins, which come before the systems in the file, are kept
+and looked up once at the end.
+
+Use caraValidate.py -h or caraValidate.py --help to learn more about inputs.
+The exit status is 1 if any problem was found, so that it can stop a batch
+or pipeline job; caraPipeline.py --validate runs the same check first.
+"""
+
+### Import some libraries #################################################
+
+from optparse import OptionParser # for parsing commandline input
+from sys import stdout, stderr, exit # for output to screen, and the exit status
+from os.path import exists # for making sure not to overwrite files
+from caraSplice import spliceRewrite # for reading the repository in one pass
+from caraRemap import Discard, ELEMENTS, KINDS, REFERENCES # for the IDs and the references to them
+from caraProfile import Profiler # for the --profile option
+from caraJSON import dumps # for writing the report
+
+### Data Definitions ######################################################
+
+# A problem is a dict with
+#   element    the element at fault, such as 'spin 12' or 'pair 4-1 inst'
+#   attribute  the attribute holding the ID
+#   kind       the kind of ID
+#   value      the ID
+#   problem    'missing' for a reference to an ID that does not exist, or
+#              'duplicate' for an ID used by more than one element
+# A report is a dict with the repository, project, counts of each kind of
+# element, number of references checked, number of problems of each
+# attribute, the problems themselves (up to a limit) and whether the
+# project is valid.
+
+# The ID that never refers to an element.
+NO_ID = '0'
+
+### Helper functions ######################################################
+
+def describe(tag, attrs, ancestors):
+    """
+    describe: string, dict, list of (tag, attrs) -> string
+    names an element for the report by its ID, or the IDs it joins, or
+    else by its parent, as in 'spin 12', 'link 5-6' or 'spin 12 pos'.
+    """
+    if 'id' in attrs:
+        if tag == 'peak' and ancestors[-1][0] == 'peaklist':
+            return 'peaklist %s peak %s'%(ancestors[-1][1].get('id'), attrs['id'])
+        return '%s %s'%(tag, attrs['id'])
+    if tag == 'pair':
+        return 'pair %s-%s'%(attrs.get('lhs'), attrs.get('rhs'))
+    if tag == 'link':
+        return 'link %s-%s'%(attrs.get('pred'), attrs.get('succ'))
+    parentTag, parentAttrs = ancestors[-1]
+    return '%s %s'%(describe(parentTag, parentAttrs, ancestors[:-1]), tag)
+
+### Validation ############################################################
+
+def validateRepository(infile, projectName=None, projectNumber=None, maxProblems=1000):
+    """
+    validateRepository: filename, string, int, int -> report
+    checks every reference in the selected project in one pass. At most
+    maxProblems problems are listed, but all of them are counted. Raises a
+    NameError if there is no such project.
+    """
+    ids = {}
+    counts = {}
+    for kind in KINDS:
+        ids[kind] = {}
+        counts[kind] = 0
+    definitions = {}
+    for kind in KINDS:
+        definitions[ELEMENTS[kind]] = kind
+    pending = []
+    problems = []
+    tallies = {}
+    state = {'references': 0}
+
+    def report(problem, tally):
+        tallies[tally] = tallies.get(tally, 0) + 1
+        if len(problems) < maxProblems:
+            problems.append(problem)
+
+    def check(tag, attrs, ancestors):
+        key = (tag, ancestors[-1][0])
+        if key in definitions and 'id' in attrs:
+            kind = definitions[key]
+            counts[kind] = counts[kind] + 1
+            if attrs['id'] in ids[kind]:
+                report({'element': describe(tag, attrs, ancestors), 'attribute': 'id', 'kind': kind,
+                        'value': attrs['id'], 'problem': 'duplicate'}, '%s id'%tag)
+            ids[kind][attrs['id']] = None
+        for name, kind in REFERENCES.get(key, ()):
+            if name == 'id':
+                continue
+            if name == '*':
+                names = attrs.keys()
+                names.sort()
+            else:
+                names = [name]
+            for name in names:
+                value = attrs.get(name)
+                if not value or value == NO_ID:
+                    continue
+                state['references'] = state['references'] + 1
+                if value not in ids[kind]:
+                    pending.append((value, kind, tag, name, describe(tag, attrs, ancestors)))
+        return None
+
+    numChanged, selected, numProjects = spliceRewrite(infile, Discard(), check, projectName, projectNumber)
+    if selected is None:
+        if projectName:
+            raise NameError, "There is no project named \"%s\"."%projectName
+        raise NameError, "You requested project number %d, but there are only %d projects in this repository."%(
+            (projectNumber or 0) + 1, numProjects)
+
+    for value, kind, tag, name, element in pending:
+        if value not in ids[kind]:
+            report({'element': element, 'attribute': name, 'kind': kind,
+                    'value': value, 'problem': 'missing'}, '%s %s'%(tag, name))
+
+    numProblems = sum(tallies.values())
+    return {
+        'repository': infile,
+        'project': selected,
+        'valid': numProblems == 0,
+        'counts': counts,
+        'references': state['references'],
+        'problems': numProblems,
+        'tallies': tallies,
+        'listed': problems,
+        }
+
+def reportText(report):
+    """reportText: report -> string, the report as JSON."""
+    return dumps(report)
+
+def reportSummary(report):
+    """reportSummary: report -> string, one line per kind of problem, for the log."""
+    lines = ['%s, project %s: %d references checked, %d problems.'%(
+        report['repository'], report['project'], report['references'], report['problems'])]
+    tallies = report['tallies'].keys()
+    tallies.sort()
+    for tally in tallies:
+        lines.append('  %-20s %d'%(tally, report['tallies'][tally]))
+    return '\n'.join(lines)
+
+### Main body of the script ###############################################
+
+def main():
+    parser = OptionParser() # creates an instance of the parser
+    parser.usage = "%prog -i input.cara [-o report.json] [-p project-name] [-n max-problems]"
+    parser.description = "%prog checks every reference between the elements of a CARA project in one pass, and writes a JSON report."
+    parser.epilog = "The exit status is 1 if any problem was found."
+    parser.add_option("-i", "--input", dest="infile",type="string",default=None,
+                      help="name of CARA repository, required.", metavar="FILE")
+    parser.add_option("-o", "--output", dest="outfile",type="string",default=None,
+                      help="name of JSON report, defaults to stdout.", metavar="FILE")
+    parser.add_option("-p", "--project", metavar="NAME", dest="project", default=None,type="string",
+                      help="name of project to check, if there is more than one project in the repository, defaults to the first project.")
+    parser.add_option("-n", "--max-problems", dest="maxProblems",type="int",default=1000,
+                      help="number of problems to list in the report; all are counted. Defaults to %default.")
+    parser.add_option("--profile", dest="profile", action="store_true", default=False,
+                      help="report the time and peak memory of each phase of the run, and the number of elements visited and modified, on stderr.")
+
+    # Now parse the command-line options
+    (options, args) = parser.parse_args()
+
+    profiler = Profiler(options.profile)
+
+    if options.infile == None:
+        parser.print_help()
+        parser.error("Please specify an input cara file.")
+
+    if options.outfile == None:
+        log = stderr
+    elif exists(options.outfile):
+        print '\nOutput file \'%s\' exists. Choose a new name to avoid overwriting.\n'%options.outfile
+        return
+    else:
+        log = stdout
+
+    profiler.switch('stream')
+    try:
+        report = validateRepository(options.infile, options.project, None, options.maxProblems)
+    except NameError, e:
+        print >>log, '\n%s Try again.\n'%e
+        exit(2)
+    if options.outfile == None:
+        print reportText(report)
+    else:
+        openfile = open(options.outfile, 'w')
+        openfile.write(reportText(report) + '\n')
+        openfile.close()
+    print >>log, reportSummary(report)
+    profiler.count(sum(report['counts'].values()), 0)
+    profiler.report()
+    if not report['valid']:
+        exit(1)
+
+if __name__ == '__main__':
+    main()
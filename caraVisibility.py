@@ -0,0 +1,276 @@
+"""
+caraVisibility.py holds the visibility of the spinlinks of a project as one
+bitset per spinlink over an index of spectra. In the repository, visibility
+is a list of <inst> children of each <pair>:
+
+<pair lhs='37' rhs='1979'>
+<inst spec='0' rate='0.000000' code='0' visi='0'/>
+<inst spec='176' rate='0.000000' code='0' visi='1'/>
+</pair>
+
+where spectrum 0 gives the visibility in every spectrum without an <inst> of
+its own, a spinlink without any <inst> is visible everywhere, and of several
+<inst> for the same spectrum the last one counts. Scripts that only append
+<inst> children make the list grow with every run.
+
+A VisibilityMatrix reads those lists once into two integers per spinlink,
+used as bitsets: the spectra that have an <inst>, and whether the spinlink
+is visible in each of them. Showing or hiding a spinlink in a set of
+spectra is then an OR or AND with a mask, and writeBack() replaces the
+<inst> children of every changed spinlink with the fewest that give the
+same visibility, one per spectrum at most, updating the ones already there
+in place. Rates and codes other than the defaults are kept. Running the
+same rules again therefore changes nothing, and writeBack(True) compacts
+the duplicates left by older scripts.
+
+A typical use, hiding spinlinks in spectra recorded in D2O:
+
+matrix = VisibilityMatrix(repository.pairs)
+mask = matrix.mask([174, 194])
+matrix.hide(numbers, mask)
+matrix.writeBack()
+"""
+
+### Import some libraries #################################################
+
+import caraXML as ET # for writing <inst> elements
+
+### Data Definitions ######################################################
+
+# A pair number is the position of a spinlink in VisibilityMatrix.pairs.
+# A mask is an integer with bit b set for the spectrum at position b of
+# VisibilityMatrix.spectra; bit 0 is always spectrum 0, the default.
+# spectrumIDs are integers.
+
+DEFAULT_RATE = '0.000000'
+DEFAULT_CODE = '0'
+
+### Helper functions ######################################################
+
+def instIndex(insts):
+    """
+    instIndex: list of inst elements -> dict[spectrumID,inst element]
+    returns the <inst> that counts for each spectrum, the last one given.
+    """
+    index = {}
+    for inst in insts:
+        index[int(inst.get('spec'))] = inst
+    return index
+
+def instVisible(index, spectrumID):
+    """
+    instVisible: dict from instIndex(), spectrumID -> bool
+    returns true if a spinlink with these <inst> children is visible in the
+    spectrum: as its <inst> for that spectrum says, or else as its <inst>
+    for spectrum 0 says, or else visible.
+    """
+    inst = index.get(spectrumID)
+    if inst is None:
+        inst = index.get(0)
+    return inst is None or inst.get('visi') == '1'
+
+### Visibility matrix #####################################################
+
+class VisibilityMatrix(object):
+    """
+    VisibilityMatrix reads the <inst> children of the given pairs into
+    bitsets. explicit[n] has a bit set for every spectrum that pair n has an
+    <inst> for, and visible[n] the visibility given by that <inst>.
+    """
+
+    def __init__(self, pairs):
+        self.pairs = list(pairs)
+        self.bits = {0: 0} # spectrumID -> bit
+        self.spectra = [0] # bit -> spectrumID
+        self.explicit = []
+        self.visible = []
+        self.extras = {} # (pair number, spectrumID) -> (rate, code), when not the defaults
+        self.changed = {}
+        self.numbers = {}
+        for number in range(len(self.pairs)):
+            pair = self.pairs[number]
+            lhs = int(pair.get('lhs'))
+            rhs = int(pair.get('rhs'))
+            self.numbers.setdefault((min(lhs,rhs), max(lhs,rhs)), number)
+            explicit = 0
+            visible = 0
+            for inst in pair.findall('inst'):
+                spectrumID = int(inst.get('spec'))
+                bit = 1 << self.bit(spectrumID)
+                explicit = explicit | bit
+                if inst.get('visi') == '1':
+                    visible = visible | bit
+                else:
+                    visible = visible & ~bit
+                rateAndCode = (inst.get('rate', DEFAULT_RATE), inst.get('code', DEFAULT_CODE))
+                if rateAndCode != (DEFAULT_RATE, DEFAULT_CODE):
+                    self.extras[(number, spectrumID)] = rateAndCode
+                elif (number, spectrumID) in self.extras:
+                    del self.extras[(number, spectrumID)]
+            self.explicit.append(explicit)
+            self.visible.append(visible)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    ### Spectra and pairs #################################################
+
+    def bit(self, spectrumID):
+        """Return the bit of a spectrum, giving it the next one if it has none."""
+        try:
+            return self.bits[spectrumID]
+        except KeyError:
+            self.bits[spectrumID] = len(self.spectra)
+            self.spectra.append(spectrumID)
+            return self.bits[spectrumID]
+
+    def mask(self, spectrumIDs):
+        """mask: list of spectrumIDs -> mask, with the bits of those spectra set."""
+        mask = 0
+        for spectrumID in spectrumIDs:
+            mask = mask | (1 << self.bit(spectrumID))
+        return mask
+
+    def number(self, lhs, rhs):
+        """
+        number: spinID, spinID -> pair number
+        returns the number of the spinlink between two spins, in either
+        order, or raises a KeyError if there is none.
+        """
+        return self.numbers[(min(lhs,rhs), max(lhs,rhs))]
+
+    ### Queries ###########################################################
+
+    def isVisible(self, number, spectrumID):
+        """
+        isVisible: pair number, spectrumID -> bool
+        returns true if the spinlink is visible in the spectrum.
+        """
+        explicit = self.explicit[number]
+        bit = self.bits.get(spectrumID)
+        if bit is not None and explicit >> bit & 1:
+            return bool(self.visible[number] >> bit & 1)
+        if explicit & 1:
+            return bool(self.visible[number] & 1)
+        return True
+
+    def visibleIn(self, spectrumID):
+        """visibleIn: spectrumID -> list of pair numbers, of the spinlinks visible in the spectrum."""
+        return [number for number in range(len(self.pairs)) if self.isVisible(number, spectrumID)]
+
+    ### Changes ###########################################################
+
+    def show(self, numbers, mask):
+        """show: list of pair numbers, mask -> void, makes the spinlinks visible in the masked spectra."""
+        for number in numbers:
+            self.explicit[number] = self.explicit[number] | mask
+            self.visible[number] = self.visible[number] | mask
+            self.changed[number] = True
+
+    def hide(self, numbers, mask):
+        """hide: list of pair numbers, mask -> void, makes the spinlinks invisible in the masked spectra."""
+        for number in numbers:
+            self.explicit[number] = self.explicit[number] | mask
+            self.visible[number] = self.visible[number] & ~mask
+            self.changed[number] = True
+
+    def clear(self, numbers, mask):
+        """
+        clear: list of pair numbers, mask -> void
+        removes the visibility of the spinlinks in the masked spectra, which
+        then follow spectrum 0. Clearing spectrum 0 makes the spinlinks
+        visible by default. Rates and codes for those spectra are dropped.
+        """
+        spectrumIDs = [self.spectra[bit] for bit in range(len(self.spectra)) if mask >> bit & 1]
+        for number in numbers:
+            self.explicit[number] = self.explicit[number] & ~mask
+            self.visible[number] = self.visible[number] & ~mask
+            for spectrumID in spectrumIDs:
+                if (number, spectrumID) in self.extras:
+                    del self.extras[(number, spectrumID)]
+            self.changed[number] = True
+
+    ### Writing ###########################################################
+
+    def minimalInsts(self, number):
+        """
+        minimalInsts: pair number -> list of (spectrumID, visi, rate, code)
+        returns the fewest <inst> that give the spinlink its visibility, in
+        order of spectrumID: none for spectra that have the default
+        visibility and the default rate and code.
+        """
+        explicit = self.explicit[number]
+        visible = self.visible[number]
+        if explicit & 1:
+            default = visible & 1
+        else:
+            default = 1
+        insts = []
+        for bit in range(len(self.spectra)):
+            if explicit >> bit & 1:
+                spectrumID = self.spectra[bit]
+                visi = visible >> bit & 1
+                rate, code = self.extras.get((number, spectrumID), (DEFAULT_RATE, DEFAULT_CODE))
+                if bit == 0:
+                    needed = visi != 1
+                else:
+                    needed = visi != default
+                if needed or (rate, code) != (DEFAULT_RATE, DEFAULT_CODE):
+                    insts.append((spectrumID, visi, rate, code))
+        insts.sort()
+        return insts
+
+    def writePair(self, number):
+        """
+        writePair: pair number -> bool
+        brings the <inst> children of a spinlink in line with
+        minimalInsts(). The last <inst> of each spectrum that is still
+        needed is updated in place, new ones are appended, and the rest are
+        removed. Returns true if anything changed.
+        """
+        pair = self.pairs[number]
+        existing = pair.findall('inst')
+        index = instIndex(existing)
+        kept = {}
+        changed = False
+        tail = None
+        for inst in existing:
+            tail = tail or inst.tail # keep the layout of the old children
+        for spectrumID, visi, rate, code in self.minimalInsts(number):
+            inst = index.get(spectrumID)
+            if inst is None:
+                inst = ET.Element("inst")
+                inst.attrib["spec"] = str(spectrumID)
+                inst.tail = tail
+                pair.append(inst)
+                changed = True
+            for key, value in (("rate", rate), ("code", code), ("visi", str(visi))):
+                if inst.get(key) != value:
+                    inst.set(key, value)
+                    changed = True
+            kept[id(inst)] = True
+        for inst in existing:
+            if id(inst) not in kept:
+                pair.remove(inst)
+                changed = True
+        return changed
+
+    def writeBack(self, everything=False):
+        """
+        writeBack: bool -> int
+        writes the visibility of every spinlink changed since the last
+        writeBack(), or of every spinlink if everything is True, back to its
+        <inst> children with writePair(). Returns the number of spinlinks
+        whose <inst> children changed.
+        """
+        if everything:
+            numbers = range(len(self.pairs))
+        else:
+            numbers = self.changed.keys()
+            numbers.sort()
+        numChanged = 0
+        for number in numbers:
+            if self.writePair(number):
+                numChanged = numChanged + 1
+        self.changed = {}
+        return numChanged
@@ -0,0 +1,173 @@
+"""
+caraXML.py chooses the XML library used to read and write CARA repositories.
+lxml.etree is used if it is installed, because its parser is much faster on
+large repositories; otherwise the standard library's cElementTree, or
+ElementTree if that is missing too. Set the environment variable
+CARA_XML_BACKEND to 'lxml', 'cElementTree' or 'ElementTree' to choose one
+explicitly.
+
+Scripts import this module in place of xml.etree.ElementTree:
+
+import caraXML as ET
+
+and use ET.parse(), ET.iterparse(), ET.Element(), ET.SubElement() and
+ET.write(tree, outfile). Elements from different libraries cannot be mixed,
+so new elements must always be made with ET.Element() or ET.SubElement().
+
+Output is always written by write() below, whichever library parsed the
+file, so it is byte-for-byte the same as ElementTree's tree.write().
+"""
+
+### Import some libraries #################################################
+
+import os # for reading the CARA_XML_BACKEND environment variable
+
+def loadBackend(name):
+    """
+    loadBackend: string -> (string, module) or None
+    imports the named XML library, returning None if it is not installed.
+    """
+    try:
+        if name == 'lxml':
+            import lxml.etree as etree
+        elif name == 'cElementTree':
+            import xml.etree.cElementTree as etree
+        elif name == 'ElementTree':
+            import xml.etree.ElementTree as etree
+        else:
+            raise NameError,"Unknown XML backend \"%s\"."%name
+    except ImportError:
+        return None
+    return (name, etree)
+
+requested = os.environ.get('CARA_XML_BACKEND')
+if requested:
+    choices = [requested]
+else:
+    choices = ['lxml','cElementTree','ElementTree']
+for choice in choices:
+    loaded = loadBackend(choice)
+    if loaded:
+        break
+if not loaded:
+    raise ImportError,"The XML backend \"%s\" is not installed."%requested
+backend, etree = loaded
+
+Element = etree.Element
+SubElement = etree.SubElement
+
+### Parsing ###############################################################
+
+def parse(source):
+    """
+    parse: filename or file -> tree
+    parses a whole repository. Comments and processing instructions are
+    dropped, as ElementTree drops them.
+    """
+    if backend == 'lxml':
+        parser = etree.XMLParser(remove_comments=True, remove_pis=True, huge_tree=True)
+        return etree.parse(source, parser)
+    return etree.parse(source)
+
+def iterparse(source, events=('end',)):
+    """
+    iterparse: filename or file, tuple -> iterator of (event, element)
+    parses a repository incrementally, as ElementTree.iterparse does.
+    """
+    if backend == 'lxml':
+        return etree.iterparse(source, events=events, remove_comments=True,
+                               remove_pis=True, huge_tree=True)
+    return etree.iterparse(source, events=events)
+
+### Serialization helpers #################################################
+
+# These mirror the escaping rules of ElementTree.write() with its default
+# us-ascii encoding, so that output matches tree.write() exactly.
+
+def encodeText(text):
+    """
+    encodeText: string -> string
+    returns text encoded as ascii, with character references for anything
+    outside of ascii.
+    """
+    if isinstance(text, unicode):
+        return text.encode('us-ascii', 'xmlcharrefreplace')
+    return text
+
+def escapeCdata(text):
+    """
+    escapeCdata: string -> string
+    escapes element text or tail for output.
+    """
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return encodeText(text)
+
+def escapeAttrib(text):
+    """
+    escapeAttrib: string -> string
+    escapes an attribute value for output inside double quotes.
+    """
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    if '"' in text:
+        text = text.replace('"', '&quot;')
+    if '\n' in text:
+        text = text.replace('\n', '&#10;')
+    return encodeText(text)
+
+def startTag(elem):
+    """
+    startTag: element -> string
+    returns the opening of a start tag, '<tag a="1" b="2"', without the
+    closing bracket. Attributes are sorted, as tree.write() sorts them.
+    """
+    items = elem.items()
+    items.sort()
+    parts = ['<', encodeText(elem.tag)]
+    for key, value in items:
+        parts.append(' %s="%s"'%(encodeText(key), escapeAttrib(value)))
+    return ''.join(parts)
+
+def writeElement(elem, write):
+    """
+    writeElement: element, function -> void
+    passes the serialized element, its children and its tail to write.
+    """
+    if elem.text or len(elem):
+        write(startTag(elem) + '>')
+        if elem.text:
+            write(escapeCdata(elem.text))
+        for child in elem:
+            writeElement(child, write)
+        write('</%s>'%encodeText(elem.tag))
+    else:
+        write(startTag(elem) + ' />')
+    if elem.tail:
+        write(escapeCdata(elem.tail))
+
+def write(tree, outfile):
+    """
+    write: tree or element, filename or file -> void
+    writes out a whole repository, exactly as ElementTree's tree.write()
+    would, whichever library parsed it.
+    """
+    if hasattr(tree, 'getroot'):
+        root = tree.getroot()
+    else:
+        root = tree
+    if hasattr(outfile, 'write'):
+        output = outfile
+    else:
+        output = open(outfile, 'wb')
+    writeElement(root, output.write)
+    if output is not outfile:
+        output.close()
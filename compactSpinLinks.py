@@ -0,0 +1,87 @@
+#!/nmr/programs/python/bin/python2.5
+"""
+compactSpinLinks.py reads in a CARA repository, and generates a new one in
+which every spinlink has at most one <inst> child per spectrum. Older
+versions of hideSpinLinks.py and showSpinLinks.py appended new <inst>
+children on every run, so that repositories grew with duplicates. The last
+<inst> of each spectrum, the one that counts, is kept and the others are
+removed, as are those that only repeat the default visibility. The
+visibility of every spinlink in every spectrum stays the same.
+
+Use compactSpinLinks.py -h or compactSpinLinks.py --help to learn more about inputs.
+"""
+
+### Import some libraries #################################################
+
+from optparse import OptionParser # for parsing commandline input
+from sys import stdout, stderr # for output to screen instead of to file
+from os.path import exists # for making sure not to overwrite files
+from caraRepository import CaraRepository # for reading and indexing the repository
+from caraProfile import Profiler # for the --profile option
+from caraOperations import compactSpinLinks # for collapsing the <inst> children
+
+### Data Definitions ######################################################
+
+# spinlink is an xml element representing an NOE from a CARA spinlink
+#   Here is a spinlink after hideSpinLinks.py was run twice:
+#   <pair lhs='37' rhs='1979'>
+#   <inst spec='174' rate='0.000000' code='0' visi='0'/>
+#   <inst spec='174' rate='0.000000' code='0' visi='0'/>
+#   </pair>
+#   and here it is compacted:
+#   <pair lhs='37' rhs='1979'>
+#   <inst spec='174' rate='0.000000' code='0' visi='0'/>
+#   </pair>
+
+### Main body of the script ###############################################
+
+def main():
+    parser = OptionParser() # creates an instance of the parser
+    parser.usage = "%prog -i input.cara [-o output.cara] [-p project-name]"
+    parser.description = "%prog  reads in a CARA repository and collapses the visibility records of every spinlink to at most one per spectrum, without changing where the spinlink is visible."
+    parser.epilog = ""
+    parser.add_option("-i", "--input", dest="infile",type="string",default=None,
+                      help="name of original CARA repository, required.", metavar="FILE")
+    parser.add_option("-o", "--output", dest="outfile",type="string",default=None,
+                      help="name of new CARA repository, defaults to stdout.", metavar="FILE")
+    parser.add_option("-p", "--project", metavar="NAME", dest="project", default=None,type="string",
+                      help="name of project to alter, if there is more than one project in the repository, defaults to the first project.")
+    parser.add_option("--profile", dest="profile", action="store_true", default=False,
+                      help="report the time and peak memory of each phase of the run, and the number of elements visited and modified, on stderr.")
+
+    # Now parse the command-line options
+    (options, args) = parser.parse_args()
+
+    infile = options.infile
+    outfile = options.outfile
+    projectName = options.project
+    profiler = Profiler(options.profile)
+
+    if infile == None:
+        parser.print_help()
+        parser.error("Please specify an input cara file.")
+
+    if outfile == None:
+        outfile = stdout
+        log = stderr
+    elif exists(outfile):
+        print '\nOutput file \'%s\' exists. Choose a new name to avoid overwriting.\n'%outfile
+        return
+    else:
+        log = stdout
+
+    # Now that we have an input file and we know where to send the output, we parse the xml,
+    # selecting a project according to command-line input, defaulting to the first project.
+
+    repository = CaraRepository(infile,projectName,profiler=profiler)
+    profiler.switch('transform')
+
+    numChanged, before, after = compactSpinLinks(repository)
+    print >>log, 'Compacted %d of %d spinlinks, from %d to %d inst elements.'%(
+        numChanged,len(repository.pairs),before,after)
+
+    repository.write(outfile)
+    profiler.report()
+
+if __name__ == '__main__':
+    main()
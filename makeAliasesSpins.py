@@ -9,20 +9,9 @@ indicated tag (-t) to spins.
 
 from optparse import OptionParser # for parsing commandline input
 from sys import stdout # for output to screen instead of to file
-import xml.etree.ElementTree as ET # for parsing XML
 from os.path import exists # for making sure not to overwrite files
-
-### Helper functions ######################################################
-
-def getProject(projectName,projects):
-    """This function, getProject, is only used if the user specifies a project
-    name from the command line, rather than simply allowing the script to
-    select the first (and likely only) project in a repository."""
-    for project in projects:
-        if project.get('name') == projectName:
-            return project
-    # if that doesn't work, raise an error: 
-    raise NameError,"There is no project named \"%s\"."%projectName
+from caraRepository import CaraRepository # for reading and indexing the repository
+from caraProfile import Profiler # for the --profile option
 
 ### Main body of the script ###############################################
 
@@ -57,12 +46,16 @@ def main():
                       help="tag of spins to shift, eg N. Required.")
     parser.add_option("-s", "--spectrum",metavar="SPECID",dest="specID",default=None,type="int",
                       help="ID of spectrum with aliases to shift")
+    parser.add_option("--profile", dest="profile", action="store_true", default=False,
+                      help="Report the time and peak memory of each phase of the run, and the number of elements visited and modified, on stderr.")
+
     # Now parse the command-line options
     (options, args) = parser.parse_args()
 
     infile = options.infile
     outfile = options.outfile
     projectName = options.project
+    profiler = Profiler(options.profile)
     tagToCopy = options.tagToCopy
     specIDtoCopy = str(options.specID)
     
@@ -85,33 +78,16 @@ def main():
         parser.print_help()
         parser.error("Please specify a spectrum ID.")
 
-    # Now that we have an input file and we know where to send the output, we parse the xml.
-
-    tree = ET.parse(infile)
-    root = tree.getroot() #retrieves the whole repository
-    projects = root.findall('project') #retrieves every project in the repository
+    # Now that we have an input file and we know where to send the output, we parse the xml,
+    # selecting a project according to command-line input, defaulting to the first project.
 
-# Select a project according to command-line input, defaulting to the first project
-
-    if projectName:
-        project = getProject(projectName,projects)
-        if not project:
-            print 'No project found with name \"%s\".'%projectName
-            return
-    else:
-        project = projects[0]
-        if not project:
-            print 'No project found.'
-            return
+    repository = CaraRepository(infile,projectName,profiler=profiler)
+    profiler.switch('transform')
 
 # Convert spins
 
-    spinbase = project.find('spinbase')
-    spins = spinbase.findall('spin')
-
-
-    
-    for spin in spins:
+    numCopied = 0
+    for spin in repository.spins:
         tag = spin.get('tag')
         if tag == tagToCopy:
             positions = spin.findall('pos')
@@ -121,10 +97,13 @@ def main():
                 unalias = [pos for pos in positions if pos.get('spec') == '0'][0]
                 
                 unalias.set('shift',posToCopy.get('shift'))
+                numCopied = numCopied + 1
+    profiler.count(len(repository.spins),numCopied)
                 
 # Write out the modified xml tree
 
-    tree.write(outfile)
+    repository.write(outfile)
+    profiler.report()
 
 # Execute everything
 main()
@@ -0,0 +1,370 @@
+#!/nmr/programs/python/bin/python2.5
+"""
+makeSyntheticRepository.py writes a made-up CARA repository of any size, for
+measuring how the scripts perform (see caraBenchmark.py). The repository has
+a residue-type library, and in each project a sequence, spectra, spin
+systems (most of them assigned, and linked in sequence order), spins with
+shifts typical of their atoms, aliases in the spectra, spinlinks with inst
+children, and peaklists of 3D NOESY peaks, each with its positions, the
+spins it is assigned to and, for most peaks, the label of its system as
+CARA writes it. Optionally a CYANA UPL file is written as well, with
+restraints between the amide and other protons of assigned systems, using
+system IDs as residue numbers as AddSpinLinksFromUpls.py expects.
+
+The same seed always gives the same repository. The peaklists are written
+last, so adding them leaves the rest of the repository for a seed as it was.
+
+Use makeSyntheticRepository.py -h to learn more about inputs.
+"""
+
+### Import some libraries #################################################
+
+from optparse import OptionParser # for parsing commandline input
+from os.path import exists # for making sure not to overwrite files
+import random # for the made-up contents
+
+### Data Definitions ######################################################
+
+# AMINO_ACIDS is a dict[residueType,(letter,name,atom names)]. Only H, C and
+# N atoms are listed, backbone first.
+
+AMINO_ACIDS = {
+    'ALA': ('A','Alanine',['H','N','CA','HA','C','CB','HB']),
+    'ARG': ('R','Arginine',['H','N','CA','HA','C','CB','HB2','HB3','CG','HG2','HG3','CD','HD2','HD3','NE','HE']),
+    'ASN': ('N','Asparagine',['H','N','CA','HA','C','CB','HB2','HB3','CG','ND2','HD21','HD22']),
+    'ASP': ('D','Aspartate',['H','N','CA','HA','C','CB','HB2','HB3','CG']),
+    'CYS': ('C','Cysteine',['H','N','CA','HA','C','CB','HB2','HB3','HG']),
+    'GLN': ('Q','Glutamine',['H','N','CA','HA','C','CB','HB2','HB3','CG','HG2','HG3','CD','NE2','HE21','HE22']),
+    'GLU': ('E','Glutamate',['H','N','CA','HA','C','CB','HB2','HB3','CG','HG2','HG3','CD']),
+    'GLY': ('G','Glycine',['H','N','CA','HA2','HA3','C']),
+    'HIS': ('H','Histidine',['H','N','CA','HA','C','CB','HB2','HB3','CG','ND1','HD1','CD2','HD2','CE1','HE1']),
+    'ILE': ('I','Isoleucine',['H','N','CA','HA','C','CB','HB','CG1','HG12','HG13','CG2','HG2','CD1','HD1']),
+    'LEU': ('L','Leucine',['H','N','CA','HA','C','CB','HB2','HB3','CG','HG','CD1','HD1','CD2','HD2']),
+    'LYS': ('K','Lysine',['H','N','CA','HA','C','CB','HB2','HB3','CG','HG2','HG3','CD','HD2','HD3','CE','HE2','HE3']),
+    'MET': ('M','Methionine',['H','N','CA','HA','C','CB','HB2','HB3','CG','HG2','HG3','CE','HE']),
+    'PHE': ('F','Phenylalanine',['H','N','CA','HA','C','CB','HB2','HB3','CD1','HD1','CE1','HE1','CZ','HZ']),
+    'PRO': ('P','Proline',['N','CA','HA','C','CB','HB2','HB3','CG','HG2','HG3','CD','HD2','HD3']),
+    'SER': ('S','Serine',['H','N','CA','HA','C','CB','HB2','HB3','HG']),
+    'THR': ('T','Threonine',['H','N','CA','HA','C','CB','HB','HG1','CG2','HG2']),
+    'TRP': ('W','Tryptophan',['H','N','CA','HA','C','CB','HB2','HB3','CD1','HD1','NE1','HE1','CZ2','HZ2','CH2','HH2']),
+    'TYR': ('Y','Tyrosine',['H','N','CA','HA','C','CB','HB2','HB3','CD1','HD1','CE1','HE1']),
+    'VAL': ('V','Valine',['H','N','CA','HA','C','CB','HB','CG1','HG1','CG2','HG2']),
+    }
+
+RESIDUE_TYPES = AMINO_ACIDS.keys()
+RESIDUE_TYPES.sort()
+
+ATOM_TYPES = {'H': 'H1', 'C': 'C13', 'N': 'N15'}
+
+# PEAK_TAGS is a list of (fraction, format) for the tags of peaks; the
+# format is given the system ID, and the peaks left over are untagged. The
+# first two are the labels CARA writes, the last one is typed in.
+
+PEAK_TAGS = [(0.6, '%d'), (0.2, '%d HN'), (0.1, '%d ambiguous')]
+
+# SHIFTS is a dict[atom name,(mean shift,spread)] in ppm; other atoms fall
+# back on the entry for their element.
+
+SHIFTS = {
+    'H': (8.3,0.6), 'N': (120.0,4.0), 'CA': (56.5,4.0), 'HA': (4.4,0.4),
+    'C': (176.0,2.0), 'CB': (38.0,10.0), 'HB': (2.5,1.0), 'HB2': (2.5,1.0),
+    'HB3': (2.5,1.0), 'element H': (2.0,1.5), 'element C': (30.0,15.0),
+    'element N': (110.0,20.0),
+    }
+
+### Helper functions ######################################################
+
+def typicalShift(name):
+    """
+    typicalShift: atom name -> float
+    returns a random shift in the usual range for an atom.
+    """
+    mean, spread = SHIFTS.get(name, SHIFTS['element %s'%name[0]])
+    return random.gauss(mean, spread/2.0)
+
+def writeLibrary(write):
+    """writeLibrary: function -> void, writes the residue-type library."""
+    write("<library>\n")
+    for residueType in RESIDUE_TYPES:
+        letter, name, atoms = AMINO_ACIDS[residueType]
+        write("<residue-type id='%s' name='%s' letter='%s' short='%s'>\n"%(
+            residueType, name, letter, residueType.capitalize()))
+        for atom in atoms:
+            write("<atom name='%s' type='%s'/>\n"%(atom, ATOM_TYPES[atom[0]]))
+        write("</residue-type>\n")
+    write("</library>\n")
+
+def peakTag(systemID):
+    """
+    peakTag: int -> string
+    returns a random tag for a peak of the system, drawn from PEAK_TAGS.
+    """
+    draw = random.random()
+    for fraction, tagFormat in PEAK_TAGS:
+        if draw < fraction:
+            return tagFormat%systemID
+        draw = draw - fraction
+    return ''
+
+def writePeaklists(write, peaklists, peaksPerList, spectrumIDs, amides, protons, aliases):
+    """
+    writePeaklists: function, int, int, list, list, list, int -> dict[string,int]
+    writes peaklists of 3D NOESY peaks, each at the amide (systemID, H spin,
+    N spin, H shift, N shift) of a random system, and assigned to another
+    proton (spin, shift) from protons in most cases. A peak has an alias
+    position in one spectrum if aliases is not 0. Returns the number of
+    each element written.
+    """
+    counts = {'peaklist': 0, 'peak': 0, 'peakpos': 0, 'peakass': 0}
+    if not amides or not spectrumIDs:
+        return counts
+    for peaklistID in range(1, peaklists+1):
+        write("<peaklist id='%d' name='NOESY %d' home='%d'>\n"%(
+            peaklistID, peaklistID, random.choice(spectrumIDs)))
+        for peakID in range(1, peaksPerList+1):
+            systemID, amideSpin, nitrogenSpin, amideShift, nitrogenShift = random.choice(amides)
+            if protons and random.random() < 0.8:
+                otherSpin, otherShift = random.choice(protons)
+            else:
+                otherSpin, otherShift = 0, typicalShift('HA')
+            write("<peak id='%d' tag='%s'>\n"%(peakID, peakTag(systemID)))
+            write("<pos spec='0' x0='%f' x1='%f' x2='%f'/>\n"%(amideShift, nitrogenShift, otherShift))
+            counts['peakpos'] = counts['peakpos'] + 1
+            if aliases:
+                write("<pos spec='%d' x0='%f' x1='%f' x2='%f'/>\n"%(random.choice(spectrumIDs),
+                    amideShift+random.gauss(0.0,0.02), nitrogenShift+random.gauss(0.0,0.2), otherShift))
+                counts['peakpos'] = counts['peakpos'] + 1
+            write("<ass x0='%d' x1='%d' x2='%d'/>\n"%(amideSpin, nitrogenSpin, otherSpin))
+            write("</peak>\n")
+        write("</peaklist>\n")
+    counts['peaklist'] = peaklists
+    counts['peak'] = peaklists*peaksPerList
+    counts['peakass'] = counts['peak']
+    return counts
+
+def writeProject(write, name, residues, systems, spinsPerSystem, aliases,
+                 spectra, pairs, instsPerPair, unassigned, protons,
+                 peaklists=0, peaksPerList=0):
+    """
+    writeProject: function, string, int, int, int, int, int, int, int, float, list, int, int -> dict[string,int]
+    writes one project, and returns the number of each element written.
+    If protons is a list, (systemID, residueType, tag) is appended to it for
+    every proton of an assigned system, for writing UPL restraints.
+    """
+    counts = {'residue': 0, 'spectrum': 0, 'spinsys': 0, 'spin': 0, 'pos': 0,
+              'link': 0, 'pair': 0, 'inst': 0}
+    write("<project name='%s'>\n"%name)
+
+    write("<sequence>\n")
+    sequence = []
+    for residueID in range(1, residues+1):
+        residueType = random.choice(RESIDUE_TYPES)
+        sequence.append(residueType)
+        write("<residue id='%d' type='%s' chain='A' nr='%d'/>\n"%(residueID, residueType, residueID))
+    write("</sequence>\n")
+    counts['residue'] = residues
+
+    spectrumIDs = range(1, spectra+1)
+    for spectrumID in spectrumIDs:
+        write("<spectrum id='%d' name='spectrum %d' type='NOESY' path='/data/spectrum%d.nmr'/>\n"%(
+            spectrumID, spectrumID, spectrumID))
+    counts['spectrum'] = spectra
+
+    # System IDs are scattered, as they are after a long assignment session.
+    systemIDs = random.sample(xrange(1, 10*systems+1), systems)
+    numAssigned = min(residues, int(round(systems*(1.0-unassigned))))
+
+    write("<spinbase>\n")
+    spinID = 0
+    assignedProtons = [] # spin IDs of protons in assigned systems
+    allProtons = [] # (spin ID, shift) of every proton, for peak assignments
+    amides = [] # (system ID, H spin, N spin, H shift, N shift), for peaks
+    for number in range(systems):
+        if number < numAssigned:
+            residueType = sequence[number]
+        else:
+            residueType = random.choice(RESIDUE_TYPES)
+        atoms = AMINO_ACIDS[residueType][2]
+        if spinsPerSystem:
+            atoms = atoms[:spinsPerSystem]
+        amide = {}
+        for atom in atoms:
+            spinID = spinID + 1
+            shift = typicalShift(atom)
+            write("<spin id='%d' atom='%s' tag='%s' sys='%d' off='0'>\n"%(
+                spinID, ATOM_TYPES[atom[0]], atom, systemIDs[number]))
+            write("<pos spec='0' shift='%f'/>\n"%shift)
+            for spectrumID in random.sample(spectrumIDs, min(aliases, spectra)):
+                write("<pos spec='%d' shift='%f'/>\n"%(spectrumID, shift+random.gauss(0.0,0.02)))
+                counts['pos'] = counts['pos'] + 1
+            write("</spin>\n")
+            counts['pos'] = counts['pos'] + 1
+            if atom in ('H', 'N'):
+                amide[atom] = (spinID, shift)
+            if atom[0] == 'H':
+                allProtons.append((spinID, shift))
+            if atom[0] == 'H' and number < numAssigned:
+                assignedProtons.append(spinID)
+                if protons is not None:
+                    protons.append((systemIDs[number], residueType, atom))
+        if len(amide) == 2:
+            amides.append((systemIDs[number], amide['H'][0], amide['N'][0], amide['H'][1], amide['N'][1]))
+    counts['spin'] = spinID
+
+    for number in range(systems):
+        if number < numAssigned:
+            write("<spinsys id='%d' ass='%d'/>\n"%(systemIDs[number], number+1))
+        else:
+            write("<spinsys id='%d'/>\n"%systemIDs[number])
+    counts['spinsys'] = systems
+
+    for number in range(1, numAssigned):
+        write("<link pred='%d' succ='%d'/>\n"%(systemIDs[number-1], systemIDs[number]))
+    counts['link'] = max(numAssigned-1, 0)
+
+    written = {}
+    attempts = 0
+    while len(written) < pairs and len(assignedProtons) > 1 and attempts < 10*pairs:
+        attempts = attempts + 1
+        lhs, rhs = random.sample(assignedProtons, 2)
+        if (min(lhs,rhs), max(lhs,rhs)) in written:
+            continue
+        written[(min(lhs,rhs), max(lhs,rhs))] = True
+        write("<pair lhs='%d' rhs='%d'>\n"%(lhs, rhs))
+        for spectrumID in random.sample(spectrumIDs, min(instsPerPair, spectra)):
+            write("<inst spec='%d' rate='%f' code='0' visi='%d'/>\n"%(
+                spectrumID, random.random(), random.randint(0,1)))
+            counts['inst'] = counts['inst'] + 1
+        write("</pair>\n")
+    counts['pair'] = len(written)
+
+    write("</spinbase>\n")
+
+    # Peaklists come last, so that the random draws for the rest of the
+    # project are the same with or without them.
+    counts.update(writePeaklists(write, peaklists, peaksPerList, spectrumIDs,
+                                 amides, allProtons, aliases))
+    write("</project>\n")
+    return counts
+
+def writeUpl(uplfile, protons, restraints):
+    """
+    writeUpl: filename, list, int -> int
+    writes up to restraints UPL lines between protons of different systems.
+    Returns the number of lines written.
+    """
+    openfile = open(uplfile, 'w')
+    openfile.write('# synthetic restraints written by makeSyntheticRepository.py\n')
+    numWritten = 0
+    attempts = 0
+    while numWritten < restraints and len(protons) > 1 and attempts < 10*restraints:
+        attempts = attempts + 1
+        left, right = random.sample(protons, 2)
+        if left[0] == right[0]:
+            continue
+        openfile.write('%5d %-4s %-5s %5d %-4s %-5s %5.2f\n'%(
+            left + right + (random.uniform(3.0, 6.0),)))
+        numWritten = numWritten + 1
+    openfile.close()
+    return numWritten
+
+def writeRepository(outfile, residues=100, systems=None, spinsPerSystem=None, aliases=1,
+                    spectra=5, pairs=1000, instsPerPair=1, projects=1, unassigned=0.1,
+                    uplfile=None, restraints=None, seed=0, peaklists=0, peaksPerList=0):
+    """
+    writeRepository: filename, int, int, int, int, int, int, int, int, float, filename, int, int, int, int -> dict[string,int]
+    writes a synthetic repository and returns the number of each element in
+    it, summed over projects. systems defaults to the number of residues,
+    and a fraction unassigned of them are left unassigned. Each system has
+    the spins of its residue type, or only the first spinsPerSystem of them.
+    If uplfile is given, restraints (default: pairs) UPL restraints for the
+    first project are written to it. Each project gets peaklists
+    peaklists of peaksPerList peaks.
+    """
+    random.seed(seed)
+    if systems is None:
+        systems = residues
+    if restraints is None:
+        restraints = pairs
+    openfile = open(outfile, 'w')
+    write = openfile.write
+    write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    write("<repository version='1.8.4' author='makeSyntheticRepository.py'>\n")
+    writeLibrary(write)
+    totals = {}
+    protons = None
+    for number in range(projects):
+        if uplfile and number == 0:
+            protons = []
+        else:
+            protons = None
+        counts = writeProject(write, 'synthetic%d'%(number+1), residues, systems, spinsPerSystem,
+                              aliases, spectra, pairs, instsPerPair, unassigned, protons,
+                              peaklists, peaksPerList)
+        if protons is not None:
+            counts['restraint'] = writeUpl(uplfile, protons, restraints)
+        for key, value in counts.items():
+            totals[key] = totals.get(key, 0) + value
+    write("</repository>\n")
+    openfile.close()
+    return totals
+
+### Main body of the script ###############################################
+
+def main():
+    parser = OptionParser() # creates an instance of the parser
+    parser.usage = "%prog -o output.cara [-r residues] [-y systems] [-s spins] [-a aliases] [-e spectra] [-n pairs] [-k insts] [-j projects] [-l peaklists] [-m peaks] [-u output.upl]"
+    parser.description = "%prog writes a synthetic CARA repository of the requested size, for benchmarking."
+    parser.epilog = ""
+    parser.add_option("-o", "--output", dest="outfile",type="string",default=None,
+                      help="name of new CARA repository, required.", metavar="FILE")
+    parser.add_option("-r", "--residues", dest="residues",type="int",default=100,
+                      help="number of residues in each project, defaults to 100.")
+    parser.add_option("-y", "--systems", dest="systems",type="int",default=None,
+                      help="number of spin systems in each project, defaults to the number of residues.")
+    parser.add_option("-s", "--spins", dest="spins",type="int",default=None,
+                      help="largest number of spins per system, defaults to every H, C and N atom of the residue type.")
+    parser.add_option("-a", "--aliases", dest="aliases",type="int",default=1,
+                      help="number of aliases per spin, defaults to 1.")
+    parser.add_option("-e", "--spectra", dest="spectra",type="int",default=5,
+                      help="number of spectra in each project, defaults to 5.")
+    parser.add_option("-n", "--pairs", dest="pairs",type="int",default=1000,
+                      help="number of spinlinks in each project, defaults to 1000.")
+    parser.add_option("-k", "--insts", dest="insts",type="int",default=1,
+                      help="number of inst children per spinlink, defaults to 1.")
+    parser.add_option("-j", "--projects", dest="projects",type="int",default=1,
+                      help="number of projects, defaults to 1.")
+    parser.add_option("-l", "--peaklists", dest="peaklists",type="int",default=0,
+                      help="number of peaklists in each project, defaults to 0.")
+    parser.add_option("-m", "--peaks", dest="peaks",type="int",default=0,
+                      help="number of peaks in each peaklist, defaults to 0.")
+    parser.add_option("-f", "--unassigned", dest="unassigned",type="float",default=0.1,
+                      help="fraction of spin systems left unassigned, defaults to 0.1.")
+    parser.add_option("-u", "--upl", dest="uplfile",type="string",default=None,
+                      help="name of a UPL file to write restraints for the first project to.", metavar="FILE")
+    parser.add_option("--seed", dest="seed",type="int",default=0,
+                      help="random seed, defaults to 0.")
+
+    # Now parse the command-line options
+    (options, args) = parser.parse_args()
+
+    if options.outfile == None:
+        parser.print_help()
+        parser.error("Please specify an output file.")
+
+    for filename in (options.outfile, options.uplfile):
+        if filename and exists(filename):
+            print '\nOutput file \'%s\' exists. Choose a new name to avoid overwriting.\n'%filename
+            return
+
+    counts = writeRepository(options.outfile, options.residues, options.systems, options.spins,
+                             options.aliases, options.spectra, options.pairs, options.insts,
+                             options.projects, options.unassigned, options.uplfile, None, options.seed,
+                             options.peaklists, options.peaks)
+    keys = counts.keys()
+    keys.sort()
+    for key in keys:
+        print '%s: %d'%(key, counts[key])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/nmr/programs/python/bin/python2.5
+"""
+mergeSpinLinks.py reads in a CARA repository, and generates a new one in
+which every spinlink is written smallest spin ID first and appears only
+once. Repositories built from several UPL imports and CARA sessions can hold
+both (a,b) and (b,a), or the same spinlink twice. Duplicates are merged
+into the first of them, keeping one <inst> per spectrum that any of them
+had. Where the duplicates disagree about a spectrum, the policy decides:
+
+  last     the record read last wins (the default)
+  first    the record read first wins
+  visible  the spinlink is kept visible if any record shows it
+  hidden   the spinlink is kept hidden if any record hides it
+
+Every conflict is written to the log, followed by a summary.
+
+Use mergeSpinLinks.py -h or mergeSpinLinks.py --help to learn more about inputs.
+"""
+
+### Import some libraries #################################################
+
+from optparse import OptionParser # for parsing commandline input
+from sys import stdout, stderr # for output to screen instead of to file
+from os.path import exists # for making sure not to overwrite files
+from caraRepository import CaraRepository # for reading and indexing the repository
+from caraProfile import Profiler # for the --profile option
+from caraOperations import mergeDuplicatePairs, MERGE_POLICIES # for merging the spinlinks
+
+### Data Definitions ######################################################
+
+# spinlink is an xml element representing an NOE from a CARA spinlink
+#   Here are two duplicates that disagree about spectrum 174:
+#   <pair lhs='37' rhs='1979'>
+#   <inst spec='174' rate='0.000000' code='0' visi='0'/>
+#   </pair>
+#   <pair lhs='1979' rhs='37'>
+#   <inst spec='174' rate='0.000000' code='0' visi='1'/>
+#   <inst spec='176' rate='0.000000' code='0' visi='1'/>
+#   </pair>
+#   and here they are merged with the policy 'last':
+#   <pair lhs='37' rhs='1979'>
+#   <inst spec='174' rate='0.000000' code='0' visi='1'/>
+#   <inst spec='176' rate='0.000000' code='0' visi='1'/>
+#   </pair>
+
+### Main body of the script ###############################################
+
+def main():
+    policies = MERGE_POLICIES.keys()
+    policies.sort()
+    parser = OptionParser() # creates an instance of the parser
+    parser.usage = "%prog -i input.cara [-o output.cara] [-p project-name] [-m policy] [-l log]"
+    parser.description = "%prog  reads in a CARA repository, writes every spinlink smallest spin ID first, and merges spinlinks that join the same two spins."
+    parser.epilog = "Policies: %s."%', '.join(policies)
+    parser.add_option("-i", "--input", dest="infile",type="string",default=None,
+                      help="name of original CARA repository, required.", metavar="FILE")
+    parser.add_option("-o", "--output", dest="outfile",type="string",default=None,
+                      help="name of new CARA repository, defaults to stdout.", metavar="FILE")
+    parser.add_option("-p", "--project", metavar="NAME", dest="project", default=None,type="string",
+                      help="name of project to alter, if there is more than one project in the repository, defaults to the first project.")
+    parser.add_option("-m", "--policy", dest="policy",type="choice",choices=policies,default='last',
+                      help="how to resolve duplicates that disagree about a spectrum, defaults to %default.")
+    parser.add_option("-l","--log",metavar="FILE",dest="log",default=None,type="string",
+                      help="name of log file for the conflicts and the summary.")
+    parser.add_option("--profile", dest="profile", action="store_true", default=False,
+                      help="report the time and peak memory of each phase of the run, and the number of elements visited and modified, on stderr.")
+
+    # Now parse the command-line options
+    (options, args) = parser.parse_args()
+
+    infile = options.infile
+    outfile = options.outfile
+    projectName = options.project
+    profiler = Profiler(options.profile)
+
+    if infile == None:
+        parser.print_help()
+        parser.error("Please specify an input cara file.")
+
+    if outfile == None:
+        outfile = stdout
+        logfile = stderr
+    elif exists(outfile):
+        print '\nOutput file \'%s\' exists. Choose a new name to avoid overwriting.\n'%outfile
+        return
+    else:
+        logfile = stdout
+    if options.log != None:
+        logfile = open(options.log,'w')
+
+    # Now that we have an input file and we know where to send the output, we parse the xml,
+    # selecting a project according to command-line input, defaulting to the first project.
+
+    repository = CaraRepository(infile,projectName,profiler=profiler)
+    profiler.switch('transform')
+
+    counts = mergeDuplicatePairs(repository,options.policy,logfile)
+    print >>logfile, '%d spinlinks: %d reversed, %d duplicates merged into %d, %d conflicts resolved by %s; %d spinlinks left.'%(
+        counts['pairs'],counts['reversed'],counts['duplicates'],counts['merged'],
+        counts['conflicts'],options.policy,counts['pairs']-counts['duplicates'])
+    if options.log != None:
+        logfile.close()
+
+    repository.write(outfile)
+    profiler.report()
+
+if __name__ == '__main__':
+    main()
@@ -9,20 +9,12 @@ the option flag -s. Aliases are also shifted if the flag -a is used.
 
 from optparse import OptionParser # for parsing commandline input
 from sys import stdout # for output to screen instead of to file
-import xml.etree.ElementTree as ET # for parsing XML
 from os.path import exists # for making sure not to overwrite files
-
-### Helper functions ######################################################
-
-def getProject(projectName,projects):
-    """This function, getProject, is only used if the user specifies a project
-    name from the command line, rather than simply allowing the script to
-    select the first (and likely only) project in a repository."""
-    for project in projects:
-        if project.get('name') == projectName:
-            return project
-    # if that doesn't work, raise an error: 
-    raise NameError,"There is no project named \"%s\"."%projectName
+from caraRepository import CaraRepository # for reading and indexing the repository
+from caraStream import streamShiftSpins # for rewriting while reading
+from caraSplice import spliceShiftSpins # for changing only the shifts in place
+from caraProfile import Profiler # for the --profile option
+from caraOperations import shiftSpins, isCarbon # for the shift itself
 
 ### Main body of the script ###############################################
 
@@ -57,6 +49,12 @@ def main():
                       help="name of new CARA repository, defaults to stdout.", metavar="FILE")
     parser.add_option("-p", "--project", metavar="NAME", dest="project", default=None,type="string",
                       help="name of project to alter, if there is more than one project in the repository, defaults to the first project.")
+    parser.add_option("--stream", dest="stream", action="store_true", default=False,
+                      help="Rewrite the repository while reading it, so that memory use stays flat for very large repositories.")
+    parser.add_option("--splice", dest="splice", action="store_true", default=False,
+                      help="Copy the repository unchanged except for the new shifts, which is fastest for large repositories and leaves the rest of the file untouched.")
+    parser.add_option("--profile", dest="profile", action="store_true", default=False,
+                      help="Report the time and peak memory of each phase of the run, and the number of elements visited and modified, on stderr.")
 
     # Now parse the command-line options
     (options, args) = parser.parse_args()
@@ -66,6 +64,9 @@ def main():
     projectName = options.project
     shiftChange = options.shiftChange
     alias = options.alias
+    stream = options.stream
+    splice = options.splice
+    profiler = Profiler(options.profile)
 
     if shiftChange == None:
         parser.print_help()
@@ -81,43 +82,47 @@ def main():
         print '\nOutput file \'%s\' exists. Choose a new name to avoid overwriting.\n'%outfile
         return
 
-    # Now that we have an input file and we know where to send the output, we parse the xml.
-
-    tree = ET.parse(infile)
-    root = tree.getroot() #retrieves the whole repository
-    projects = root.findall('project') #retrieves every project in the repository
+    # For very large repositories, stream the file or splice in the new shifts
+    # instead of parsing it all at once.
 
-# Select a project according to command-line input, defaulting to the first project
-
-    if projectName:
-        project = getProject(projectName,projects)
-        if not project:
-            print 'No project found with name \"%s\".'%projectName
+    if stream:
+        profiler.switch('stream')
+        try:
+            numChanged = streamShiftSpins(infile,outfile,isCarbon,
+                                          lambda shift: shift+shiftChange,alias,projectName)
+        except NameError, e:
+            print '\n%s Try again.\n'%e
             return
-    else:
-        project = projects[0]
-        if not project:
-            print 'No project found.'
+        profiler.count(modified=numChanged)
+        profiler.report()
+        return
+
+    if splice:
+        profiler.switch('splice')
+        try:
+            numChanged = spliceShiftSpins(infile,outfile,isCarbon,
+                                          lambda shift: shift+shiftChange,alias,projectName)
+        except NameError, e:
+            print '\n%s Try again.\n'%e
             return
+        profiler.count(modified=numChanged)
+        profiler.report()
+        return
+
+    # Now that we have an input file and we know where to send the output, we parse the xml,
+    # selecting a project according to command-line input, defaulting to the first project.
+
+    repository = CaraRepository(infile,projectName,profiler=profiler)
 
 # Convert spins
 
-    spinbase = project.find('spinbase')
-    spins = spinbase.findall('spin')
-    for spin in spins:
-        atom = spin.get('atom')
-        if atom == 'C13':
-            positions = spin.findall('pos')
-            for pos in positions:
-                spec = pos.get('spec')
-                shift = float(pos.get('shift'))
-                if spec == '0' or alias==True:
-                    newshift = str(shift+shiftChange)
-                    pos.set('shift',newshift)
-                
+    profiler.switch('transform')
+    shiftSpins(repository,isCarbon,lambda shift: shift+shiftChange,alias)
+
 # Write out the modified xml tree
 
-    tree.write(outfile)
+    repository.write(outfile)
+    profiler.report()
 
 # Execute everything
 main()
@@ -9,20 +9,10 @@ with the indicated tag (-t) by the amount specified (-d).
 
 from optparse import OptionParser # for parsing commandline input
 from sys import stdout # for output to screen instead of to file
-import xml.etree.ElementTree as ET # for parsing XML
+import caraXML as ET # for parsing XML, with lxml if it is installed
 from os.path import exists # for making sure not to overwrite files
-
-### Helper functions ######################################################
-
-def getProject(projectName,projects):
-    """This function, getProject, is only used if the user specifies a project
-    name from the command line, rather than simply allowing the script to
-    select the first (and likely only) project in a repository."""
-    for project in projects:
-        if project.get('name') == projectName:
-            return project
-    # if that doesn't work, raise an error: 
-    raise NameError,"There is no project named \"%s\"."%projectName
+from caraRepository import CaraRepository # for reading and indexing the repository
+from caraProfile import Profiler # for the --profile option
 
 ### Main body of the script ###############################################
 
@@ -61,12 +51,16 @@ def main():
                       help="tag of spins to shift, eg N. Required.")
     parser.add_option("-s", "--spectrum",metavar="SPECID",dest="specID",default=None,type="int",
                       help="ID of spectrum with aliases to shift")
+    parser.add_option("--profile", dest="profile", action="store_true", default=False,
+                      help="Report the time and peak memory of each phase of the run, and the number of elements visited and modified, on stderr.")
+
     # Now parse the command-line options
     (options, args) = parser.parse_args()
 
     infile = options.infile
     outfile = options.outfile
     projectName = options.project
+    profiler = Profiler(options.profile)
     shiftChange = options.shiftChange
     #alias = options.alias
     tagToShift = options.tagToShift
@@ -97,33 +91,15 @@ def main():
         specIDtoShift = 0
         alias = True
 
-    # Now that we have an input file and we know where to send the output, we parse the xml.
-
-    tree = ET.parse(infile)
-    root = tree.getroot() #retrieves the whole repository
-    projects = root.findall('project') #retrieves every project in the repository
-
-# Select a project according to command-line input, defaulting to the first project
-
-    if projectName:
-        project = getProject(projectName,projects)
-        if not project:
-            print 'No project found with name \"%s\".'%projectName
-            return
-    else:
-        project = projects[0]
-        if not project:
-            print 'No project found.'
-            return
-
-# Convert spins
+    # Now that we have an input file and we know where to send the output, we parse the xml,
+    # selecting a project according to command-line input, defaulting to the first project.
 
-    spinbase = project.find('spinbase')
-    spins = spinbase.findall('spin')
+    repository = CaraRepository(infile,projectName,profiler=profiler)
+    profiler.switch('transform')
 
+# Give every spin with the tag an alias in the spectrum, if it has none yet
 
-    
-    for spin in spins:
+    for spin in repository.spins:
         tag = spin.get('tag')
         if tag == tagToShift:
             positions = spin.findall('pos')
@@ -135,17 +111,21 @@ def main():
                     newalias.set(attribute,unalias.get(attribute))
                 newalias.set('spec',specIDtoShift)
                 spin.append(newalias)
-                positions.append(newalias)
-            for pos in positions:
-                spec = pos.get('spec')
-                shift = float(pos.get('shift'))
-                if spec == specIDtoShift or alias==True:
-                    newshift = str(shift+shiftChange)
-                    pos.set('shift',newshift)
+
+# Shift the aliases all at once
+
+    columns = repository.positionColumns
+    if alias == True:
+        numChanged = columns.add(columns.matching(tag=tagToShift),shiftChange)
+    else:
+        numChanged = columns.add(columns.matching(tag=tagToShift,spec=specIDtoShift),shiftChange)
+    columns.writeBack()
+    profiler.count(len(columns),numChanged)
                 
 # Write out the modified xml tree
 
-    tree.write(outfile)
+    repository.write(outfile)
+    profiler.report()
 
 # Execute everything
 main()
@@ -1,18 +1,23 @@
 #!/nmr/programs/python/bin/python2.5
 """
-showSpinLinks.py reads in a CARA repository, and generates a new one in which
+showAllSpinLinks.py reads in a CARA repository, and generates a new one in which
 spinlinks contain only two spinIDs and no other information about visibility
 in particular spectra, etc.
 
-Use showSpinLinks.py -h or showSpinLinks.py --help to learn more about inputs.
+The repository is streamed: it is read and written in a single pass, and
+only the element being read is held in memory, so even the largest
+repositories are reset quickly.
+
+Use showAllSpinLinks.py -h or showAllSpinLinks.py --help to learn more about inputs.
 """
 
 ### Import some libraries #################################################
 
 from optparse import OptionParser # for parsing commandline input
 from sys import stdout # for output to screen instead of to file
-import xml.etree.ElementTree as ET # for parsing XML
 from os.path import exists # for making sure not to overwrite files
+from caraStream import streamResetSpinLinks # for rewriting while reading
+from caraProfile import Profiler # for the --profile option
 
 ### Data Definitions ######################################################
 
@@ -25,18 +30,6 @@ from os.path import exists # for making sure not to overwrite files
 #   <inst spec='176' rate='0.000000' code='0' visi='1'/>
 #   </pair>
 
-### Helper functions ######################################################
-
-def getProject(projectName,projects):
-    """This function, getProject, is only used if the user specifies a project
-    name from the command line, rather than simply allowing the script to
-    select the first (and likely only) project in a repository."""
-    for project in projects:
-        if project.get('name') == projectName:
-            return project
-    # if that doesn't work, raise an error: 
-    raise NameError,"There is no project named \"%s\"."%projectName
-
 ### Main body of the script ###############################################
 
 def main():
@@ -50,6 +43,8 @@ def main():
                       help="name of new CARA repository, defaults to stdout.", metavar="FILE")
     parser.add_option("-p", "--project", metavar="NAME", dest="project", default=None,type="string",
                       help="name of project to alter, if there is more than one project in the repository, defaults to the first project.")
+    parser.add_option("--profile", dest="profile", action="store_true", default=False,
+                      help="Report the time and peak memory of each phase of the run, and the number of elements visited and modified, on stderr.")
 
     # Now parse the command-line options
     (options, args) = parser.parse_args()
@@ -57,6 +52,7 @@ def main():
     infile = options.infile
     outfile = options.outfile
     projectName = options.project
+    profiler = Profiler(options.profile)
 
     if infile == None:
         parser.print_help()
@@ -67,40 +63,18 @@ def main():
     elif exists(outfile):
         print '\nOutput file \'%s\' exists. Choose a new name to avoid overwriting.\n'%outfile
         return
-    # Now that we have an input file and we know where to send the output, we parse the xml.
-
-    tree = ET.parse(infile)
-    root = tree.getroot() #retrieves the whole repository
-    projects = root.findall('project') #retrieves every project in the repository
-
-# Select a project according to command-line input, defaulting to the first project
-
-    if projectName:
-        project = getProject(projectName,projects)
-        if not project:
-            print 'No project found with name \"%s\".'%projectName
-            return
-    else:
-        project = projects[0]
-        if not project:
-            print 'No project found.'
-            return
-
-### Retrieve data from CARA repository ####################################
-
-    spinbase = project.find('spinbase')
-    spinlinks = spinbase.findall('pair')
-
-### Iterate through spinlinks #############################################
-
-    for spinlink in spinlinks:
-        lhs = spinlink.get('lhs')
-        rhs = spinlink.get('rhs')
-        spinlink.clear()
-        spinlink.attrib['lhs'] = lhs
-        spinlink.attrib['rhs'] = rhs
-
-    tree.write(outfile)
+    # Now that we have an input file and we know where to send the output, we stream
+    # the xml, resetting the spinlinks of the project named on the command line,
+    # defaulting to the first project.
+
+    profiler.switch('stream')
+    try:
+        numChanged = streamResetSpinLinks(infile,outfile,projectName)
+    except NameError, e:
+        print '\n%s Try again.\n'%e
+        return
+    profiler.count(numChanged,numChanged)
+    profiler.report()
 
 #    for string in printstrings:
 #        print string